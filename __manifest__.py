@@ -97,7 +97,9 @@ Sécurité et contrôles :
         'data/installment_data.xml',
         'data/activity_email.xml',
         'views/cotisation_payment_proof_view.xml',
+        'views/cotisation_bank_statement_views.xml',
         'views/activity_task_view.xml',
+        'views/cotisation_reminder_schedule_views.xml',
 
         # Cron
         'data/ir_cron_data.xml',
@@ -111,6 +113,7 @@ Sécurité et contrôles :
         'reports/monthly_cotisation_report.xml',
         'reports/dashboard_report.xml',
         'reports/budget_analysis_report.xml',
+        'reports/budget_analysis_fragments.xml',
         'reports/report_installment.xml',
 
         # Wizards
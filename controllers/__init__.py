@@ -1,4 +1,5 @@
 # -*- coding: utf-8 -*-
 
 from . import main
-from . import activity_controller
\ No newline at end of file
+from . import activity_controller
+from . import report_archive
@@ -1893,41 +1893,19 @@ class ActivityRegistrationController(http.Controller):
 
     @http.route('/webhook/payment/mobile_money', type='json', auth='none', csrf=False)
     def mobile_money_webhook(self, **post):
-        """Webhook pour notifications de paiement Mobile Money"""
+        """Webhook pour notifications de paiement Mobile Money.
+
+        La notification est seulement consignée dans la boîte de réception
+        et acquittée; la validation est faite par lots par le cron.
+        """
         
         try:
             # Validation de la signature (à implémenter selon l'opérateur)
             if not self._validate_webhook_signature(post):
                 return {'success': False, 'error': 'Invalid signature'}
             
-            # Traitement de la notification
-            transaction_ref = post.get('transaction_id')
-            amount = float(post.get('amount', 0))
-            status = post.get('status')
-            
-            if status == 'successful' and transaction_ref and amount > 0:
-                # Rechercher la preuve de paiement correspondante
-                proof = request.env['cotisation.payment.proof'].sudo().search([
-                    ('reference', '=', transaction_ref),
-                    ('payment_method', '=', 'mobile_money'),
-                    ('state', 'in', ['submitted', 'under_review'])
-                ], limit=1)
-                
-                if proof and abs(proof.amount - amount) < 0.01:  # Tolérance de 1 centime
-                    # Auto-validation si montant correspond
-                    proof.sudo().write({
-                        'state': 'validated',
-                        'validation_date': fields.Datetime.now(),
-                        'validation_notes': 'Validation automatique via webhook Mobile Money',
-                        'external_reference': post.get('external_ref')
-                    })
-                    
-                    # Mettre à jour la cotisation
-                    proof.cotisation_id.sudo()._update_payment_status()
-                    
-                    return {'success': True, 'message': 'Payment validated'}
-            
-            return {'success': False, 'message': 'Payment not found or invalid'}
+            notification = request.env['cotisation.webhook.inbox'].sudo().receive('mobile_money', post)
+            return {'success': True, 'message': 'Notification queued', 'id': notification.id}
             
         except Exception as e:
             _logger.error(f"Erreur webhook Mobile Money: {e}")
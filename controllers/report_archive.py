@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import os
+
+from odoo import http
+from odoo.http import request, Stream
+from odoo.exceptions import AccessError, MissingError
+
+_logger = logging.getLogger(__name__)
+
+
+class ReportArchiveController(http.Controller):
+    """Téléchargement en flux des archives ZIP des logs de génération"""
+
+    @http.route('/contribution_management/report_log/<int:log_id>/archive',
+                type='http', auth='user')
+    def download_report_archive(self, log_id, **kwargs):
+        """Sert l'archive depuis le disque, sans la charger en mémoire"""
+        try:
+            log = request.env['report.generation.log'].browse(log_id)
+            log.check_access_rights('read')
+            log.check_access_rule('read')
+            if not log.exists() or not log.attachment_ids:
+                return request.not_found()
+
+            archive_path = log._build_zip_archive()
+            stream = Stream(
+                type='path',
+                path=archive_path,
+                mimetype='application/zip',
+                download_name=log._get_archive_filename(),
+                size=os.path.getsize(archive_path),
+                etag=log.archive_fingerprint,
+            )
+            return stream.get_response(as_attachment=True)
+
+        except (AccessError, MissingError):
+            return request.not_found()
+        except Exception as e:
+            _logger.error(f"Erreur lors du téléchargement de l'archive du log {log_id}: {e}", exc_info=True)
+            return request.not_found()
@@ -1,12 +1,26 @@
 # -*- coding: utf-8 -*-
 
 from . import res_partner
+from . import collection_counters
+from . import batch_cron
 from . import group_activity
 from . import member_cotisation
 from . import monthly_cotisation
 from . import cotisations_dashboard_report
 from . import cotisations_dashboard
 from . import report_generation_log
+from . import report_cache
+from . import mail_dispatcher
+from . import activity_analytics
+from . import payment_allocation
+from . import payment_posting
+from . import payment_intake
+from . import payment_webhook_inbox
 from . import member_payment_plan
 from . import member_payment_installment
-from . import cotisation_payment_proof
\ No newline at end of file
+from . import cotisation_payment_proof
+from . import payment_proof_validation
+from . import bank_statement_matching
+from . import temporal_recompute
+from . import group_membership
+from . import reminder_schedule
@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+
+from odoo import models, fields, api
+import logging
+
+_logger = logging.getLogger(__name__)
+
+
+class ActivityAnalyticsEngine(models.AbstractModel):
+    """Moteur d'analyse comparative des activités.
+
+    Les indicateurs financiers sont calculés directement depuis
+    member.cotisation et activity.expense en une seule requête groupée,
+    sans passer par les champs calculés stockés des activités.
+    """
+
+    _name = "activity.analytics.engine"
+    _description = "Moteur d'analyse comparative des activités"
+
+    RANKING_METRICS = (
+        "total_collected",
+        "total_expenses",
+        "net_result",
+        "profitability_rate",
+        "participant_count",
+        "completion_rate",
+    )
+
+    @api.model
+    def compute_metrics(self, activity_ids=None, group_ids=None, date_from=None, date_to=None):
+        """Retourne une ligne d'indicateurs par activité, en une requête.
+
+        Le périmètre est défini par les activités et/ou les groupes, et
+        éventuellement restreint sur la date de début de l'activité.
+        """
+        conditions = []
+        params = []
+        if activity_ids is not None:
+            conditions.append("a.id = ANY(%s)")
+            params.append(list(activity_ids))
+        else:
+            conditions.append("a.active = TRUE")
+        if group_ids is not None:
+            conditions.append("a.group_id = ANY(%s)")
+            params.append(list(group_ids))
+        if date_from:
+            conditions.append("a.date_start >= %s")
+            params.append(date_from)
+        if date_to:
+            conditions.append("a.date_start < %s::date + 1")
+            params.append(date_to)
+
+        # Les conditions sont des constantes internes, seules les valeurs sont paramétrées
+        self.env.cr.execute(
+            f"""
+            WITH scope AS (
+                SELECT a.id, a.name, a.group_id, a.state, a.date_start,
+                       a.cotisation_amount, a.budget_amount
+                FROM group_activity a
+                WHERE {" AND ".join(conditions)}
+            ),
+            cotisations AS (
+                SELECT c.activity_id,
+                       COUNT(*) AS participant_count,
+                       COUNT(*) FILTER (WHERE c.state = 'paid') AS paid_members,
+                       COALESCE(SUM(c.amount_paid), 0) AS total_collected
+                FROM member_cotisation c
+                JOIN scope s ON s.id = c.activity_id
+                WHERE c.active = TRUE
+                GROUP BY c.activity_id
+            ),
+            expenses AS (
+                SELECT e.activity_id, COALESCE(SUM(e.amount), 0) AS total_expenses
+                FROM activity_expense e
+                JOIN scope s ON s.id = e.activity_id
+                WHERE e.state IN ('approved', 'paid')
+                GROUP BY e.activity_id
+            )
+            SELECT s.id, s.name, s.group_id, p.name, s.state, s.date_start,
+                   s.cotisation_amount, COALESCE(s.budget_amount, 0),
+                   COALESCE(c.participant_count, 0), COALESCE(c.paid_members, 0),
+                   COALESCE(c.total_collected, 0), COALESCE(x.total_expenses, 0)
+            FROM scope s
+            LEFT JOIN res_partner p ON p.id = s.group_id
+            LEFT JOIN cotisations c ON c.activity_id = s.id
+            LEFT JOIN expenses x ON x.activity_id = s.id
+            ORDER BY s.date_start DESC, s.id
+            """,
+            params,
+        )
+
+        metrics = []
+        for (activity_id, name, group_id, group_name, state, date_start,
+             cotisation_amount, budget_amount, participant_count, paid_members,
+             total_collected, total_expenses) in self.env.cr.fetchall():
+            total_collected = float(total_collected)
+            total_expenses = float(total_expenses)
+            total_expected = participant_count * float(cotisation_amount or 0)
+            net_result = total_collected - total_expenses
+            metrics.append({
+                "activity_id": activity_id,
+                "name": name,
+                "group_id": group_id,
+                "group_name": group_name or "",
+                "state": state,
+                "date_start": date_start,
+                "year": date_start.year if date_start else False,
+                "month": date_start.month if date_start else False,
+                "budget_amount": float(budget_amount),
+                "participant_count": participant_count,
+                "paid_members": paid_members,
+                "total_collected": total_collected,
+                "total_expected": total_expected,
+                "total_expenses": total_expenses,
+                "net_result": net_result,
+                "profitability_rate": (net_result / total_collected * 100) if total_collected > 0 else 0.0,
+                "completion_rate": (total_collected / total_expected * 100) if total_expected > 0 else 0.0,
+            })
+        return metrics
+
+    @api.model
+    def _empty_rollup(self):
+        """Accumulateur vide pour les cumuls"""
+        return {
+            "activity_count": 0,
+            "participant_count": 0,
+            "total_collected": 0.0,
+            "total_expected": 0.0,
+            "total_expenses": 0.0,
+        }
+
+    @api.model
+    def _finalize_rollup(self, rollup):
+        """Dérive les ratios d'un cumul à partir de ses sommes"""
+        rollup["net_result"] = rollup["total_collected"] - rollup["total_expenses"]
+        rollup["profitability_rate"] = (
+            (rollup["net_result"] / rollup["total_collected"] * 100)
+            if rollup["total_collected"] > 0
+            else 0.0
+        )
+        rollup["completion_rate"] = (
+            (rollup["total_collected"] / rollup["total_expected"] * 100)
+            if rollup["total_expected"] > 0
+            else 0.0
+        )
+        return rollup
+
+    @api.model
+    def rollup(self, metrics, keys=("group_id",)):
+        """Cumule les indicateurs par clé (groupe, année, mois...) en une passe"""
+        rollups = {}
+        totals = self._empty_rollup()
+        for row in metrics:
+            key = tuple(row[k] for k in keys)
+            bucket = rollups.get(key)
+            if bucket is None:
+                bucket = rollups[key] = dict(self._empty_rollup(), **{k: row[k] for k in keys})
+                if "group_id" in keys:
+                    bucket["group_name"] = row["group_name"]
+            for accumulator in (bucket, totals):
+                accumulator["activity_count"] += 1
+                accumulator["participant_count"] += row["participant_count"]
+                accumulator["total_collected"] += row["total_collected"]
+                accumulator["total_expected"] += row["total_expected"]
+                accumulator["total_expenses"] += row["total_expenses"]
+
+        return (
+            [self._finalize_rollup(bucket) for bucket in rollups.values()],
+            self._finalize_rollup(totals),
+        )
+
+    @api.model
+    def rank(self, rows, metric="net_result", reverse=True):
+        """Classe les lignes selon un indicateur et renseigne leur rang"""
+        if metric not in self.RANKING_METRICS:
+            metric = "net_result"
+        ranked = sorted(rows, key=lambda row: row[metric], reverse=reverse)
+        for position, row in enumerate(ranked, start=1):
+            row["rank"] = position
+        return ranked
+
+    @api.model
+    def year_over_year(self, group_ids=None, years=None):
+        """Compare les cumuls annuels de chaque groupe avec l'année précédente"""
+        if years:
+            date_from = fields.Date.to_date(f"{min(years) - 1}-01-01")
+            date_to = fields.Date.to_date(f"{max(years)}-12-31")
+        else:
+            date_from = date_to = None
+
+        metrics = self.compute_metrics(group_ids=group_ids, date_from=date_from, date_to=date_to)
+        rollups, _totals = self.rollup(metrics, keys=("group_id", "year"))
+        by_key = {(r["group_id"], r["year"]): r for r in rollups}
+
+        comparisons = []
+        for rollup in rollups:
+            if years and rollup["year"] not in years:
+                continue
+            previous = by_key.get((rollup["group_id"], rollup["year"] - 1)) if rollup["year"] else None
+            comparison = dict(rollup)
+            for metric in ("total_collected", "total_expenses", "net_result", "participant_count"):
+                previous_value = previous[metric] if previous else 0
+                comparison[f"{metric}_previous"] = previous_value
+                comparison[f"{metric}_variation"] = (
+                    ((rollup[metric] - previous_value) / abs(previous_value) * 100)
+                    if previous_value
+                    else 0.0
+                )
+            comparisons.append(comparison)
+
+        return sorted(comparisons, key=lambda c: (c["group_name"] or "", c["year"] or 0))
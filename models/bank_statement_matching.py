@@ -0,0 +1,674 @@
+# -*- coding: utf-8 -*-
+
+from odoo import models, fields, api
+from odoo.exceptions import UserError
+from datetime import datetime, timedelta
+import base64
+from collections import Counter
+import csv
+import hashlib
+import io
+import logging
+import re
+import unicodedata
+
+_logger = logging.getLogger(__name__)
+
+
+class CotisationBankStatement(models.Model):
+    """Relevé bancaire ou Mobile Money importé pour le rapprochement.
+
+    Le fichier (CSV ou OFX) est découpé en lignes créées en un seul appel.
+    Le rapprochement charge une fois les justificatifs en attente et les
+    cotisations ouvertes concernés, les range en index mémoire (référence,
+    montant en centimes, date) et note les candidats de chaque ligne. Les
+    correspondances sûres avec un justificatif sont validées en lot; les
+    autres restent proposées à la revue.
+    """
+
+    _name = "cotisation.bank.statement"
+    _inherit = ["mail.thread"]
+    _description = "Relevé de rapprochement des paiements"
+    _order = "create_date desc"
+
+    # Barème des correspondances (sur 100)
+    SCORE_REFERENCE = 50
+    SCORE_AMOUNT = 30
+    SCORE_DATE = 10
+    SCORE_NAME = 10
+    SCORE_COTISATION_AMOUNT = 40
+    SCORE_COTISATION_NAME = 40
+    AMBIGUITY_MARGIN = 10
+    SUGGESTION_SCORE = 30
+    # Sans justificatif, le montant seul ne suffit pas: le nom du membre doit figurer sur la ligne
+    COTISATION_MIN_NAME_RATIO = 0.5
+
+    CSV_COLUMNS = {
+        "date": ("date", "date operation", "date_operation", "date valeur", "transaction date", "booking date"),
+        "amount": ("amount", "montant", "credit", "crédit", "montant credit"),
+        "reference": ("reference", "référence", "ref", "transaction id", "transaction_id", "id transaction"),
+        "label": ("label", "libelle", "libellé", "description", "memo", "details", "motif"),
+        "partner_name": ("name", "nom", "payer", "emetteur", "émetteur", "sender", "expediteur", "expéditeur"),
+    }
+    DATE_FORMATS = ("%Y-%m-%d", "%d/%m/%Y", "%d-%m-%Y", "%d/%m/%y", "%Y%m%d", "%d.%m.%Y")
+
+    name = fields.Char(
+        string="Nom",
+        required=True,
+        default=lambda self: f"Relevé du {fields.Date.today().strftime('%d/%m/%Y')}",
+    )
+    source = fields.Selection(
+        [("bank", "Banque"), ("mobile_money", "Mobile Money")],
+        string="Source",
+        default="bank",
+        required=True,
+    )
+    statement_file = fields.Binary(string="Fichier du relevé", attachment=True)
+    statement_filename = fields.Char(string="Nom du fichier")
+    currency_id = fields.Many2one(
+        "res.currency",
+        string="Devise",
+        default=lambda self: self.env.company.currency_id,
+        required=True,
+    )
+    state = fields.Selection(
+        [
+            ("draft", "Brouillon"),
+            ("matched", "Rapproché"),
+            ("done", "Terminé"),
+        ],
+        string="État",
+        default="draft",
+        required=True,
+        tracking=True,
+    )
+
+    auto_validate = fields.Boolean(
+        string="Validation automatique",
+        default=True,
+        help="Valide en lot les justificatifs dont la correspondance est sûre",
+    )
+    auto_validate_score = fields.Integer(
+        string="Score de validation automatique",
+        default=80,
+        help="Score minimal (sur 100) d'une correspondance validée sans revue",
+    )
+    date_window_days = fields.Integer(
+        string="Fenêtre de dates (jours)",
+        default=5,
+        help="Écart maximal entre la date du relevé et la date du justificatif",
+    )
+
+    line_ids = fields.One2many(
+        "cotisation.bank.statement.line", "statement_id", string="Lignes"
+    )
+    line_count = fields.Integer(string="Lignes", compute="_compute_line_stats")
+    matched_count = fields.Integer(string="Rapprochées", compute="_compute_line_stats")
+    suggested_count = fields.Integer(string="Suggestions", compute="_compute_line_stats")
+    validated_count = fields.Integer(string="Validées", compute="_compute_line_stats")
+    unmatched_count = fields.Integer(string="Non rapprochées", compute="_compute_line_stats")
+
+    @api.depends("line_ids.state")
+    def _compute_line_stats(self):
+        """Compteurs par état, en une requête groupée"""
+        counts = {}
+        if self.ids:
+            for group in self.env["cotisation.bank.statement.line"].read_group(
+                [("statement_id", "in", self.ids)],
+                ["statement_id", "state"],
+                ["statement_id", "state"],
+                lazy=False,
+            ):
+                counts[(group["statement_id"][0], group["state"])] = group["__count"]
+        for statement in self:
+            statement_id = statement._origin.id
+            statement.matched_count = counts.get((statement_id, "matched"), 0)
+            statement.suggested_count = counts.get((statement_id, "suggested"), 0)
+            statement.validated_count = counts.get((statement_id, "validated"), 0)
+            statement.unmatched_count = counts.get((statement_id, "unmatched"), 0)
+            statement.line_count = sum(
+                count for (line_statement_id, _state), count in counts.items()
+                if line_statement_id == statement_id
+            )
+
+    # ------------------------------------------------------------------
+    # Lecture des fichiers
+    # ------------------------------------------------------------------
+
+    @api.model
+    def _normalize_text(self, value):
+        """Texte sans accents, en majuscules, réduit aux lettres et chiffres"""
+        value = unicodedata.normalize("NFKD", value or "")
+        value = "".join(char for char in value if not unicodedata.combining(char))
+        return re.sub(r"[^A-Z0-9 ]+", " ", value.upper()).strip()
+
+    @api.model
+    def _normalize_reference(self, value):
+        """Référence comparable: lettres et chiffres uniquement"""
+        return re.sub(r"[^A-Z0-9]", "", (value or "").upper())
+
+    @api.model
+    def _parse_amount(self, value):
+        """Montant d'un relevé (séparateurs de milliers et virgule décimale acceptés)"""
+        value = (value or "").replace("\xa0", "").replace(" ", "").strip()
+        if not value:
+            return 0.0
+        if "," in value and "." in value:
+            # Le dernier séparateur est le séparateur décimal
+            if value.rfind(",") > value.rfind("."):
+                value = value.replace(".", "").replace(",", ".")
+            else:
+                value = value.replace(",", "")
+        else:
+            value = value.replace(",", ".")
+        try:
+            return float(value)
+        except ValueError:
+            return 0.0
+
+    @api.model
+    def _parse_date(self, value):
+        value = (value or "").strip()[:10]
+        for date_format in self.DATE_FORMATS:
+            try:
+                return datetime.strptime(value, date_format).date()
+            except ValueError:
+                continue
+        return False
+
+    @api.model
+    def _decode_file(self, data):
+        raw = base64.b64decode(data)
+        for encoding in ("utf-8-sig", "cp1252", "latin-1"):
+            try:
+                return raw.decode(encoding)
+            except UnicodeDecodeError:
+                continue
+        return raw.decode("latin-1", errors="ignore")
+
+    @api.model
+    def _parse_csv(self, content):
+        """Lignes d'un relevé CSV (séparateur détecté, colonnes reconnues par alias)"""
+        try:
+            dialect = csv.Sniffer().sniff(content[:4096], delimiters=";,\t|")
+        except csv.Error:
+            dialect = csv.excel
+        reader = csv.reader(io.StringIO(content), dialect)
+        header = next(reader, None)
+        if not header:
+            return []
+
+        normalized_header = [self._normalize_text(column).lower() for column in header]
+        positions = {}
+        for key, aliases in self.CSV_COLUMNS.items():
+            normalized_aliases = {self._normalize_text(alias).lower() for alias in aliases}
+            for index, column in enumerate(normalized_header):
+                if column in normalized_aliases:
+                    positions[key] = index
+                    break
+        if "amount" not in positions or "date" not in positions:
+            raise UserError(
+                "Colonnes obligatoires introuvables dans le CSV: une date et un montant sont requis."
+            )
+
+        def cell(row, key):
+            index = positions.get(key)
+            return row[index].strip() if index is not None and index < len(row) else ""
+
+        return [
+            {
+                "date": self._parse_date(cell(row, "date")),
+                "amount": self._parse_amount(cell(row, "amount")),
+                "reference": cell(row, "reference"),
+                "label": cell(row, "label"),
+                "partner_name": cell(row, "partner_name"),
+            }
+            for row in reader
+            if row
+        ]
+
+    @api.model
+    def _parse_ofx(self, content):
+        """Lignes d'un relevé OFX (balises SGML ou XML)"""
+        lines = []
+        for block in re.findall(r"<STMTTRN>(.*?)</STMTTRN>", content, re.S | re.I):
+            tags = {
+                tag.upper(): value.strip()
+                for tag, value in re.findall(r"<(\w+)>([^<\r\n]*)", block)
+            }
+            lines.append({
+                "date": self._parse_date(tags.get("DTPOSTED", "")[:8]),
+                "amount": self._parse_amount(tags.get("TRNAMT")),
+                "reference": tags.get("FITID") or tags.get("REFNUM") or tags.get("CHECKNUM") or "",
+                "label": tags.get("MEMO", ""),
+                "partner_name": tags.get("NAME", ""),
+            })
+        return lines
+
+    def _line_key(self, line):
+        """Identité d'un crédit du relevé: date, montant et référence"""
+        return (
+            fields.Date.to_date(line["date"]),
+            round(line["amount"], 2),
+            self._normalize_reference(line["reference"] or ""),
+        )
+
+    def action_import(self):
+        """Découpe le fichier en lignes (une seule création) puis rapproche"""
+        self.ensure_one()
+        if not self.statement_file:
+            raise UserError("Veuillez joindre un fichier de relevé (CSV ou OFX).")
+
+        content = self._decode_file(self.statement_file)
+        filename = (self.statement_filename or "").lower()
+        if filename.endswith((".ofx", ".qfx")) or "<OFX>" in content[:2048].upper():
+            parsed = self._parse_ofx(content)
+        else:
+            parsed = self._parse_csv(content)
+
+        # Seuls les crédits datés peuvent correspondre à un paiement reçu
+        parsed = [line for line in parsed if line["amount"] > 0 and line["date"]]
+        if not parsed:
+            raise UserError("Aucune ligne de crédit exploitable dans ce relevé.")
+
+        # Réimport: les crédits déjà validés ne sont ni recréés ni rapprochés une seconde fois
+        validated = self.line_ids.filtered(lambda line: line.state == "validated")
+        already_validated = Counter(self._line_key(line) for line in validated)
+        new_lines = []
+        for line in parsed:
+            key = self._line_key(line)
+            if already_validated[key]:
+                already_validated[key] -= 1
+                continue
+            new_lines.append(line)
+
+        (self.line_ids - validated).unlink()
+        next_sequence = max(validated.mapped("sequence"), default=0) + 1
+        self.env["cotisation.bank.statement.line"].create([
+            dict(line, statement_id=self.id, sequence=index)
+            for index, line in enumerate(new_lines, start=next_sequence)
+        ])
+        _logger.info(
+            f"Relevé {self.name}: {len(new_lines)} lignes importées, "
+            f"{len(parsed) - len(new_lines)} déjà validées ignorées"
+        )
+        return self.action_match()
+
+    # ------------------------------------------------------------------
+    # Rapprochement
+    # ------------------------------------------------------------------
+
+    def _load_proof_index(self, lines):
+        """Justificatifs en attente indexés par référence et par montant (centimes)"""
+        window = timedelta(days=self.date_window_days)
+        dates = [line["date"] for line in lines]
+        references = list({line["reference"] for line in lines if line["reference"]})
+        proof_fields = ["reference", "external_reference", "amount", "payment_date", "member_id", "cotisation_id"]
+        Proof = self.env["cotisation.payment.proof"]
+        pending = [("state", "in", ["submitted", "under_review"])]
+
+        # Deux lectures servies par les index: fenêtre de dates et références
+        proofs = {
+            proof["id"]: proof
+            for proof in Proof.search_read(
+                pending + [
+                    ("payment_date", ">=", min(dates) - window),
+                    ("payment_date", "<=", max(dates) + window),
+                ],
+                proof_fields,
+            )
+        }
+        if references:
+            for proof in Proof.search_read(
+                pending + ["|", ("reference", "in", references), ("external_reference", "in", references)],
+                proof_fields,
+            ):
+                proofs.setdefault(proof["id"], proof)
+
+        by_reference = {}
+        by_amount = {}
+        for proof in proofs.values():
+            proof["member_tokens"] = set(self._normalize_text(proof["member_id"] and proof["member_id"][1]).split())
+            for reference in (proof["reference"], proof["external_reference"]):
+                reference = self._normalize_reference(reference)
+                if reference:
+                    by_reference.setdefault(reference, []).append(proof)
+            by_amount.setdefault(round(proof["amount"] * 100), []).append(proof)
+        return by_reference, by_amount
+
+    def _load_cotisation_index(self, amounts):
+        """Cotisations ouvertes indexées par restant dû (centimes)"""
+        # Filtre par montant en base (index sur le restant dû en centimes)
+        columns = self.env["cotisation.allocation.engine"].load_columns(
+            remaining_cents=sorted(set(amounts))
+        )
+        indexes = range(len(columns["ids"]))
+        member_ids = list(set(columns["member_ids"]))
+        member_tokens = {
+            member["id"]: set(self._normalize_text(member["name"]).split())
+            for member in self.env["res.partner"].browse(member_ids).read(["name"])
+        }
+
+        by_amount = {}
+        for index in indexes:
+            by_amount.setdefault(round(columns["remaining"][index] * 100), []).append({
+                "id": columns["ids"][index],
+                "member_id": columns["member_ids"][index],
+                "due_date": columns["due_dates"][index],
+                "member_tokens": member_tokens.get(columns["member_ids"][index], set()),
+            })
+        for candidates in by_amount.values():
+            candidates.sort(key=lambda candidate: candidate["due_date"] or fields.Date.today())
+        return by_amount
+
+    @api.model
+    def _name_ratio(self, line_tokens, member_tokens):
+        """Part des mots du nom du membre présents dans la ligne du relevé"""
+        member_tokens = {token for token in member_tokens if len(token) > 1}
+        if not member_tokens:
+            return 0.0
+        return len(member_tokens & line_tokens) / len(member_tokens)
+
+    def _score_proof(self, line, proof):
+        score = 0.0
+        reference = self._normalize_reference(line["reference"])
+        if reference and reference in (
+            self._normalize_reference(proof["reference"]),
+            self._normalize_reference(proof["external_reference"]),
+        ):
+            score += self.SCORE_REFERENCE
+        if round(line["amount"] * 100) == round(proof["amount"] * 100):
+            score += self.SCORE_AMOUNT
+        gap = abs((line["date"] - proof["payment_date"]).days)
+        if gap <= self.date_window_days:
+            score += self.SCORE_DATE * (1 - gap / (self.date_window_days + 1))
+        score += self.SCORE_NAME * self._name_ratio(line["tokens"], proof["member_tokens"])
+        return min(score, 100.0)
+
+    def _match_lines(self, lines):
+        """Candidats notés de chaque ligne, puis affectation gloutonne par score.
+
+        Retourne {line_id: (état, justificatif, cotisation, membre, score, note)}.
+        """
+        proofs_by_reference, proofs_by_amount = self._load_proof_index(lines)
+        cotisations_by_amount = self._load_cotisation_index(
+            [round(line["amount"] * 100) for line in lines]
+        )
+
+        candidates = []
+        for line in lines:
+            line["tokens"] = set(self._normalize_text(f"{line['partner_name']} {line['label']}").split())
+            cents = round(line["amount"] * 100)
+
+            line_proofs = {}
+            for proof in proofs_by_reference.get(self._normalize_reference(line["reference"]), []):
+                line_proofs[proof["id"]] = proof
+            for bucket in (cents - 1, cents, cents + 1):
+                for proof in proofs_by_amount.get(bucket, []):
+                    line_proofs[proof["id"]] = proof
+            scored = sorted(
+                ((self._score_proof(line, proof), "proof", proof) for proof in line_proofs.values()),
+                key=lambda candidate: -candidate[0],
+            )
+
+            if not scored or scored[0][0] < self.SUGGESTION_SCORE:
+                # Sans justificatif: cotisation ouverte du même restant dû et du même nom
+                for cotisation in cotisations_by_amount.get(cents, []):
+                    ratio = self._name_ratio(line["tokens"], cotisation["member_tokens"])
+                    if ratio >= self.COTISATION_MIN_NAME_RATIO:
+                        scored.append((
+                            self.SCORE_COTISATION_AMOUNT + self.SCORE_COTISATION_NAME * ratio,
+                            "cotisation",
+                            cotisation,
+                        ))
+                scored.sort(key=lambda candidate: -candidate[0])
+
+            runner_up = scored[1][0] if len(scored) > 1 else 0.0
+            for score, kind, target in scored:
+                if score >= self.SUGGESTION_SCORE:
+                    candidates.append((score, score - runner_up, line["id"], kind, target))
+
+        # Chaque justificatif ou cotisation n'est rapproché qu'une fois, au meilleur score
+        candidates.sort(key=lambda candidate: (-candidate[0], candidate[2]))
+        results = {}
+        used = set()
+        for score, margin, line_id, kind, target in candidates:
+            if line_id in results or (kind, target["id"]) in used:
+                continue
+            used.add((kind, target["id"]))
+
+            confident = (
+                kind == "proof"
+                and score >= self.auto_validate_score
+                and margin >= self.AMBIGUITY_MARGIN
+            )
+            if kind == "proof":
+                results[line_id] = (
+                    "matched" if confident else "suggested",
+                    target["id"],
+                    target["cotisation_id"] and target["cotisation_id"][0],
+                    target["member_id"] and target["member_id"][0],
+                    score,
+                    "Justificatif" if confident else "Justificatif à confirmer",
+                )
+            else:
+                results[line_id] = (
+                    "suggested", None, target["id"], target["member_id"], score,
+                    "Cotisation ouverte au même montant",
+                )
+        return results
+
+    def action_match(self):
+        """Rapproche les lignes non validées du relevé"""
+        self.ensure_one()
+        Line = self.env["cotisation.bank.statement.line"]
+        lines = Line.search_read(
+            [("statement_id", "=", self.id), ("state", "in", ["unmatched", "suggested", "matched"])],
+            ["date", "amount", "reference", "label", "partner_name"],
+        )
+        for line in lines:
+            line["reference"] = line["reference"] or ""
+            line["label"] = line["label"] or ""
+            line["partner_name"] = line["partner_name"] or ""
+
+        results = self._match_lines(lines) if lines else {}
+
+        # Résultats écrits en une requête pour tout le relevé
+        line_ids = [line["id"] for line in lines]
+        Line.flush_model()
+        self.env.cr.execute(
+            """
+            UPDATE cotisation_bank_statement_line l
+            SET state = v.state,
+                proof_id = v.proof_id,
+                cotisation_id = v.cotisation_id,
+                member_id = v.member_id,
+                match_score = v.score,
+                match_note = v.note
+            FROM unnest(%s::int[], %s::varchar[], %s::int[], %s::int[], %s::int[], %s::float[], %s::varchar[])
+                AS v(id, state, proof_id, cotisation_id, member_id, score, note)
+            WHERE l.id = v.id
+            """,
+            (
+                line_ids,
+                [results.get(line_id, ("unmatched",))[0] for line_id in line_ids],
+                [results[line_id][1] if line_id in results else None for line_id in line_ids],
+                [results[line_id][2] if line_id in results else None for line_id in line_ids],
+                [results[line_id][3] if line_id in results else None for line_id in line_ids],
+                [results[line_id][4] if line_id in results else 0.0 for line_id in line_ids],
+                [results[line_id][5] if line_id in results else None for line_id in line_ids],
+            ),
+        )
+        Line.browse(line_ids).invalidate_recordset()
+        self.state = "matched"
+
+        matched = Line.browse([line_id for line_id, result in results.items() if result[0] == "matched"])
+        _logger.info(
+            f"Relevé {self.name}: {len(results)} lignes rapprochées sur {len(lines)}, "
+            f"{len(matched)} correspondances sûres"
+        )
+
+        if self.auto_validate and matched:
+            # Validation réservée aux gestionnaires: les autres laissent les lignes rapprochées
+            if self.env.user.has_group("contribution_management.group_cotisation_manager"):
+                return matched._validate_matches()
+            _logger.info(
+                f"Relevé {self.name}: validation automatique non effectuée, "
+                f"{len(matched)} lignes rapprochées en attente d'un gestionnaire"
+            )
+        return True
+
+    def action_validate_matches(self):
+        """Valide les correspondances sûres du relevé.
+
+        Les suggestions se confirment ligne par ligne (action_validate_line).
+        """
+        self.ensure_one()
+        lines = self.line_ids.filtered(lambda line: line.state == "matched")
+        if not lines:
+            raise UserError("Aucune correspondance à valider.")
+        return lines._validate_matches()
+
+    def action_done(self):
+        self.write({"state": "done"})
+
+    def action_reset(self):
+        """Repasse le relevé en brouillon et efface les correspondances non validées"""
+        self.line_ids.filtered(lambda line: line.state != "validated").write({
+            "state": "unmatched",
+            "proof_id": False,
+            "cotisation_id": False,
+            "member_id": False,
+            "match_score": 0.0,
+            "match_note": False,
+        })
+        self.write({"state": "draft"})
+
+
+class CotisationBankStatementLine(models.Model):
+    """Ligne de relevé et sa correspondance proposée"""
+
+    _name = "cotisation.bank.statement.line"
+    _description = "Ligne de relevé de rapprochement"
+    _order = "statement_id, sequence, id"
+
+    statement_id = fields.Many2one(
+        "cotisation.bank.statement",
+        string="Relevé",
+        required=True,
+        ondelete="cascade",
+        index=True,
+    )
+    sequence = fields.Integer(string="N°", default=1)
+    date = fields.Date(string="Date", required=True)
+    amount = fields.Monetary(string="Montant", currency_field="currency_id", required=True)
+    currency_id = fields.Many2one(
+        "res.currency", related="statement_id.currency_id", readonly=True
+    )
+    reference = fields.Char(string="Référence")
+    label = fields.Char(string="Libellé")
+    partner_name = fields.Char(string="Émetteur")
+
+    state = fields.Selection(
+        [
+            ("unmatched", "Non rapprochée"),
+            ("suggested", "Suggestion"),
+            ("matched", "Rapprochée"),
+            ("validated", "Validée"),
+            ("ignored", "Ignorée"),
+        ],
+        string="État",
+        default="unmatched",
+        required=True,
+        index=True,
+    )
+    proof_id = fields.Many2one(
+        "cotisation.payment.proof", string="Justificatif", ondelete="set null"
+    )
+    cotisation_id = fields.Many2one(
+        "member.cotisation", string="Cotisation", ondelete="set null"
+    )
+    member_id = fields.Many2one("res.partner", string="Membre", ondelete="set null")
+    match_score = fields.Float(string="Score", digits=(5, 1))
+    match_note = fields.Char(string="Correspondance")
+
+    def _validate_matches(self):
+        """Valide en lot les correspondances: justificatifs puis cotisations directes"""
+        # Contrôle serveur: la ligne est modifiable par tout utilisateur interne,
+        # la restriction des boutons de la vue ne suffit pas
+        if not self.env.user.has_group("contribution_management.group_cotisation_manager"):
+            raise UserError("Vous n'avez pas les droits pour valider ces rapprochements.")
+
+        # Les correspondances saisies à la main sur une ligne non rapprochée comptent aussi
+        open_lines = self.filtered(lambda line: line.state not in ("validated", "ignored"))
+        proof_lines = open_lines.filtered("proof_id")
+        cotisation_lines = open_lines.filtered(lambda line: not line.proof_id and line.cotisation_id)
+
+        validated = self.browse()
+        skipped_count = 0
+        if proof_lines:
+            result = self.env["cotisation.payment.proof.validation"].validate(
+                proof_lines.proof_id, notes="Validé par rapprochement de relevé"
+            )
+            validated |= proof_lines.filtered(lambda line: line.proof_id in result["validated"])
+            skipped_count += len(result["skipped"])
+
+        if cotisation_lines:
+            validated |= cotisation_lines._post_direct_payments()
+
+        validated.write({"state": "validated"})
+        message = f"{len(validated)} correspondance(s) validée(s)"
+        if skipped_count:
+            message += f", {skipped_count} justificatif(s) écarté(s)"
+        return {
+            "type": "ir.actions.client",
+            "tag": "display_notification",
+            "params": {
+                "title": "Rapprochement",
+                "message": message,
+                "type": "success" if not skipped_count else "warning",
+            },
+        }
+
+    def _post_direct_payments(self):
+        """Enregistre les lignes rapprochées d'une cotisation sans justificatif"""
+        payment_method = "mobile" if self[:1].statement_id.source == "mobile_money" else "bank_transfer"
+        remaining_by_cotisation = {}
+        plan = []
+        posted = self.browse()
+        for line in self:
+            cotisation = line.cotisation_id
+            remaining = remaining_by_cotisation.setdefault(cotisation.id, cotisation.remaining_amount)
+            amount = min(line.amount, remaining)
+            if amount <= 0:
+                continue
+            remaining_by_cotisation[cotisation.id] = remaining - amount
+            posted |= line
+            plan.append({
+                "cotisation_id": cotisation.id,
+                "amount": amount,
+                "values": {
+                    "payment_date": line.date,
+                    "reference": line.reference or f"RELEVE-{line.statement_id.id}-{line.sequence}",
+                    "notes": f"Rapprochement du relevé {line.statement_id.name}",
+                    "currency_id": cotisation.currency_id.id,
+                },
+            })
+
+        if plan:
+            key = hashlib.sha1(",".join(map(str, posted.ids)).encode()).hexdigest()
+            self.env["cotisation.payment.intake"].submit(
+                f"bank_statement:{key}",
+                plan,
+                {"payment_method": payment_method},
+                source="bank_statement",
+                message_subject="Paiement rapproché du relevé",
+            )
+        return posted
+
+    def action_validate_line(self):
+        """Valide les correspondances sélectionnées"""
+        return self._validate_matches()
+
+    def action_ignore(self):
+        self.filtered(lambda line: line.state != "validated").write({"state": "ignored"})
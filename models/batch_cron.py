@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+
+from odoo import models, api
+import logging
+import threading
+import time
+
+_logger = logging.getLogger(__name__)
+
+
+class CotisationBatchCron(models.AbstractModel):
+    """Exécution par lots des crons de transition d'état.
+
+    Un cron de masse (démarrage des activités, fermeture des cotisations
+    expirées...) ne traite plus tous les enregistrements dans une seule
+    transaction: il les prend par lots de taille bornée, valide
+    (commit) chaque lot, s'arrête quand son budget de temps est épuisé
+    et se relance jusqu'à épuisement. Chaque passage journalise ses
+    métriques (traités, ignorés, en échec, durée).
+    """
+
+    _name = "cotisation.batch.cron"
+    _description = "Exécution par lots des crons"
+
+    BATCH_SIZE = 200
+    # Au-delà, le cron se relance au lieu de risquer la limite de temps
+    TIME_BUDGET = 120
+
+    @api.model
+    def _run_batched(self, job, records_model, domain, process, cron_xmlid, batch_size=None, skipped=0):
+        """Traite les enregistrements de domain par lots de batch_size.
+
+        process(records) applique la transition au lot (écritures et
+        messages groupés) et retourne le nombre d'enregistrements
+        ignorés. Un lot en échec est annulé puis rejoué par moitiés
+        jusqu'à isoler les enregistrements fautifs, seuls consignés et
+        écartés du passage. Retourne les métriques du passage.
+        """
+        batch_size = batch_size or self.BATCH_SIZE
+        auto_commit = not getattr(threading.current_thread(), "testing", False)
+        Model = self.env[records_model]
+        started = time.monotonic()
+        metrics = {"processed": 0, "skipped": skipped, "failed": 0, "batches": 0}
+        excluded_ids = []
+        has_more = False
+
+        while True:
+            records = Model.search(domain + [("id", "not in", excluded_ids)], limit=batch_size, order="id")
+            if not records:
+                break
+            if time.monotonic() - started > self.TIME_BUDGET:
+                has_more = True
+                break
+
+            self._process_isolated(job, records, process, metrics, excluded_ids)
+            metrics["batches"] += 1
+            if auto_commit:
+                self.env.cr.commit()
+
+        metrics["duration"] = round(time.monotonic() - started, 3)
+        metrics["has_more"] = has_more
+        self._record_metrics(job, metrics)
+
+        if has_more:
+            cron = self.env.ref(cron_xmlid, False)
+            if cron:
+                cron._trigger()
+        return metrics
+
+    @api.model
+    def _process_isolated(self, job, records, process, metrics, excluded_ids):
+        """Applique process au lot; en cas d'échec, rejoue chaque moitié.
+
+        Chaque tentative a son propre savepoint: seuls les enregistrements
+        qui échouent encore seuls sont comptés en échec et ajoutés à
+        excluded_ids, le reste du lot est traité normalement.
+        """
+        try:
+            with self.env.cr.savepoint():
+                batch_skipped = process(records) or 0
+            metrics["processed"] += len(records) - batch_skipped
+            metrics["skipped"] += batch_skipped
+            return
+        except Exception as e:
+            self.env.invalidate_all()
+            if len(records) == 1:
+                _logger.error(f"Cron {job}: échec de l'enregistrement {records.id}: {e}", exc_info=True)
+                metrics["failed"] += 1
+                excluded_ids.append(records.id)
+                return
+            _logger.warning(f"Cron {job}: échec du lot {records.ids[:20]}, rejeu par moitiés: {e}")
+
+        middle = len(records) // 2
+        self._process_isolated(job, records[:middle], process, metrics, excluded_ids)
+        self._process_isolated(job, records[middle:], process, metrics, excluded_ids)
+
+    @api.model
+    def _record_metrics(self, job, metrics):
+        """Journalise les métriques du passage.
+
+        Pas de paramètre système: set_param invalide le cache du registre
+        sur tous les workers à chaque passage.
+        """
+        _logger.info(
+            f"Cron {job}: {metrics['processed']} traités, {metrics['skipped']} ignorés, "
+            f"{metrics['failed']} en échec, {metrics['batches']} lots en {metrics['duration']}s"
+            + (" (relancé)" if metrics["has_more"] else "")
+        )
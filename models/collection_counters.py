@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+
+from odoo import models, api
+import logging
+
+_logger = logging.getLogger(__name__)
+
+
+class CotisationCollectionCounters(models.AbstractModel):
+    """Compteurs de collecte tenus à jour par variations.
+
+    Les statistiques d'une cotisation mensuelle ou d'une activité (membres,
+    payés, partiels, en retard, total collecté) ne sont plus recalculées en
+    relisant toutes ses cotisations: chaque création, modification ou
+    suppression d'une cotisation de membre applique sa variation par un
+    seul UPDATE. Les champs dérivés (non payés, attendu, taux) sont
+    recalculés dans la même requête. Un cron compare périodiquement les
+    compteurs à un agrégat complet et corrige les écarts.
+    """
+
+    _name = "cotisation.collection.counters"
+    _description = "Compteurs de collecte des cotisations"
+
+    # Champ de member.cotisation pointant vers le modèle, et champ du montant unitaire
+    _counter_link_field = None
+    _counter_amount_field = "amount"
+
+    COUNTER_FIELDS = [
+        "total_members",
+        "paid_members",
+        "unpaid_members",
+        "partial_members",
+        "overdue_members",
+        "total_collected",
+        "total_expected",
+        "completion_rate",
+    ]
+
+    def _counter_update_query(self):
+        """UPDATE appliquant des variations (membres, payés, partiels, retard, collecté)"""
+        # Table et colonne sont des constantes du modèle, seules les valeurs sont paramétrées
+        amount = f"COALESCE(t.{self._counter_amount_field}, 0)"
+        return f"""
+            WITH d AS (
+                SELECT v.id,
+                       COALESCE(t.total_members, 0) + v.members AS members,
+                       COALESCE(t.paid_members, 0) + v.paid AS paid,
+                       COALESCE(t.partial_members, 0) + v.partial AS partial,
+                       COALESCE(t.overdue_members, 0) + v.overdue AS overdue,
+                       COALESCE(t.total_collected, 0) + v.collected AS collected,
+                       (COALESCE(t.total_members, 0) + v.members) * {amount} AS expected
+                FROM unnest(%s::int[], %s::int[], %s::int[], %s::int[], %s::int[], %s::numeric[])
+                    AS v(id, members, paid, partial, overdue, collected)
+                JOIN {self._table} t ON t.id = v.id
+            )
+            UPDATE {self._table} t
+            SET total_members = d.members,
+                paid_members = d.paid,
+                partial_members = d.partial,
+                overdue_members = d.overdue,
+                unpaid_members = d.members - d.paid - d.partial,
+                total_collected = d.collected,
+                total_expected = d.expected,
+                completion_rate = CASE WHEN d.expected > 0 THEN d.collected / d.expected * 100 ELSE 0 END
+            FROM d
+            WHERE t.id = d.id
+        """
+
+    def _execute_counter_update(self, deltas):
+        """Exécute l'UPDATE des compteurs et signale le changement à l'ORM"""
+        ids = list(deltas)
+        members, paid, partial, overdue, collected = (
+            list(column) for column in zip(*(deltas[record_id] for record_id in ids))
+        )
+        self.env.cr.execute(
+            self._counter_update_query(), (ids, members, paid, partial, overdue, collected)
+        )
+        records = self.browse(ids)
+        records.invalidate_recordset(self.COUNTER_FIELDS, flush=False)
+        # Champs calculés dépendant des compteurs (ex. analyse financière)
+        records.modified(self.COUNTER_FIELDS)
+
+    @api.model
+    def _apply_counter_deltas(self, deltas, reset=False):
+        """Applique des variations de compteurs en une requête.
+
+        deltas: {id: [membres, payés, partiels, en retard, collecté]}.
+        reset=True: les compteurs sont d'abord remis à zéro, les valeurs
+        deviennent donc absolues (réconciliation).
+        """
+        deltas = {
+            record_id: values
+            for record_id, values in deltas.items()
+            if record_id and (reset or any(values))
+        }
+        if not deltas:
+            return
+
+        if reset:
+            self.env.cr.execute(
+                f"""
+                UPDATE {self._table}
+                SET total_members = 0, paid_members = 0, partial_members = 0,
+                    overdue_members = 0, total_collected = 0
+                WHERE id IN %s
+                """,
+                (tuple(deltas),),
+            )
+        self._execute_counter_update(deltas)
+
+    def _refresh_counter_ratios(self):
+        """Recalcule attendu et taux après un changement de montant unitaire"""
+        if not self.ids:
+            return
+        self.flush_recordset([self._counter_amount_field])
+        self._execute_counter_update({record_id: [0, 0, 0, 0, 0.0] for record_id in self.ids})
+
+    def _counter_aggregates(self):
+        """Agrégat complet des cotisations actives, par enregistrement"""
+        self.env["member.cotisation"].flush_model(
+            [self._counter_link_field, "active", "state", "amount_paid"]
+        )
+        self.env.cr.execute(
+            f"""
+            SELECT {self._counter_link_field},
+                   COUNT(*),
+                   COUNT(*) FILTER (WHERE state = 'paid'),
+                   COUNT(*) FILTER (WHERE state = 'partial'),
+                   COUNT(*) FILTER (WHERE state = 'overdue'),
+                   COALESCE(SUM(amount_paid), 0)
+            FROM member_cotisation
+            WHERE active = TRUE AND {self._counter_link_field} IN %s
+            GROUP BY {self._counter_link_field}
+            """,
+            (tuple(self.ids),),
+        )
+        aggregates = {record_id: [0, 0, 0, 0, 0.0] for record_id in self.ids}
+        for row in self.env.cr.fetchall():
+            aggregates[row[0]] = [row[1], row[2], row[3], row[4], float(row[5])]
+        return aggregates
+
+    def _recompute_counters(self):
+        """Remet les compteurs à la valeur de l'agrégat complet"""
+        if not self.ids:
+            return
+        self._apply_counter_deltas(self._counter_aggregates(), reset=True)
+
+    def write(self, vals):
+        result = super().write(vals)
+        if self._counter_amount_field in vals:
+            self._refresh_counter_ratios()
+        return result
+
+    @api.model
+    def _cron_reconcile_counters(self):
+        """Cron: vérifie les compteurs contre un agrégat complet et corrige les écarts"""
+        records = self.with_context(active_test=False).search([])
+        if not records:
+            return True
+
+        records.flush_recordset(self.COUNTER_FIELDS)
+        self.env.cr.execute(
+            f"""
+            SELECT id, COALESCE(total_members, 0), COALESCE(paid_members, 0),
+                   COALESCE(partial_members, 0), COALESCE(overdue_members, 0),
+                   COALESCE(total_collected, 0)
+            FROM {self._table}
+            """
+        )
+        stored = {row[0]: [row[1], row[2], row[3], row[4], float(row[5])] for row in self.env.cr.fetchall()}
+        aggregates = records._counter_aggregates()
+
+        drifted = {
+            record_id: values
+            for record_id, values in aggregates.items()
+            if values[:4] != stored.get(record_id, [])[:4]
+            or abs(values[4] - stored.get(record_id, [0] * 5)[4]) >= 0.005
+        }
+        if drifted:
+            self._apply_counter_deltas(drifted, reset=True)
+            _logger.warning(
+                f"Compteurs {self._name}: {len(drifted)} enregistrements corrigés "
+                f"sur {len(records)} (ids {sorted(drifted)[:20]})"
+            )
+        else:
+            _logger.info(f"Compteurs {self._name}: {len(records)} enregistrements vérifiés, aucun écart")
+        return True
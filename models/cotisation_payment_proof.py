@@ -2,6 +2,8 @@
 
 from odoo import models, fields, api
 from odoo.exceptions import ValidationError, UserError
+from odoo.tools import create_index
+from datetime import timedelta
 import base64
 import mimetypes
 import logging
@@ -72,6 +74,11 @@ class CotisationPaymentProof(models.Model):
         tracking=True
     )
     
+    external_reference = fields.Char(
+        string="Référence opérateur",
+        help="Référence transmise par l'opérateur lors de la confirmation du paiement"
+    )
+    
     payment_date = fields.Date(
         string="Date de paiement",
         required=True,
@@ -170,6 +177,27 @@ class CotisationPaymentProof(models.Model):
         compute="_compute_file_info"
     )
 
+    def init(self):
+        """Index de rapprochement (notifications opérateur et relevés importés)"""
+        create_index(
+            self.env.cr,
+            'cotisation_payment_proof_reference_method_index',
+            self._table,
+            ['reference', 'payment_method'],
+        )
+        create_index(
+            self.env.cr,
+            'cotisation_payment_proof_external_reference_index',
+            self._table,
+            ['external_reference'],
+        )
+        create_index(
+            self.env.cr,
+            'cotisation_payment_proof_state_payment_date_index',
+            self._table,
+            ['state', 'payment_date'],
+        )
+
     @api.depends('cotisation_id', 'member_id', 'amount', 'payment_date')
     def _compute_display_name(self):
         """Calcule le nom d'affichage"""
@@ -203,16 +231,34 @@ class CotisationPaymentProof(models.Model):
 
     @api.depends()
     def _compute_user_permissions(self):
-        """Calcule les permissions utilisateur"""
+        """Calcule les permissions utilisateur (un seul contrôle de groupe pour le lot)"""
+        can_validate = self.env.user.has_group('contribution_management.group_cotisation_manager')
         for record in self:
-            user = self.env.user
-            record.can_validate = user.has_group('contribution_management.group_cotisation_manager')
+            record.can_validate = can_validate
+
+    def _get_proof_file_sizes(self):
+        """Tailles des fichiers lues sur les pièces jointes, en une requête"""
+        record_ids = [record_id for record_id in self.ids if isinstance(record_id, int)]
+        if not record_ids:
+            return {}
+        attachments = self.env['ir.attachment'].sudo().search_read(
+            [
+                ('res_model', '=', self._name),
+                ('res_field', '=', 'proof_file'),
+                ('res_id', 'in', record_ids),
+            ],
+            ['res_id', 'file_size'],
+        )
+        return {attachment['res_id']: attachment['file_size'] for attachment in attachments}
 
     @api.depends('proof_file')
     def _compute_file_info(self):
         """Calcule les informations du fichier"""
+        sizes = self._get_proof_file_sizes()
         for record in self:
-            if record.proof_file:
+            if record.id in sizes:
+                record.file_size = sizes[record.id]
+            elif record.proof_file:
                 try:
                     file_content = base64.b64decode(record.proof_file)
                     record.file_size = len(file_content)
@@ -305,78 +351,31 @@ class CotisationPaymentProof(models.Model):
         )
 
     def action_validate(self):
-        """Valide le justificatif et enregistre le paiement"""
-        self.ensure_one()
-        
-        if self.state not in ['submitted', 'under_review']:
-            raise UserError("Ce justificatif ne peut pas être validé dans son état actuel.")
-        
-        if not self.can_validate:
-            raise UserError("Vous n'avez pas les droits pour valider ce justificatif.")
-        
-        # Vérifier que la cotisation peut encore recevoir un paiement
-        cotisation = self.cotisation_id
-        if cotisation.state in ['paid', 'cancelled']:
-            raise UserError("Cette cotisation ne peut plus recevoir de paiement.")
-        
-        try:
-            # Enregistrer le paiement via le wizard
-            payment_wizard = self.env['cotisation.payment.wizard'].create({
-                'cotisation_id': cotisation.id,
-                'amount': self.amount,
-                'payment_method': self.payment_method,
-                'reference': self.reference or f"PROOF-{self.id}",
-                'payment_date': self.payment_date,
-                'notes': f"Paiement validé via justificatif #{self.id}",
-                'mark_as_full_payment': self.amount >= cotisation.remaining_amount,
-                'send_receipt': True
-            })
-            
-            # Confirmer le paiement
-            payment_result = payment_wizard.action_confirm_payment()
-            
-            # Marquer le justificatif comme validé
-            self.write({
-                'state': 'validated',
-                'validation_date': fields.Datetime.now(),
-                'validator_id': self.env.user.id,
-                'validation_notes': 'Justificatif validé et paiement enregistré automatiquement'
-            })
-            
-            # Nettoyer le wizard temporaire
-            payment_wizard.unlink()
-            
-            # Message de suivi
-            self.message_post(
-                body=f"Justificatif validé et paiement de {self.amount} {self.currency_id.symbol} "
-                     f"enregistré par {self.env.user.name}",
-                message_type='comment'
-            )
-            
-            # Notifier le membre
-            self._notify_member_validation()
-            
-            _logger.info(f"Justificatif {self.display_name} validé et paiement enregistré")
-            
-            return {
-                'type': 'ir.actions.client',
-                'tag': 'display_notification',
-                'params': {
-                    'title': 'Succès',
-                    'message': f'Justificatif validé et paiement de {self.amount} enregistré',
-                    'type': 'success',
-                }
+        """Valide les justificatifs sélectionnés et enregistre les paiements en un lot"""
+        result = self.env['cotisation.payment.proof.validation'].validate(self)
+        validated, skipped = result['validated'], result['skipped']
+
+        # Un justificatif seul garde le comportement d'erreur explicite
+        if len(self) == 1 and skipped:
+            raise UserError(skipped[self.id])
+
+        message = f"{len(validated)} justificatif(s) validé(s), {result['total']:.2f} enregistré(s)"
+        if skipped:
+            message += f" - {len(skipped)} écarté(s)"
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'title': 'Succès' if not skipped else 'Validation partielle',
+                'message': message,
+                'type': 'success' if not skipped else 'warning',
             }
-            
-        except Exception as e:
-            _logger.error(f"Erreur lors de la validation du justificatif {self.id}: {e}")
-            raise UserError(f"Erreur lors de la validation: {str(e)}")
+        }
 
     def action_reject(self):
-        """Ouvre l'assistant de rejet"""
-        self.ensure_one()
-        
-        if self.state not in ['submitted', 'under_review']:
+        """Ouvre l'assistant de rejet pour les justificatifs sélectionnés"""
+        pending = self.filtered(lambda p: p.state in ['submitted', 'under_review'])
+        if not pending:
             raise UserError("Ce justificatif ne peut pas être rejeté dans son état actuel.")
         
         return {
@@ -386,29 +385,13 @@ class CotisationPaymentProof(models.Model):
             'view_mode': 'form',
             'target': 'new',
             'context': {
-                'default_proof_id': self.id
+                'default_proof_ids': [(6, 0, pending.ids)]
             }
         }
 
-    def do_reject(self, reason, notes):
-        """Effectue le rejet du justificatif"""
-        self.write({
-            'state': 'rejected',
-            'rejection_date': fields.Datetime.now(),
-            'validator_id': self.env.user.id,
-            'rejection_reason': reason,
-            'validation_notes': notes
-        })
-        
-        self.message_post(
-            body=f"Justificatif rejeté par {self.env.user.name}. Raison: {dict(self._fields['rejection_reason'].selection)[reason]}",
-            message_type='comment'
-        )
-        
-        # Notifier le membre du rejet
-        self._notify_member_rejection()
-        
-        _logger.info(f"Justificatif {self.display_name} rejeté")
+    def do_reject(self, reason, notes, notify=True):
+        """Effectue le rejet des justificatifs"""
+        return self.env['cotisation.payment.proof.validation'].reject(self, reason, notes, notify=notify)
 
     def action_download_proof(self):
         """Télécharge le fichier justificatif"""
@@ -436,22 +419,24 @@ class CotisationPaymentProof(models.Model):
         }
 
     def _notify_member_validation(self):
-        """Notifie le membre de la validation"""
+        """Notifie les membres de la validation (un seul rendu pour tout le lot)"""
         try:
             template = self.env.ref('contribution_management.email_template_payment_validated', 
                                    raise_if_not_found=False)
-            if template and self.member_id.email:
-                template.send_mail(self.id, force_send=True)
+            proofs = self.filtered(lambda p: p.member_id.email)
+            if template and proofs:
+                self.env['cotisation.mail.dispatcher'].enqueue_template(template, proofs.ids)
         except Exception as e:
             _logger.error(f"Erreur notification validation: {e}")
 
     def _notify_member_rejection(self):
-        """Notifie le membre du rejet"""
+        """Notifie les membres du rejet (un seul rendu pour tout le lot)"""
         try:
             template = self.env.ref('contribution_management.email_template_payment_rejected', 
                                    raise_if_not_found=False)
-            if template and self.member_id.email:
-                template.send_mail(self.id, force_send=True)
+            proofs = self.filtered(lambda p: p.member_id.email)
+            if template and proofs:
+                self.env['cotisation.mail.dispatcher'].enqueue_template(template, proofs.ids)
         except Exception as e:
             _logger.error(f"Erreur notification rejet: {e}")
 
@@ -465,31 +450,38 @@ class CotisationPaymentProof(models.Model):
     @api.model
     def _cron_notify_pending_validations(self):
         """Cron pour notifier les validations en attente"""
-        overdue_proofs = self.search([
+        # Filtre sur la date de soumission: servi par l'index d'état, sans
+        # dépendre d'un champ stocké qui vieillit entre deux recalculs
+        domain = [
             ('state', 'in', ['submitted', 'under_review']),
-            ('is_overdue_validation', '=', True)
+            ('submitted_date', '<', fields.Datetime.now() - timedelta(days=3)),
+        ]
+        overdue_count = self.search_count(domain)
+        if not overdue_count:
+            return True
+
+        oldest_proof = self.search(domain, order='submitted_date, id', limit=1)
+        admin_users = self.env['res.users'].search([
+            ('groups_id', 'in', self.env.ref('contribution_management.group_cotisation_manager').id)
         ])
-        
-        if overdue_proofs:
-            # Notifier les administrateurs
-            admin_users = self.env['res.users'].search([
-                ('groups_id', 'in', self.env.ref('contribution_management.group_cotisation_manager').id)
+
+        # Une activité par administrateur, créées en une fois
+        try:
+            self.env['mail.activity'].create([
+                {
+                    'activity_type_id': self.env.ref('mail.mail_activity_data_todo').id,
+                    'summary': f'{overdue_count} justificatifs en attente de validation',
+                    'note': f'Il y a {overdue_count} justificatifs de paiement en attente '
+                           f'de validation depuis plus de 3 jours.',
+                    'res_model_id': self.env['ir.model']._get('cotisation.payment.proof').id,
+                    'res_id': oldest_proof.id,
+                    'user_id': admin.id,
+                    'date_deadline': fields.Date.today()
+                }
+                for admin in admin_users
             ])
-            
-            for admin in admin_users:
-                try:
-                    self.env['mail.activity'].create({
-                        'activity_type_id': self.env.ref('mail.mail_activity_data_todo').id,
-                        'summary': f'{len(overdue_proofs)} justificatifs en attente de validation',
-                        'note': f'Il y a {len(overdue_proofs)} justificatifs de paiement en attente '
-                               f'de validation depuis plus de 3 jours.',
-                        'res_model_id': self.env['ir.model']._get('cotisation.payment.proof').id,
-                        'res_id': overdue_proofs[0].id,
-                        'user_id': admin.id,
-                        'date_deadline': fields.Date.today()
-                    })
-                except Exception as e:
-                    _logger.error(f"Erreur création activité admin {admin.name}: {e}")
+        except Exception as e:
+            _logger.error(f"Erreur création activités administrateurs: {e}")
 
         return True
 
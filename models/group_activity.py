@@ -2,6 +2,7 @@
 
 from odoo import models, fields, api
 from odoo.exceptions import ValidationError, UserError
+from collections import defaultdict, deque
 import logging
 from datetime import datetime, timedelta
 
@@ -11,10 +12,12 @@ _logger = logging.getLogger(__name__)
 class GroupActivity(models.Model):
     """Modèle pour gérer les activités des groupes"""
     _name = "group.activity"
-    _inherit = ['mail.thread', 'mail.activity.mixin']
+    _inherit = ['mail.thread', 'mail.activity.mixin', 'cotisation.collection.counters']
     _description = "Activité de groupe"
     _order = "date_start desc, create_date desc"
     _check_company_auto = True
+    _counter_link_field = "activity_id"
+    _counter_amount_field = "cotisation_amount"
 
     name = fields.Char(string="Nom de l'activité", required=True, index=True, tracking=True)
     description = fields.Html(string="Description")
@@ -260,48 +263,48 @@ class GroupActivity(models.Model):
         store=True
     )
     
-    # Statistiques
+    # Statistiques (compteurs tenus par cotisation.collection.counters)
     total_members = fields.Integer(
         string="Nombre total de membres",
-        compute="_compute_cotisation_stats",
-        store=True
+        readonly=True,
+        default=0
     )
     paid_members = fields.Integer(
         string="Membres ayant payé",
-        compute="_compute_cotisation_stats",
-        store=True
+        readonly=True,
+        default=0
     )
     unpaid_members = fields.Integer(
         string="Membres n'ayant pas payé",
-        compute="_compute_cotisation_stats",
-        store=True
+        readonly=True,
+        default=0
     )
     partial_members = fields.Integer(
         string="Membres en paiement partiel",
-        compute="_compute_cotisation_stats",
-        store=True
+        readonly=True,
+        default=0
     )
     overdue_members = fields.Integer(
         string="Membres en retard",
-        compute="_compute_cotisation_stats",
-        store=True
+        readonly=True,
+        default=0
     )
     total_collected = fields.Monetary(
         string="Total collecté",
-        compute="_compute_cotisation_stats",
-        store=True,
+        readonly=True,
+        default=0,
         currency_field='currency_id'
     )
     total_expected = fields.Monetary(
         string="Total attendu",
-        compute="_compute_cotisation_stats",
-        store=True,
+        readonly=True,
+        default=0,
         currency_field='currency_id'
     )
     completion_rate = fields.Float(
         string="Taux de completion (%)",
-        compute="_compute_cotisation_stats",
-        store=True
+        readonly=True,
+        default=0
     )
     
     # Champs de suivi
@@ -420,24 +423,6 @@ class GroupActivity(models.Model):
             else:
                 activity.has_minimum_participants = True
     
-    @api.depends('cotisation_ids', 'cotisation_ids.amount_paid', 'cotisation_ids.state', 'cotisation_amount')
-    def _compute_cotisation_stats(self):
-        """Calcule les statistiques de cotisation"""
-        for activity in self:
-            cotisations = activity.cotisation_ids.filtered('active')
-            activity.total_members = len(cotisations)
-            activity.paid_members = len(cotisations.filtered(lambda c: c.state == 'paid'))
-            activity.partial_members = len(cotisations.filtered(lambda c: c.state == 'partial'))
-            activity.overdue_members = len(cotisations.filtered(lambda c: c.state == 'overdue'))
-            activity.unpaid_members = activity.total_members - activity.paid_members - activity.partial_members
-            activity.total_collected = sum(cotisations.mapped('amount_paid'))
-            activity.total_expected = activity.total_members * activity.cotisation_amount
-            
-            if activity.total_expected > 0:
-                activity.completion_rate = (activity.total_collected / activity.total_expected) * 100
-            else:
-                activity.completion_rate = 0.0
-    
     # === NOUVELLES CONTRAINTES ===
     
     @api.constrains('main_organizer_id', 'organizer_ids')
@@ -1193,46 +1178,9 @@ class GroupActivity(models.Model):
         """Force la remise en brouillon même avec des tâches commencées"""
         return self.with_context(force_reset=True).action_reset_to_draft()
     
-    def _get_group_members(self):
-        """Retourne tous les membres du groupe selon son type d'organisation"""
-        group = self.group_id
-        members = self.env['res.partner']
-        
-        if not group:
-            return members
-        
-        try:
-            if hasattr(group, 'organization_type'):
-                if group.organization_type == 'group':
-                    members = self.env['res.partner'].search([
-                        ('is_company', '=', False),
-                        ('group_id', '=', group.id),
-                        ('active', '=', True)
-                    ])
-                elif hasattr(group, f'{group.organization_type}_members'):
-                    members = getattr(group, f'{group.organization_type}_members')
-                else:
-                    members = self.env['res.partner'].search([
-                        ('is_company', '=', False),
-                        ('parent_id', '=', group.id),
-                        ('active', '=', True)
-                    ])
-            else:
-                members = self.env['res.partner'].search([
-                    ('is_company', '=', False),
-                    ('parent_id', '=', group.id),
-                    ('active', '=', True)
-                ])
-                
-        except Exception as e:
-            _logger.error(f"Erreur lors de la récupération des membres pour {group.name}: {e}")
-            members = self.env['res.partner'].search([
-                ('is_company', '=', False),
-                ('parent_id', '=', group.id),
-                ('active', '=', True)
-            ])
-        
-        return members.filtered(lambda m: not m.is_company and m.active)
+    def _get_group_members(self, at_date=None):
+        """Retourne les membres du groupe (index des appartenances), actuels ou à une date"""
+        return self.group_id._get_group_members(at_date=at_date)
     
     def action_view_cotisations(self):
         """Action pour voir les cotisations de cette activité"""
@@ -1393,46 +1341,42 @@ class GroupActivity(models.Model):
     
     @api.model
     def _cron_update_activity_states(self):
-        """Cron pour mettre à jour automatiquement les statuts des activités"""
+        """Cron pour mettre à jour automatiquement les statuts des activités, par lots"""
+        BatchCron = self.env['cotisation.batch.cron']
+        cron_xmlid = 'contribution_management.cron_update_activity_states'
         now = fields.Datetime.now()
         
-        confirmed_activities = self.search([
-            ('state', '=', 'confirmed'),
-            ('date_start', '<=', now)
-        ])
-        
-        for activity in confirmed_activities:
-            try:
-                if activity.min_participants > 0 and not activity.has_minimum_participants:
-                    _logger.warning(
-                        f"Activité {activity.name} non démarrée: minimum de participants non atteint "
-                        f"({activity.participant_count}/{activity.min_participants})"
-                    )
-                else:
-                    activity.write({'state': 'ongoing'})
-            except Exception as e:
-                _logger.error(f"Erreur lors du démarrage automatique de {activity.name}: {e}")
-        
-        ongoing_activities = self.search([
-            ('state', '=', 'ongoing'),
-            ('date_end', '<=', now),
-            ('date_end', '!=', False)
-        ])
+        # Démarrage: les activités sous le minimum de participants restent confirmées
+        due_to_start = [('state', '=', 'confirmed'), ('date_start', '<=', now)]
+        below_minimum = self.search(due_to_start + [('has_minimum_participants', '=', False)])
+        if below_minimum:
+            _logger.warning(
+                f"{len(below_minimum)} activités non démarrées: minimum de participants non atteint "
+                f"({', '.join(below_minimum[:20].mapped('name'))})"
+            )
         
-        for activity in ongoing_activities:
-            try:
-                activity.write({
-                    'state': 'completed',
-                    'completion_date': now
-                })
-            except Exception as e:
-                _logger.error(f"Erreur lors de la completion automatique de {activity.name}: {e}")
+        def start(activities):
+            activities.write({'state': 'ongoing'})
         
-        started_count = len(confirmed_activities.filtered(lambda a: a.state == 'ongoing'))
-        completed_count = len(ongoing_activities)
+        BatchCron._run_batched(
+            'group_activity_start',
+            self._name,
+            due_to_start + [('has_minimum_participants', '=', True)],
+            start,
+            cron_xmlid,
+            skipped=len(below_minimum),
+        )
         
-        _logger.info(f"Mise à jour automatique: {started_count} activités démarrées, {completed_count} activités terminées")
+        def complete(activities):
+            activities.write({'state': 'completed', 'completion_date': now})
         
+        BatchCron._run_batched(
+            'group_activity_complete',
+            self._name,
+            [('state', '=', 'ongoing'), ('date_end', '!=', False), ('date_end', '<=', now)],
+            complete,
+            cron_xmlid,
+        )
         return True
     
     @api.model
@@ -1985,6 +1929,25 @@ class ActivityTask(models.Model):
         store=True
     )
     
+    # Chemin critique (durées restantes en heures, depuis le début de l'organisation)
+    earliest_start_hours = fields.Float(
+        string="Début au plus tôt (heures)",
+        compute="_compute_dependencies_status",
+        store=True,
+        help="Heures de travail restantes sur les tâches prérequises avant de pouvoir démarrer"
+    )
+    slack_hours = fields.Float(
+        string="Marge (heures)",
+        compute="_compute_dependencies_status",
+        store=True,
+        help="Retard possible sans repousser la fin de l'organisation de l'activité"
+    )
+    is_critical = fields.Boolean(
+        string="Sur le chemin critique",
+        compute="_compute_dependencies_status",
+        store=True
+    )
+    
     # Champs de référence pour faciliter la recherche
     activity_name = fields.Char(related='activity_id.name', string="Nom de l'activité", store=True)
     activity_date = fields.Datetime(related='activity_id.date_start', string="Date de l'activité", store=True)
@@ -2008,35 +1971,135 @@ class ActivityTask(models.Model):
                 task.state in ['todo', 'in_progress']
             )
     
-    @api.depends('depends_on_task_ids', 'depends_on_task_ids.state')
+    @api.model
+    def _topological_order(self, dependencies):
+        """Ordre topologique (Kahn, linéaire) du graphe {tâche: [prérequis]}.
+        
+        Retourne None si le graphe contient un cycle.
+        """
+        indegree = dict.fromkeys(dependencies, 0)
+        successors = defaultdict(list)
+        for node, prerequisites in dependencies.items():
+            for prerequisite in prerequisites:
+                indegree.setdefault(prerequisite, 0)
+                successors[prerequisite].append(node)
+                indegree[node] += 1
+        
+        queue = deque(node for node, degree in indegree.items() if degree == 0)
+        order = []
+        while queue:
+            node = queue.popleft()
+            order.append(node)
+            for successor in successors[node]:
+                indegree[successor] -= 1
+                if not indegree[successor]:
+                    queue.append(successor)
+        return order if len(order) == len(indegree) else None
+    
+    def _load_dependency_graph(self):
+        """Graphe des dépendances des activités des tâches, en une requête.
+        
+        Part de toutes les tâches des activités concernées et suit les
+        prérequis, y compris ceux d'autres activités.
+        """
+        self.flush_model(['activity_id', 'depends_on_task_ids'])
+        self.env.cr.execute(
+            """
+            WITH RECURSIVE graph(task_id, depends_on_id) AS (
+                SELECT r.task_id, r.depends_on_id
+                FROM task_dependency_rel r
+                JOIN activity_task t ON t.id = r.task_id
+                WHERE t.activity_id IN %s OR r.task_id IN %s
+                UNION
+                SELECT r.task_id, r.depends_on_id
+                FROM task_dependency_rel r
+                JOIN graph g ON r.task_id = g.depends_on_id
+            )
+            SELECT task_id, depends_on_id FROM graph
+            """,
+            (tuple(self.activity_id.ids) or (0,), tuple(self.ids)),
+        )
+        dependencies = defaultdict(list)
+        for task_id, depends_on_id in self.env.cr.fetchall():
+            dependencies[task_id].append(depends_on_id)
+        return dependencies
+    
+    @api.depends('state', 'estimated_hours', 'depends_on_task_ids', 'depends_on_task_ids.state',
+                 'activity_id.task_ids.state', 'activity_id.task_ids.estimated_hours',
+                 'activity_id.task_ids.depends_on_task_ids')
     def _compute_dependencies_status(self):
-        """Calcule le statut des dépendances"""
+        """Calcule le statut des dépendances et le chemin critique, par activité.
+        
+        Un seul parcours du graphe des tâches de chaque activité: début au
+        plus tôt en avant, fin au plus tard en arrière, la marge étant leur
+        différence. Les tâches terminées ou annulées ne durent plus rien;
+        les prérequis d'autres activités comptent comme bloquants mais pas
+        dans la durée.
+        """
+        tasks_by_activity = defaultdict(list)
         for task in self:
-            incomplete_dependencies = task.depends_on_task_ids.filtered(
-                lambda t: t.state != 'completed'
-            )
-            task.blocked_by_count = len(incomplete_dependencies)
-            task.can_start = task.blocked_by_count == 0
+            tasks_by_activity[task.activity_id].append(task)
+        
+        for activity, task_list in tasks_by_activity.items():
+            tasks = self.concat(*task_list)
+            graph_tasks = activity.task_ids | tasks
+            graph_ids = set(graph_tasks.ids)
+            dependencies = {
+                task: [dependency for dependency in task.depends_on_task_ids if dependency.id in graph_ids]
+                for task in graph_tasks
+            }
+            order = self._topological_order(dependencies)
+            
+            for task in tasks:
+                task.blocked_by_count = sum(
+                    1 for dependency in task.depends_on_task_ids if dependency.state != 'completed'
+                )
+                task.can_start = task.blocked_by_count == 0
+            
+            if order is None:
+                # Cycle: refusé par la contrainte, pas de planning calculable
+                tasks.update({'earliest_start_hours': 0.0, 'slack_hours': 0.0, 'is_critical': False})
+                continue
+            
+            duration = {
+                task: 0.0 if task.state in ('completed', 'cancelled') else task.estimated_hours or 0.0
+                for task in order
+            }
+            earliest = {}
+            for task in order:
+                earliest[task] = max(
+                    (earliest[dependency] + duration[dependency] for dependency in dependencies[task]),
+                    default=0.0,
+                )
+            finish = max((earliest[task] + duration[task] for task in order), default=0.0)
+            
+            successors = defaultdict(list)
+            for task, prerequisites in dependencies.items():
+                for prerequisite in prerequisites:
+                    successors[prerequisite].append(task)
+            latest_start = {}
+            for task in reversed(order):
+                latest_finish = min(
+                    (latest_start[successor] for successor in successors[task]), default=finish
+                )
+                latest_start[task] = latest_finish - duration[task]
+            
+            for task in tasks:
+                slack = latest_start[task] - earliest[task]
+                task.earliest_start_hours = earliest[task]
+                task.slack_hours = slack
+                task.is_critical = duration[task] > 0 and abs(slack) < 1e-6
     
     @api.constrains('depends_on_task_ids')
     def _check_circular_dependency(self):
-        """Vérifie qu'il n'y a pas de dépendance circulaire"""
-        for task in self:
-            if task in task.depends_on_task_ids:
+        """Vérifie qu'il n'y a pas de dépendance circulaire (tri topologique du graphe)"""
+        dependencies = self._load_dependency_graph()
+        for task_id in self.ids:
+            if task_id in dependencies.get(task_id, ()):
                 raise ValidationError("Une tâche ne peut pas dépendre d'elle-même.")
-            
-            # Vérification plus profonde des dépendances circulaires
-            def check_circular(current_task, visited_tasks):
-                if current_task.id in visited_tasks:
-                    return True
-                visited_tasks.add(current_task.id)
-                for dep_task in current_task.depends_on_task_ids:
-                    if check_circular(dep_task, visited_tasks.copy()):
-                        return True
-                return False
-            
-            if check_circular(task, set()):
-                raise ValidationError("Dépendance circulaire détectée dans les tâches.")
+        
+        if self._topological_order(dependencies) is None:
+            raise ValidationError("Dépendance circulaire détectée dans les tâches.")
     
     @api.constrains('deadline', 'activity_id')
     def _check_deadline_coherence(self):
@@ -0,0 +1,352 @@
+# -*- coding: utf-8 -*-
+
+from odoo import models, fields, api
+from odoo.tools import create_index
+import logging
+
+_logger = logging.getLogger(__name__)
+
+
+class CotisationGroupMembership(models.Model):
+    """Index des appartenances des membres aux groupes.
+
+    Une ligne par période d'appartenance d'un contact (non société) à un
+    groupe: ouverte à l'arrivée dans le groupe, fermée (date de sortie)
+    quand le contact quitte le groupe, devient une société ou est
+    supprimé. Les appartenances suivent les mêmes sources que la
+    résolution historique des membres: group_id des membres pour les
+    groupes de type 'group', le champ <type>_members du groupe pour les
+    autres types d'organisation, parent_id sinon. Un membre peut donc
+    appartenir à plusieurs groupes. La résolution des membres d'un
+    groupe, à aujourd'hui ou à une date passée, et les compteurs de
+    membres des groupes reposent sur cet index.
+    """
+
+    _name = "cotisation.group.membership"
+    _description = "Appartenance d'un membre à un groupe"
+    _order = "group_id, date_joined desc, id desc"
+
+    group_id = fields.Many2one(
+        "res.partner",
+        string="Groupe",
+        required=True,
+        readonly=True,
+        ondelete="cascade",
+    )
+    member_id = fields.Many2one(
+        "res.partner",
+        string="Membre",
+        required=True,
+        readonly=True,
+        ondelete="cascade",
+    )
+    active = fields.Boolean(
+        string="Active",
+        default=True,
+        readonly=True,
+        help="Appartenance en cours d'un membre actif",
+    )
+    date_joined = fields.Date(string="Date d'entrée", required=True, readonly=True)
+    date_left = fields.Date(string="Date de sortie", readonly=True)
+
+    def init(self):
+        # Une seule appartenance ouverte par membre et par groupe
+        self.env.cr.execute("DROP INDEX IF EXISTS cotisation_group_membership_open_member_uniq")
+        self.env.cr.execute(
+            f"""
+            CREATE UNIQUE INDEX IF NOT EXISTS cotisation_group_membership_open_uniq
+            ON {self._table} (group_id, member_id) WHERE date_left IS NULL
+            """
+        )
+        create_index(
+            self._cr,
+            "cotisation_group_membership_group_index",
+            self._table,
+            ["group_id", "date_joined", "date_left"],
+        )
+        create_index(
+            self._cr,
+            "cotisation_group_membership_open_index",
+            self._table,
+            ["group_id", "active"],
+            where="date_left IS NULL",
+        )
+        create_index(
+            self._cr,
+            "cotisation_group_membership_member_index",
+            self._table,
+            ["member_id"],
+            where="date_left IS NULL",
+        )
+        self.env.cr.execute(f"SELECT 1 FROM {self._table} LIMIT 1")
+        self._sync_memberships(joined_on_creation=not self.env.cr.fetchone())
+        self._refresh_member_counts()
+
+    # ------------------------------------------------------------------
+    # Sources des appartenances
+    # ------------------------------------------------------------------
+
+    @api.model
+    def _typed_member_fields(self):
+        """{type d'organisation: champ <type>_members} des types résolus sans parent_id"""
+        Partner = self.env["res.partner"]
+        type_field = Partner._fields.get("organization_type")
+        if not type_field:
+            return {}
+
+        member_fields = {}
+        for organization_type in type_field.get_values(self.env):
+            if organization_type == "group":
+                # Les membres d'un groupe simple pointent vers lui par group_id
+                field = Partner._fields.get("group_id")
+                if field and field.type == "many2one" and field.comodel_name == "res.partner":
+                    member_fields[organization_type] = field
+                continue
+            field = Partner._fields.get(f"{organization_type}_members")
+            if field and field.type in ("one2many", "many2many") and field.comodel_name == "res.partner":
+                member_fields[organization_type] = field
+        return member_fields
+
+    @api.model
+    def _membership_trigger_fields(self):
+        """Champs de res.partner dont la modification change les appartenances"""
+        Partner = self.env["res.partner"]
+        fnames = {"parent_id", "active", "is_company"}
+        if "organization_type" in Partner._fields:
+            fnames.add("organization_type")
+        for field in self._typed_member_fields().values():
+            fnames.add(field.name)
+            if field.type == "one2many":
+                fnames.add(field.inverse_name)
+            if field.compute:
+                # Champ calculé: ses dépendances directes sur res.partner
+                fnames.update(dep.split(".")[0] for dep in field.get_depends(Partner)[0])
+        return fnames
+
+    @api.model
+    def _desired_memberships(self, partner_ids=None):
+        """Appartenances attendues {(groupe, membre): membre actif}.
+
+        partner_ids: limite aux appartenances dont le groupe ou le membre
+        en fait partie (toutes si None).
+        """
+        Partner = self.env["res.partner"].with_context(active_test=False)
+        member_fields = self._typed_member_fields()
+        has_type = "organization_type" in Partner._fields
+        scope = "" if partner_ids is None else "AND (g.id IN %(ids)s OR m.id IN %(ids)s)"
+        params = {"ids": tuple(partner_ids or ()), "types": tuple(member_fields) or ("",)}
+        queries = []
+        computed = {}
+
+        # Par défaut: contacts rattachés à leur groupe parent
+        queries.append(f"""
+            SELECT g.id, m.id, m.active
+            FROM res_partner m
+            JOIN res_partner g ON g.id = m.parent_id
+            WHERE NOT COALESCE(m.is_company, FALSE)
+              {"AND (g.organization_type IS NULL OR g.organization_type NOT IN %(types)s)" if has_type else ""}
+              {scope}
+        """)
+
+        for index, (organization_type, field) in enumerate(member_fields.items()):
+            type_param = f"type_{index}"
+            params[type_param] = organization_type
+            if field.type == "many2one":
+                # Type 'group': group_id des membres
+                source = f"FROM res_partner m JOIN res_partner g ON g.id = m.{field.name}"
+            elif field.type == "one2many" and Partner._fields[field.inverse_name].store:
+                source = f"FROM res_partner m JOIN res_partner g ON g.id = m.{field.inverse_name}"
+            elif field.type == "many2many" and field.store:
+                source = f"""
+                    FROM {field.relation} r
+                    JOIN res_partner g ON g.id = r.{field.column1}
+                    JOIN res_partner m ON m.id = r.{field.column2}
+                """
+            else:
+                # Champ calculé non stocké: résolu par l'ORM, groupe par groupe
+                computed[organization_type] = field
+                continue
+            queries.append(f"""
+                SELECT g.id, m.id, m.active
+                {source}
+                WHERE g.organization_type = %({type_param})s
+                  AND NOT COALESCE(m.is_company, FALSE)
+                  {scope}
+            """)
+
+        self.env.cr.execute(" UNION ".join(queries), params)
+        desired = {(group_id, member_id): bool(active) for group_id, member_id, active in self.env.cr.fetchall()}
+
+        scope_ids = set(partner_ids or ())
+        for organization_type, field in computed.items():
+            for group in Partner.search([("organization_type", "=", organization_type)]):
+                for member in group[field.name]:
+                    if member.is_company:
+                        continue
+                    if partner_ids is None or group.id in scope_ids or member.id in scope_ids:
+                        desired[(group.id, member.id)] = member.active
+        return desired
+
+    # ------------------------------------------------------------------
+    # Synchronisation
+    # ------------------------------------------------------------------
+
+    @api.model
+    def _sync_memberships(self, partner_ids=None, joined_on_creation=False):
+        """Aligne l'index sur les sources des appartenances.
+
+        partner_ids: groupes ou membres à synchroniser (tous si None).
+        joined_on_creation: date d'entrée = création du contact (construction
+        initiale de l'index), sinon aujourd'hui.
+        Retourne les groupes dont le nombre de membres a pu changer.
+        """
+        if partner_ids is not None and not partner_ids:
+            return set()
+
+        self.env["res.partner"].flush_model()
+        self.flush_model()
+        today = fields.Date.context_today(self)
+        desired = self._desired_memberships(partner_ids)
+
+        scope = "" if partner_ids is None else "AND (group_id IN %(ids)s OR member_id IN %(ids)s)"
+        self.env.cr.execute(
+            f"""
+            SELECT id, group_id, member_id, active FROM {self._table}
+            WHERE date_left IS NULL {scope}
+            """,
+            {"ids": tuple(partner_ids or ())},
+        )
+        current = {(group_id, member_id): (row_id, active) for row_id, group_id, member_id, active in self.env.cr.fetchall()}
+
+        to_close = [row_id for key, (row_id, active) in current.items() if key not in desired]
+        to_activate = [
+            row_id for key, (row_id, active) in current.items()
+            if key in desired and desired[key] and not active
+        ]
+        to_deactivate = [
+            row_id for key, (row_id, active) in current.items()
+            if key in desired and not desired[key] and active
+        ]
+        to_insert = [(key, active) for key, active in desired.items() if key not in current]
+
+        # Sortie du groupe
+        if to_close:
+            self.env.cr.execute(
+                f"UPDATE {self._table} SET date_left = %s, active = FALSE WHERE id IN %s",
+                (today, tuple(to_close)),
+            )
+        # Archivage / désarchivage du membre
+        for row_ids, active in ((to_activate, True), (to_deactivate, False)):
+            if row_ids:
+                self.env.cr.execute(
+                    f"UPDATE {self._table} SET active = %s WHERE id IN %s",
+                    (active, tuple(row_ids)),
+                )
+        # Entrée dans un groupe
+        if to_insert:
+            joined = "LEAST(COALESCE(p.create_date::date, %(today)s), %(today)s)" if joined_on_creation else "%(today)s"
+            self.env.cr.execute(
+                f"""
+                INSERT INTO {self._table} (group_id, member_id, active, date_joined)
+                SELECT v.group_id, v.member_id, v.active, {joined}
+                FROM unnest(%(groups)s::int[], %(members)s::int[], %(actives)s::bool[])
+                    AS v(group_id, member_id, active)
+                JOIN res_partner p ON p.id = v.member_id
+                """,
+                {
+                    "today": today,
+                    "groups": [key[0] for key, active in to_insert],
+                    "members": [key[1] for key, active in to_insert],
+                    "actives": [active for key, active in to_insert],
+                },
+            )
+
+        self.invalidate_model(["group_id", "member_id", "active", "date_joined", "date_left"])
+        changed = set(to_close) | set(to_activate) | set(to_deactivate)
+        groups = {key[0] for key, (row_id, active) in current.items() if row_id in changed}
+        groups.update(key[0] for key, active in to_insert)
+        return groups
+
+    @api.model
+    def _open_group_ids(self, member_ids):
+        """Groupes dont les contacts sont actuellement membres"""
+        if not member_ids:
+            return set()
+        self.flush_model()
+        self.env.cr.execute(
+            f"SELECT DISTINCT group_id FROM {self._table} WHERE member_id IN %s AND date_left IS NULL",
+            (tuple(member_ids),),
+        )
+        return {row[0] for row in self.env.cr.fetchall()}
+
+    @api.model
+    def _refresh_member_counts(self, group_ids=None):
+        """Recalcule les nombres de membres mis en cache sur les groupes"""
+        if group_ids is not None and not group_ids:
+            return
+        scope = "" if group_ids is None else "WHERE g.id IN %(ids)s"
+        self.env.cr.execute(
+            f"""
+            WITH c AS (
+                SELECT g.id,
+                       COUNT(m.id) AS members,
+                       COUNT(m.id) FILTER (WHERE m.active) AS active_members
+                FROM res_partner g
+                LEFT JOIN {self._table} m ON m.group_id = g.id AND m.date_left IS NULL
+                {scope}
+                GROUP BY g.id
+            )
+            UPDATE res_partner g
+            SET group_members_count = c.members,
+                group_active_members_count = c.active_members
+            FROM c
+            WHERE g.id = c.id
+              AND (g.group_members_count IS DISTINCT FROM c.members
+                   OR g.group_active_members_count IS DISTINCT FROM c.active_members)
+            RETURNING g.id
+            """,
+            {"ids": tuple(group_ids or ())},
+        )
+        changed = [row[0] for row in self.env.cr.fetchall()]
+        if changed:
+            groups = self.env["res.partner"].browse(changed)
+            count_fields = ["group_members_count", "group_active_members_count"]
+            groups.invalidate_recordset(count_fields, flush=False)
+            groups.modified(count_fields)
+
+    @api.model
+    def _member_ids(self, group_ids, at_date=None):
+        """Identifiants des membres des groupes, actuels ou à une date donnée"""
+        if not group_ids:
+            return []
+        self.flush_model()
+        if at_date:
+            # Historique: appartenance couvrant la date, quel que soit l'état actuel
+            self.env.cr.execute(
+                f"""
+                SELECT DISTINCT member_id FROM {self._table}
+                WHERE group_id IN %s AND date_joined <= %s
+                  AND (date_left IS NULL OR date_left > %s)
+                """,
+                (tuple(group_ids), at_date, at_date),
+            )
+        else:
+            self.env.cr.execute(
+                f"""
+                SELECT DISTINCT member_id FROM {self._table}
+                WHERE group_id IN %s AND date_left IS NULL AND active
+                """,
+                (tuple(group_ids),),
+            )
+        return [row[0] for row in self.env.cr.fetchall()]
+
+    @api.model
+    def _cron_reconcile_memberships(self):
+        """Cron: rattrape les écarts (imports SQL, modifications hors ORM)"""
+        groups = self._sync_memberships()
+        self._refresh_member_counts()
+        if groups:
+            _logger.warning(f"Index des appartenances: {len(groups)} groupes corrigés")
+        else:
+            _logger.info("Index des appartenances: aucun écart")
+        return True
@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+
+from odoo import models, fields, api
+from datetime import timedelta
+import logging
+import threading
+
+_logger = logging.getLogger(__name__)
+
+
+class MailMailCotisationQueue(models.Model):
+    """Extension de mail.mail pour la file d'envoi des cotisations"""
+
+    _inherit = "mail.mail"
+
+    cotisation_queued = fields.Boolean(
+        string="File cotisations",
+        default=False,
+        index=True,
+        help="Email mis en file par le module de cotisations et envoyé par lots",
+    )
+    cotisation_retry_count = fields.Integer(
+        string="Tentatives d'envoi", default=0
+    )
+
+    @api.model
+    def process_email_queue(self, *args, **kwargs):
+        """La file des cotisations est réservée à son propre cron.
+
+        Sans ce filtre, le planificateur standard prendrait aussi ces
+        emails 'outgoing' et les enverrait hors lots, en concurrence avec
+        la file et sans ses re-tentatives.
+        """
+        filters = list(self.env.context.get("filters") or []) + [("cotisation_queued", "=", False)]
+        return super(MailMailCotisationQueue, self.with_context(filters=filters)).process_email_queue(
+            *args, **kwargs
+        )
+
+
+class CotisationMailDispatcher(models.AbstractModel):
+    """File d'envoi asynchrone des emails (rapports, rappels, reçus).
+
+    Les emails sont créés en état 'outgoing' dans la transaction de
+    l'utilisateur, sans aucun aller-retour SMTP. Le cron de la file les
+    envoie ensuite par lots: mail.mail.send() ouvre une seule connexion
+    SMTP par serveur et par lot. Les échecs sont re-planifiés avec un
+    délai exponentiel jusqu'à MAX_RETRIES tentatives. Le planificateur
+    standard de mail.mail ignore ces emails.
+    """
+
+    _name = "cotisation.mail.dispatcher"
+    _description = "File d'envoi des emails de cotisations"
+
+    BATCH_SIZE = 200
+    MAX_RETRIES = 5
+    RETRY_BASE_MINUTES = 5
+    SMS_QUEUE_CRON = "sms.ir_cron_sms_scheduler_action"
+
+    @api.model
+    def enqueue_template(self, template, res_ids, email_values=None, attachments_by_res_id=None):
+        """Rend le template en lot et met les emails en file.
+
+        Les pièces jointes sont liées à chaque email individuellement: le
+        template partagé n'est jamais modifié.
+        """
+        if not template or not res_ids:
+            return self.env["mail.mail"]
+
+        mails = template.send_mail_batch(
+            list(res_ids), force_send=False, email_values=email_values
+        )
+        mails = self.env["mail.mail"].sudo().browse(mails.ids)
+        mails.write({"cotisation_queued": True})
+
+        for mail in mails:
+            attachments = (attachments_by_res_id or {}).get(mail.res_id)
+            if attachments:
+                mail.attachment_ids = [(4, attachment.id) for attachment in attachments]
+
+        self._trigger_queue()
+        return mails
+
+    @api.model
+    def enqueue_values(self, values_list):
+        """Met en file des emails construits sans template"""
+        if not values_list:
+            return self.env["mail.mail"]
+
+        mails = self.env["mail.mail"].sudo().create([
+            dict(values, cotisation_queued=True, state="outgoing")
+            for values in values_list
+        ])
+        self._trigger_queue()
+        return mails
+
+    @api.model
+    def enqueue_sms(self, values_list):
+        """Met en file des SMS, envoyés par lots par le planificateur du module sms.
+
+        Le module sms est optionnel: sans lui, rien n'est mis en file et
+        None est retourné.
+        """
+        if not values_list or "sms.sms" not in self.env:
+            return None
+
+        sms = self.env["sms.sms"].sudo().create([
+            dict(values, state="outgoing") for values in values_list
+        ])
+        cron = self.env.ref(self.SMS_QUEUE_CRON, False)
+        if cron:
+            cron._trigger()
+        return sms
+
+    @api.model
+    def _trigger_queue(self):
+        """Réveille le cron de la file sans attendre son intervalle"""
+        cron = self.env.ref(
+            "contribution_management.cron_process_cotisation_mail_queue", False
+        )
+        if cron:
+            cron._trigger()
+
+    @api.model
+    def _reschedule_failed_mails(self):
+        """Remet en file les emails en échec avec un délai exponentiel"""
+        failed = self.env["mail.mail"].sudo().search([
+            ("cotisation_queued", "=", True),
+            ("state", "=", "exception"),
+            ("cotisation_retry_count", "<", self.MAX_RETRIES),
+        ])
+        if not failed:
+            return 0
+
+        now = fields.Datetime.now()
+        # Une écriture par niveau de tentative plutôt qu'une par email
+        for retry_count in set(failed.mapped("cotisation_retry_count")):
+            batch = failed.filtered(lambda m: m.cotisation_retry_count == retry_count)
+            delay = self.RETRY_BASE_MINUTES * (2 ** retry_count)
+            batch.write({
+                "state": "outgoing",
+                "cotisation_retry_count": retry_count + 1,
+                "scheduled_date": now + timedelta(minutes=delay),
+            })
+
+        _logger.info(f"File emails: {len(failed)} emails en échec re-planifiés")
+        return len(failed)
+
+    @api.model
+    def _cron_process_mail_queue(self, batch_size=None):
+        """Cron: envoie un lot d'emails en file et se relance s'il en reste"""
+        batch_size = batch_size or self.BATCH_SIZE
+        auto_commit = not getattr(threading.current_thread(), "testing", False)
+        self._reschedule_failed_mails()
+
+        # SKIP LOCKED: deux workers ne prennent jamais le même email
+        self.env.cr.execute(
+            """
+            SELECT id FROM mail_mail
+            WHERE cotisation_queued = TRUE
+              AND state = 'outgoing'
+              AND (scheduled_date IS NULL OR scheduled_date <= %s)
+            ORDER BY id
+            LIMIT %s
+            FOR UPDATE SKIP LOCKED
+            """,
+            (fields.Datetime.now(), batch_size + 1),
+        )
+        mail_ids = [row[0] for row in self.env.cr.fetchall()]
+        has_more = len(mail_ids) > batch_size
+        mails = self.env["mail.mail"].sudo().browse(mail_ids[:batch_size])
+
+        if mails:
+            mails.send(auto_commit=auto_commit, raise_exception=False)
+            _logger.info(f"File emails: lot de {len(mails)} emails traité")
+
+        if has_more:
+            self._trigger_queue()
+        return True
@@ -2,6 +2,7 @@
 
 from odoo import models, fields, api
 from odoo.exceptions import ValidationError, UserError
+from odoo.tools import create_index
 import logging
 
 _logger = logging.getLogger(__name__)
@@ -145,6 +146,16 @@ class MemberCotisation(models.Model):
         ('other', 'Autre')
     ], string="Méthode de paiement")
 
+    def init(self):
+        """Index du rapprochement de relevés: cotisations ouvertes par restant dû (centimes)"""
+        create_index(
+            self.env.cr,
+            'member_cotisation_remaining_cents_index',
+            self._table,
+            ['round((amount_due - amount_paid) * 100)'],
+            where='active = TRUE AND amount_due > amount_paid',
+        )
+
     @api.depends("payment_plan_id")
     def _compute_has_payment_plan(self):
         """Détermine si la cotisation a un plan de paiement"""
@@ -294,7 +305,118 @@ class MemberCotisation(models.Model):
         for record in self:
             if record.due_date < min_date:
                 raise ValidationError("La date d'échéance ne peut pas être antérieure à 2 ans.")
-    
+
+    # === COMPTEURS DE COLLECTE ===
+
+    COUNTER_TRACKED_FIELDS = ('monthly_cotisation_id', 'activity_id', 'active', 'state', 'amount_paid')
+    COUNTER_PARENTS = (('monthly_cotisation_id', 'monthly.cotisation'), ('activity_id', 'group.activity'))
+
+    def _read_counter_rows(self):
+        """Valeurs en base des champs suivis par les compteurs, en une requête"""
+        if not self.ids:
+            return {}
+        self.env.cr.execute(
+            f"""
+            SELECT id, {", ".join(self.COUNTER_TRACKED_FIELDS)}
+            FROM member_cotisation WHERE id IN %s
+            """,
+            (tuple(self.ids),),
+        )
+        return {
+            row[0]: dict(zip(self.COUNTER_TRACKED_FIELDS, row[1:]))
+            for row in self.env.cr.fetchall()
+        }
+
+    @api.model
+    def _add_counter_contribution(self, deltas, row, sign):
+        """Ajoute (sign=1) ou retire (sign=-1) la contribution d'une cotisation aux compteurs"""
+        if not row['active']:
+            return
+        state = row['state']
+        values = (
+            1,
+            int(state == 'paid'),
+            int(state == 'partial'),
+            int(state == 'overdue'),
+            float(row['amount_paid'] or 0.0),
+        )
+        for link_field, model_name in self.COUNTER_PARENTS:
+            if row[link_field]:
+                bucket = deltas.setdefault(model_name, {}).setdefault(row[link_field], [0, 0, 0, 0, 0.0])
+                for index, value in enumerate(values):
+                    bucket[index] += sign * value
+
+    @api.model
+    def _dispatch_counter_deltas(self, deltas):
+        """Répercute les variations accumulées sur les cotisations mensuelles et activités"""
+        for model_name, model_deltas in deltas.items():
+            self.env[model_name]._apply_counter_deltas(model_deltas)
+
+    def _create(self, data_list):
+        records = super()._create(data_list)
+        deltas = {}
+        for row in records._read_counter_rows().values():
+            self._add_counter_contribution(deltas, row, 1)
+        self._dispatch_counter_deltas(deltas)
+        return records
+
+    def _write(self, vals):
+        # _write reçoit aussi les recalculs (state) lors du flush: chaque
+        # changement en base passe ici, avec les anciennes valeurs encore lisibles
+        tracked = [fname for fname in self.COUNTER_TRACKED_FIELDS if fname in vals]
+        if not tracked:
+            return super()._write(vals)
+
+        old_rows = self._read_counter_rows()
+        result = super()._write(vals)
+
+        deltas = {}
+        changes = {fname: vals[fname] for fname in tracked}
+        for row in old_rows.values():
+            self._add_counter_contribution(deltas, row, -1)
+            self._add_counter_contribution(deltas, dict(row, **changes), 1)
+        self._dispatch_counter_deltas(deltas)
+        return result
+
+    def unlink(self):
+        self.flush_recordset(list(self.COUNTER_TRACKED_FIELDS))
+        old_rows = self._read_counter_rows()
+        result = super().unlink()
+
+        deltas = {}
+        for row in old_rows.values():
+            self._add_counter_contribution(deltas, row, -1)
+        self._dispatch_counter_deltas(deltas)
+        return result
+
+    def _profile_write(self, vals):
+        """Écrit, recalcule tout, et mesure le coût induit sur les membres.
+
+        Retourne le nombre de requêtes émises par l'écriture et ses
+        recalculs, et les mesures par passage du pipeline des métriques
+        membres ({pipeline: {runs, partners, queries}}).
+        """
+        Partner = self.env["res.partner"]
+        Partner.get_metrics_stats(reset=True)
+        queries_before = self.env.cr.sql_log_count
+
+        self.write(vals)
+        self.env.flush_all()
+        # Champs d'affichage: évalués comme à la lecture d'une vue
+        self.member_id.invalidate_recordset(["status_summary"])
+        self.member_id.mapped("status_summary")
+
+        result = {
+            "cotisations": len(self),
+            "queries": self.env.cr.sql_log_count - queries_before,
+            "pipelines": Partner.get_metrics_stats(reset=True),
+        }
+        _logger.info(
+            f"Écriture sur {len(self)} cotisations: {result['queries']} requêtes, "
+            f"métriques membres {result['pipelines']}"
+        )
+        return result
+
     def action_record_payment(self):
         """Action pour enregistrer un paiement"""
         self.ensure_one()
@@ -320,11 +442,17 @@ class MemberCotisation(models.Model):
         if self.state in ['paid', 'cancelled']:
             raise UserError("Cette cotisation est déjà payée ou annulée.")
         
-        self.write({
-            'amount_paid': self.amount_due,
-            'payment_date': fields.Date.today(),
-            'payment_notes': 'Marqué comme payé manuellement'
-        })
+        # Le solde est une écriture du registre, pas une écriture directe
+        self.env['cotisation.payment.posting'].post_plan(
+            [{'cotisation_id': self.id, 'amount': self.amount_due - self.amount_paid}],
+            {
+                'payment_method': 'other',
+                'notes': 'Marqué comme payé manuellement',
+                'currency_id': self.currency_id.id,
+            },
+            cotisation_note='Marqué comme payé manuellement',
+            post_summary=False,
+        )
         
         self.message_post(
             body=f"Cotisation marquée comme payée manuellement le {fields.Date.today()}",
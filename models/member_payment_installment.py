@@ -2,6 +2,7 @@
 
 from odoo import models, fields, api
 from odoo.exceptions import ValidationError, UserError
+from odoo.tools import create_index
 import logging
 from datetime import datetime, timedelta, date
 from dateutil.relativedelta import relativedelta
@@ -17,6 +18,8 @@ class MemberPaymentInstallment(models.Model):
     _description = "Échéance plan de paiement"
     _order = "due_date, sequence"
 
+    OPEN_COTISATION_STATES = ("pending", "partial", "overdue")
+
     name = fields.Char(string="Nom")
     payment_plan_id = fields.Many2one(
         "member.payment.plan",
@@ -116,10 +119,42 @@ class MemberPaymentInstallment(models.Model):
         help="Répartir automatiquement sur les cotisations non payées",
     )
 
+    def init(self):
+        """Index du scan des rappels et de la configuration (plan, état, échéance)"""
+        create_index(
+            self.env.cr,
+            "member_payment_installment_plan_state_due_index",
+            self._table,
+            ["payment_plan_id", "state", "due_date"],
+        )
+
+    @api.model
+    def _get_default_allocation_config(self):
+        """Méthode et répartition automatique par défaut (paramètres système)"""
+        params = self.env["ir.config_parameter"].sudo()
+        return {
+            "allocation_method": params.get_param(
+                "contribution_management.default_allocation_method", "auto"
+            ),
+            "auto_allocate": params.get_param(
+                "contribution_management.default_auto_allocate", "True"
+            ) == "True",
+        }
+
+    def _apply_allocation_config(self, values):
+        """Applique une configuration d'allocation à un lot d'échéances.
+
+        Une écriture pour tout le lot, puis une seule insertion des liens
+        vers les cotisations non payées pour les échéances sans lien.
+        """
+        if not self:
+            return
+        self.write(values)
+        if values.get("auto_allocate"):
+            self.filtered(lambda i: not i.cotisation_ids)._auto_select_cotisations()
+
     def update_allocation_configs(self):
         """Update allocation configurations automatically"""
-        from datetime import datetime, timedelta
-
         installments_without_config = self.search(
             [
                 ("state", "in", ["pending", "partial"]),
@@ -132,29 +167,11 @@ class MemberPaymentInstallment(models.Model):
             ]
         )
 
-        default_method = (
-            self.env["ir.config_parameter"]
-            .sudo()
-            .get_param("contribution_management.default_allocation_method", "auto")
-        )
-
-        default_auto_allocate = (
-            self.env["ir.config_parameter"]
-            .sudo()
-            .get_param("contribution_management.default_auto_allocate", "True")
-            == "True"
-        )
-
-        for installment in installments_without_config:
-            installment.write(
-                {
-                    "allocation_method": default_method,
-                    "auto_allocate": default_auto_allocate,
-                }
-            )
-
-            if default_auto_allocate:
-                installment._auto_select_cotisations()
+        # Une écriture et une insertion de liens pour tout le lot
+        config = self._get_default_allocation_config()
+        installments_without_config.write(config)
+        if config["auto_allocate"]:
+            installments_without_config._auto_select_cotisations()
 
         if installments_without_config:
             _logger.info(
@@ -204,16 +221,18 @@ class MemberPaymentInstallment(models.Model):
                 - {len(new_configs)} nouvelles configurations
                 - {sum(recent_allocations.mapped('amount_paid'))} montant total alloué
                 """
-            for manager in managers:
-                if manager.email:
-                    self.env["mail.mail"].create(
-                        {
-                            "subject": subject,
-                            "body_html": body.replace("\n", "<br />"),
-                            "email_to": manager.email,
-                            "auto_delete": True,
-                        }
-                    ).send()
+            self.env["cotisation.mail.dispatcher"].enqueue_values(
+                [
+                    {
+                        "subject": subject,
+                        "body_html": body.replace("\n", "<br />"),
+                        "email_to": manager.email,
+                        "auto_delete": True,
+                    }
+                    for manager in managers
+                    if manager.email
+                ]
+            )
 
     @api.depends("cotisation_ids")
     def _compute_cotisation_count(self):
@@ -241,37 +260,35 @@ class MemberPaymentInstallment(models.Model):
 
     def _allocate_payment_to_cotisations(self, payment_amount):
         """Répartit le paiement sur les cotisations liées"""
-        if not self.cotisation_ids or payment_amount <= 0:
+        plan, remaining_amount = self._allocation_plan(payment_amount)
+        if not plan and not remaining_amount:
             return
 
+        payments = self.env["cotisation.payment.posting"].post_plan(
+            plan, self._get_payment_values(), post_summary=False
+        )
+        self._record_allocation(payment_amount, payments, remaining_amount)
+
+    def _allocation_plan(self, payment_amount):
+        """Plan de répartition du paiement sur les cotisations liées: (plan, reste)"""
+        if not self.cotisation_ids or payment_amount <= 0:
+            return [], 0.0
+
         # Si répartition automatique activée, ajouter les cotisations non payées
         if self.auto_allocate:
             self._auto_select_cotisations()
 
-        allocation_details = []
-        remaining_amount = payment_amount
+        # Plan de répartition calculé par le moteur commun
+        engine = self.env["cotisation.allocation.engine"]
+        columns = engine.load_columns(cotisation_ids=self.cotisation_ids.ids)
+        return engine.allocate(columns, payment_amount, self.allocation_method or "auto")
 
-        # Obtenir les cotisations triées selon la méthode
-        sorted_cotisations = self._get_sorted_cotisations()
-
-        for cotisation in sorted_cotisations:
-            if remaining_amount <= 0:
-                break
-
-            # Calculer le montant à allouer à cette cotisation
-            cotisation_remaining = cotisation.amount_due - cotisation.amount_paid
-
-            if cotisation_remaining > 0:
-                amount_to_allocate = min(remaining_amount, cotisation_remaining)
-
-                # Créer le paiement de cotisation
-                self._create_cotisation_payment(cotisation, amount_to_allocate)
-
-                allocation_details.append(
-                    f"• {cotisation.display_name}: {amount_to_allocate:.2f} {self.currency_id.symbol}"
-                )
-
-                remaining_amount -= amount_to_allocate
+    def _record_allocation(self, payment_amount, payments, remaining_amount):
+        """Consigne le détail de la répartition et poste le message de suivi"""
+        allocation_details = [
+            f"• {payment.cotisation_id.display_name}: {payment.amount:.2f} {self.currency_id.symbol}"
+            for payment in payments
+        ]
 
         # Enregistrer les détails de répartition
         self.allocation_details = (
@@ -287,65 +304,115 @@ class MemberPaymentInstallment(models.Model):
             payment_amount - remaining_amount, allocation_details
         )
 
-    def _auto_select_cotisations(self):
-        """Sélectionne automatiquement les cotisations non payées du membre"""
-        if not self.member_id:
-            return
+    def _register_payment(self, amount, idempotency_key, allocate=True):
+        """Encaisse un montant sur l'échéance via le service d'encaissement.
 
-        # Rechercher les cotisations non payées du membre
-        unpaid_cotisations = self.env["member.cotisation"].search(
-            [
-                ("member_id", "=", self.member_id.id),
-                ("state", "in", ["pending", "partial", "overdue"]),
-                ("id", "not in", self.cotisation_ids.ids),  # Exclure celles déjà liées
-            ]
+        La répartition sur les cotisations et l'incrément du montant payé
+        de l'échéance sont soumis sous la même clé d'idempotence: une
+        soumission rejouée (double clic, transaction rejouée) ne compte
+        rien deux fois.
+        """
+        self.ensure_one()
+        plan, remaining_amount = self._allocation_plan(amount) if allocate else ([], 0.0)
+
+        def on_posted(intake):
+            self._increment_amount_paid(amount)
+            if plan or remaining_amount:
+                self._record_allocation(amount, intake.payment_ids, remaining_amount)
+
+        return self.env["cotisation.payment.intake"].submit(
+            idempotency_key,
+            plan,
+            self._get_payment_values(),
+            source="member.payment.installment",
+            on_posted=on_posted,
+            post_summary=False,
         )
 
-        # Ajouter les cotisations trouvées
-        if unpaid_cotisations:
-            self.cotisation_ids = [(4, cot_id) for cot_id in unpaid_cotisations.ids]
+    def _increment_amount_paid(self, amount):
+        """Ajoute amount au montant payé par incrément atomique.
 
-    def _get_sorted_cotisations(self):
-        """Retourne les cotisations triées selon la méthode choisie"""
-        cotisations = self.cotisation_ids.filtered(
-            lambda c: c.state in ["pending", "partial", "overdue"]
+        L'UPDATE relit et verrouille la ligne: deux caisses qui encaissent
+        la même échéance ne s'écrasent pas, et un encaissement qui
+        dépasserait le montant dû est refusé.
+        """
+        self.ensure_one()
+        rounding = self.currency_id.rounding or 0.01
+        amount = self.currency_id.round(amount) if self.currency_id else round(amount, 2)
+
+        self.flush_recordset(["amount", "amount_paid", "state", "payment_date"])
+        self.env.cr.execute(
+            """
+            UPDATE member_payment_installment
+            SET amount_paid = LEAST(amount, amount_paid + %(delta)s),
+                state = CASE
+                    WHEN amount_paid + %(delta)s >= amount - %(rounding)s THEN 'paid'
+                    ELSE 'partial'
+                END,
+                payment_date = CASE
+                    WHEN amount_paid + %(delta)s >= amount - %(rounding)s THEN %(today)s
+                    ELSE payment_date
+                END,
+                write_uid = %(uid)s,
+                write_date = (now() at time zone 'UTC')
+            WHERE id = %(id)s
+              AND state != 'cancelled'
+              AND amount_paid + %(delta)s <= amount + %(rounding)s
+            RETURNING id
+            """,
+            {
+                "delta": amount,
+                "rounding": rounding,
+                "today": fields.Date.today(),
+                "uid": self.env.uid,
+                "id": self.id,
+            },
         )
+        if not self.env.cr.fetchone():
+            raise UserError(
+                f"Le paiement de {amount:.2f} dépasse le montant restant de l'échéance {self.name}."
+            )
 
-        if self.allocation_method == "oldest_first":
-            return cotisations.sorted(lambda c: c.due_date or fields.Date.today())
-
-        elif self.allocation_method == "amount_priority":
-            return cotisations.sorted(lambda c: -(c.amount_due - c.amount_paid))
-
-        elif self.allocation_method == "manual":
-            return cotisations  # Ordre manuel défini par l'utilisateur
+        fnames = ["amount_paid", "state", "payment_date", "write_uid", "write_date"]
+        self.invalidate_recordset(fnames)
+        self.modified(fnames)
 
-        else:  # auto
-            # Tri par priorité : retard d'abord, puis par date d'échéance
-            def sort_key(cotisation):
-                priority = 0
-                if cotisation.state == "overdue":
-                    priority += 1000
-                elif cotisation.state == "partial":
-                    priority += 500
+    def _auto_select_cotisations(self):
+        """Lie aux échéances les cotisations non payées de leur membre.
 
-                # Ajouter les jours de retard
-                if cotisation.due_date:
-                    days_overdue = (fields.Date.today() - cotisation.due_date).days
-                    if days_overdue > 0:
-                        priority += days_overdue
+        Fonctionne sur un lot: une seule insertion dans la table de liaison,
+        les liens existants sont conservés.
+        """
+        installments = self.filtered("member_id")
+        if not installments:
+            return
 
-                return -priority  # Tri décroissant
+        self.env["member.cotisation"].flush_model(["member_id", "state", "active"])
+        installments.flush_recordset(["member_id", "cotisation_ids"])
+        self.env.cr.execute(
+            """
+            INSERT INTO installment_cotisation_rel (installment_id, cotisation_id)
+            SELECT i.id, c.id
+            FROM member_payment_installment i
+            JOIN member_cotisation c ON c.member_id = i.member_id
+            WHERE i.id IN %s AND c.active = TRUE AND c.state IN %s
+            ON CONFLICT DO NOTHING
+            """,
+            (tuple(installments.ids), self.OPEN_COTISATION_STATES),
+        )
+        if self.env.cr.rowcount:
+            installments.invalidate_recordset(["cotisation_ids"])
+            installments.modified(["cotisation_ids"])
 
-            return sorted(cotisations, key=sort_key)
+    def _get_sorted_cotisations(self):
+        """Retourne les cotisations triées selon la méthode choisie"""
+        return self.env["cotisation.allocation.engine"].sorted_cotisations(
+            self.cotisation_ids, self.allocation_method or "auto"
+        )
 
-    def _create_cotisation_payment(self, cotisation, amount):
-        """Crée un paiement pour la cotisation"""
-        payment_vals = {
-            "name": f"PAY-{self.name}-{cotisation.id}",
-            "cotisation_id": cotisation.id,
-            "member_id": self.member_id.id,
-            "amount": amount,
+    def _get_payment_values(self):
+        """Valeurs communes des paiements générés par l'échéance"""
+        return {
             "payment_date": fields.Date.today(),
             "payment_method": "installment",  # Méthode spécifique pour les échéances
             "reference": f"Échéance {self.sequence} - Plan {self.payment_plan_id.name}",
@@ -354,26 +421,14 @@ class MemberPaymentInstallment(models.Model):
             "installment_id": self.id,  # Lien vers l'échéance
         }
 
-        payment = self.env["cotisation.payment"].create(payment_vals)
-
-        # Mettre à jour la cotisation
-        new_amount_paid = cotisation.amount_paid + amount
-        cotisation.write(
-            {
-                "amount_paid": new_amount_paid,
-                "payment_date": (
-                    fields.Date.today()
-                    if new_amount_paid >= cotisation.amount_due
-                    else cotisation.payment_date
-                ),
-            }
+    def _create_cotisation_payment(self, cotisation, amount):
+        """Crée un paiement pour la cotisation"""
+        return self.env["cotisation.payment.posting"].post_plan(
+            [{"cotisation_id": cotisation.id, "amount": amount}],
+            self._get_payment_values(),
+            post_summary=False,
         )
 
-        # Mettre à jour le statut de la cotisation
-        cotisation._update_payment_status()
-
-        return payment
-
     def _post_allocation_message(self, allocated_amount, allocation_details):
         """Poste un message de suivi de l'allocation"""
         if not allocation_details:
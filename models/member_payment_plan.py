@@ -137,18 +137,20 @@ class MemberPaymentPlan(models.Model):
         return plan
 
     def _configure_installments_allocation(self):
-        """Configure l'allocation automatique pour toutes les échéances du plan"""
-        for installment in self.installment_ids:
-            installment.write(
-                {
-                    "auto_allocate": self.auto_allocate_to_cotisations,
-                    "allocation_method": self.allocation_method,
-                }
-            )
+        """Configure l'allocation automatique des échéances des plans.
 
-            # Si pas encore configuré, faire la sélection automatique
-            if not installment.cotisation_ids:
-                installment._auto_select_cotisations()
+        Une écriture par configuration distincte plutôt qu'une par échéance,
+        et une seule insertion des liens vers les cotisations non payées.
+        """
+        plans_by_config = {}
+        for plan in self:
+            config = (plan.auto_allocate_to_cotisations, plan.allocation_method)
+            plans_by_config[config] = plans_by_config.get(config, self.browse()) | plan
+
+        for (auto_allocate, allocation_method), plans in plans_by_config.items():
+            plans.installment_ids._apply_allocation_config(
+                {"auto_allocate": auto_allocate, "allocation_method": allocation_method}
+            )
 
     def action_view_installments(self):
         """Action pour afficher les échéances liées au plan de paiement"""
@@ -348,17 +350,21 @@ class MemberPaymentPlan(models.Model):
             )
 
     def generate_installments(self):
-        """Génère les échéances du plan de paiement"""
-        self.ensure_one()
+        """Génère les échéances des plans de paiement.
 
-        if (
-            not self.total_amount
-            or not self.number_of_installments
-            or not self.start_date
-        ):
-            raise UserError(
-                "Tous les champs requis doivent être renseignés pour générer les échéances."
-            )
+        Toutes les échéances des plans sont créées en un seul appel, avec la
+        configuration d'allocation du plan, puis liées en une insertion aux
+        cotisations non payées du membre.
+        """
+        for plan in self:
+            if (
+                not plan.total_amount
+                or not plan.number_of_installments
+                or not plan.start_date
+            ):
+                raise UserError(
+                    "Tous les champs requis doivent être renseignés pour générer les échéances."
+                )
 
         # Supprimer les échéances existantes si elles ne sont pas payées
         existing_installments = self.installment_ids.filtered(
@@ -367,6 +373,19 @@ class MemberPaymentPlan(models.Model):
         if existing_installments:
             existing_installments.unlink()
 
+        installments_data = []
+        for plan in self:
+            installments_data.extend(plan._prepare_installments_values())
+
+        # Créer toutes les échéances en une seule fois
+        installments = self.env["member.payment.installment"].create(installments_data)
+        installments.filtered("auto_allocate")._auto_select_cotisations()
+        return installments
+
+    def _prepare_installments_values(self):
+        """Valeurs des échéances d'un plan, dates calculées selon la fréquence"""
+        self.ensure_one()
+
         # Calculer le montant par échéance
         base_amount = self.total_amount
         if self.include_fees and self.fee_amount:
@@ -374,60 +393,77 @@ class MemberPaymentPlan(models.Model):
 
         installment_amount = base_amount / self.number_of_installments
 
-        # Créer les échéances
-        installments_data = []
-        current_date = self.start_date
-
-        for i in range(self.number_of_installments):
-            installments_data.append(
-                {
-                    "payment_plan_id": self.id,
-                    "sequence": i + 1,
-                    "due_date": current_date,
-                    "amount": installment_amount,
-                    "state": "pending",
-                }
-            )
-
-            # Calculer la prochaine date d'échéance
-            if self.frequency == "weekly":
-                current_date += timedelta(weeks=1)
-            elif self.frequency == "biweekly":
-                current_date += timedelta(weeks=2)
-            else:  # monthly
-                current_date += relativedelta(months=1)
-
-        # Créer toutes les échéances en une seule fois
-        self.env["member.payment.installment"].create(installments_data)
+        if self.frequency == "weekly":
+            step = relativedelta(weeks=1)
+        elif self.frequency == "biweekly":
+            step = relativedelta(weeks=2)
+        else:  # monthly
+            step = relativedelta(months=1)
+
+        return [
+            {
+                "payment_plan_id": self.id,
+                "sequence": i + 1,
+                "due_date": self.start_date + step * i,
+                "amount": installment_amount,
+                "state": "pending",
+                "auto_allocate": self.auto_allocate_to_cotisations,
+                "allocation_method": self.allocation_method or "auto",
+            }
+            for i in range(self.number_of_installments)
+        ]
 
     @api.model
     def _cron_send_payment_reminders(self):
-        """Cron pour envoyer les rappels de paiement"""
+        """Cron pour envoyer les rappels de paiement.
+
+        Une seule requête trouve, pour tous les plans, les échéances qui
+        tombent exactement à leur délai de rappel; les emails sont mis en
+        file en un lot.
+        """
         today = fields.Date.today()
 
-        # Trouver les plans avec rappels automatiques
-        plans_with_reminders = self.search(
-            [("state", "=", "in_progress"), ("auto_reminder", "=", True)]
+        self.flush_model(["state", "auto_reminder", "reminder_days", "member_id"])
+        self.env["member.payment.installment"].flush_model(
+            ["payment_plan_id", "state", "due_date"]
         )
+        self.env["res.partner"].flush_model(["email"])
+        self.env.cr.execute(
+            """
+            SELECT p.id, array_agg(i.id ORDER BY i.due_date, i.sequence)
+            FROM member_payment_plan p
+            JOIN member_payment_installment i ON i.payment_plan_id = p.id
+            JOIN res_partner m ON m.id = p.member_id
+            WHERE p.state = 'in_progress'
+              AND p.auto_reminder = TRUE
+              AND i.state = 'pending'
+              AND i.due_date = %s::date + COALESCE(p.reminder_days, 0)
+              AND COALESCE(m.email, '') != ''
+            GROUP BY p.id
+            """,
+            (today,),
+        )
+        rows = self.env.cr.fetchall()
+        if not rows:
+            return
 
-        for plan in plans_with_reminders:
-            # Échéances à venir dans les X jours
-            upcoming_date = today + timedelta(days=plan.reminder_days)
-            upcoming_installments = plan.installment_ids.filtered(
-                lambda i: i.state == "pending" and i.due_date == upcoming_date
-            )
-
-            if upcoming_installments and plan.member_id.email:
-                self._send_reminder_email(plan, upcoming_installments)
+        plans = self.browse([row[0] for row in rows])
+        installments = self.env["member.payment.installment"].browse(
+            [installment_id for row in rows for installment_id in row[1]]
+        )
+        self._send_reminder_email(plans, installments)
 
-    def _send_reminder_email(self, plan, installments):
-        """Envoie un email de rappel"""
+    def _send_reminder_email(self, plans, installments):
+        """Met en file les emails de rappel de tous les plans en un lot"""
         try:
             template = self.env.ref(
                 "contribution_management.email_template_payment_reminder", False
             )
             if template:
-                template.send_mail(plan.id, force_send=True)
-                _logger.info(f"Rappel de paiement envoyé à {plan.member_id.name}")
+                self.env["cotisation.mail.dispatcher"].enqueue_template(template, plans.ids)
+                _logger.info(
+                    f"Rappels de paiement mis en file: {len(plans)} plans, "
+                    f"{len(installments)} échéances"
+                )
         except Exception as e:
-            _logger.warning(f"Erreur envoi rappel pour {plan.member_id.name}: {e}")
+            _logger.warning(f"Erreur envoi rappels de paiement: {e}")
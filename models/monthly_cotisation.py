@@ -12,11 +12,13 @@ _logger = logging.getLogger(__name__)
 class MonthlyCotisation(models.Model):
     """Modèle pour gérer les cotisations mensuelles des groupes"""
     _name = "monthly.cotisation"
-    _inherit = ['mail.thread', 'mail.activity.mixin']
+    _inherit = ['mail.thread', 'mail.activity.mixin', 'cotisation.collection.counters']
     _description = "Cotisation mensuelle de groupe"
     _rec_name = "display_name"
     _order = "year desc, month desc, create_date desc"
     _check_company_auto = True
+    _counter_link_field = "monthly_cotisation_id"
+    _counter_amount_field = "amount"
 
     display_name = fields.Char(
         string="Nom",
@@ -113,48 +115,48 @@ class MonthlyCotisation(models.Model):
         store=True
     )
     
-    # Statistiques
+    # Statistiques (compteurs tenus par cotisation.collection.counters)
     total_members = fields.Integer(
         string="Nombre total de membres",
-        compute="_compute_stats",
-        store=True
+        readonly=True,
+        default=0
     )
     paid_members = fields.Integer(
         string="Membres ayant payé",
-        compute="_compute_stats",
-        store=True
+        readonly=True,
+        default=0
     )
     unpaid_members = fields.Integer(
         string="Membres n'ayant pas payé",
-        compute="_compute_stats",
-        store=True
+        readonly=True,
+        default=0
     )
     partial_members = fields.Integer(
         string="Membres en paiement partiel",
-        compute="_compute_stats",
-        store=True
+        readonly=True,
+        default=0
     )
     overdue_members = fields.Integer(
         string="Membres en retard",
-        compute="_compute_stats",
-        store=True
+        readonly=True,
+        default=0
     )
     total_collected = fields.Monetary(
         string="Total collecté",
-        compute="_compute_stats",
-        store=True,
+        readonly=True,
+        default=0,
         currency_field='currency_id'
     )
     total_expected = fields.Monetary(
         string="Total attendu",
-        compute="_compute_stats",
-        store=True,
+        readonly=True,
+        default=0,
         currency_field='currency_id'
     )
     completion_rate = fields.Float(
         string="Taux de completion (%)",
-        compute="_compute_stats",
-        store=True
+        readonly=True,
+        default=0
     )
     
     # Champs de suivi
@@ -262,35 +264,13 @@ class MonthlyCotisation(models.Model):
             else:
                 record.due_date = fields.Date.today()
     
-    @api.depends('group_id')
+    @api.depends('group_id', 'group_id.group_active_members_count')
     def _compute_members_info(self):
         """Calcule les informations sur les membres"""
         for monthly in self:
-            if monthly.group_id:
-                members = monthly._get_group_members()
-                monthly.members_count = len(members)
-            else:
-                monthly.members_count = 0
+            # Compteur mis en cache sur le groupe par l'index des appartenances
+            monthly.members_count = monthly.group_id.group_active_members_count if monthly.group_id else 0
     
-    @api.depends('cotisation_ids', 'cotisation_ids.amount_paid', 'cotisation_ids.state', 'amount')
-    def _compute_stats(self):
-        """Calcule les statistiques de cotisation"""
-        for monthly in self:
-            cotisations = monthly.cotisation_ids.filtered('active')
-            monthly.total_members = len(cotisations)
-            monthly.paid_members = len(cotisations.filtered(lambda c: c.state == 'paid'))
-            monthly.partial_members = len(cotisations.filtered(lambda c: c.state == 'partial'))
-            monthly.overdue_members = len(cotisations.filtered(lambda c: c.state == 'overdue'))
-            monthly.unpaid_members = monthly.total_members - monthly.paid_members - monthly.partial_members
-            monthly.total_collected = sum(cotisations.mapped('amount_paid'))
-            monthly.total_expected = monthly.total_members * monthly.amount
-            
-            # Correction du calcul du taux de completion - multiplier par 100 pour obtenir le pourcentage
-            if monthly.total_expected > 0:
-                monthly.completion_rate = (monthly.total_collected / monthly.total_expected) * 100
-            else:
-                monthly.completion_rate = 0.0
-
     # SUPPRESSION DE LA CONTRAINTE D'UNICITÉ - Permet plusieurs cotisations par mois
     # L'ancienne contrainte _check_unique_monthly a été supprimée
     
@@ -463,50 +443,9 @@ class MonthlyCotisation(models.Model):
             }
         }
     
-    def _get_group_members(self):
-        """Retourne tous les membres du groupe selon son type"""
-        group = self.group_id
-        members = self.env['res.partner']
-        
-        if not group:
-            return members
-        
-        try:
-            # Méthode générique pour tous les types de groupes
-            if hasattr(group, 'organization_type'):
-                if group.organization_type == 'group':
-                    members = self.env['res.partner'].search([
-                        ('is_company', '=', False),
-                        ('group_id', '=', group.id),
-                        ('active', '=', True)
-                    ])
-                elif hasattr(group, f'{group.organization_type}_members'):
-                    members = getattr(group, f'{group.organization_type}_members')
-                else:
-                    # Fallback: chercher tous les contacts liés au groupe
-                    members = self.env['res.partner'].search([
-                        ('is_company', '=', False),
-                        ('parent_id', '=', group.id),
-                        ('active', '=', True)
-                    ])
-            else:
-                # Méthode par défaut
-                members = self.env['res.partner'].search([
-                    ('is_company', '=', False),
-                    ('parent_id', '=', group.id),
-                    ('active', '=', True)
-                ])
-                
-        except Exception as e:
-            _logger.error(f"Erreur lors de la récupération des membres pour {group.name}: {e}")
-            # En cas d'erreur, essayer la méthode la plus simple
-            members = self.env['res.partner'].search([
-                ('is_company', '=', False),
-                ('parent_id', '=', group.id),
-                ('active', '=', True)
-            ])
-        
-        return members.filtered(lambda m: not m.is_company and m.active)
+    def _get_group_members(self, at_date=None):
+        """Retourne les membres du groupe (index des appartenances), actuels ou à une date"""
+        return self.group_id._get_group_members(at_date=at_date)
     
     def action_view_cotisations(self):
         """Action pour voir les cotisations de ce mois"""
@@ -670,31 +609,25 @@ class MonthlyCotisation(models.Model):
     
     @api.model
     def _cron_auto_close_expired(self):
-        """Cron pour fermer automatiquement les cotisations expirées"""
+        """Cron pour fermer automatiquement les cotisations expirées, par lots"""
         # Fermer les cotisations actives dont la date limite est dépassée de plus de 2 mois
         limit_date = fields.Date.subtract(fields.Date.today(), months=2)
+        body = "Cotisation fermée automatiquement (expirée depuis plus de 2 mois)"
         
-        expired_cotisations = self.search([
-            ('state', '=', 'active'),
-            ('due_date', '<', limit_date)
-        ])
-        
-        for cotisation in expired_cotisations:
-            try:
-                cotisation.write({
-                    'state': 'closed',
-                    'closure_date': fields.Datetime.now()
-                })
-                cotisation.message_post(
-                    body="Cotisation fermée automatiquement (expirée depuis plus de 2 mois)",
-                    message_type='comment'
-                )
-            except Exception as e:
-                _logger.error(f"Erreur lors de la fermeture automatique de {cotisation.display_name}: {e}")
-        
-        if expired_cotisations:
-            _logger.info(f"{len(expired_cotisations)} cotisations mensuelles fermées automatiquement")
-        
+        def close(cotisations):
+            cotisations.write({
+                'state': 'closed',
+                'closure_date': fields.Datetime.now()
+            })
+            cotisations._message_log_batch(bodies=dict.fromkeys(cotisations.ids, body))
+        
+        self.env['cotisation.batch.cron']._run_batched(
+            'monthly_cotisation_auto_close',
+            self._name,
+            [('state', '=', 'active'), ('due_date', '<', limit_date)],
+            close,
+            'contribution_management.cron_auto_close_expired_monthly',
+        )
         return True
     
     @api.model
@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+
+from odoo import models, fields, api
+from itertools import accumulate
+import json
+import logging
+
+_logger = logging.getLogger(__name__)
+
+
+class CotisationAllocationEngine(models.AbstractModel):
+    """Moteur de répartition d'un paiement sur les cotisations ouvertes.
+
+    Les cotisations sont chargées en colonnes (ids, états, échéances,
+    restants) par une seule requête. Les stratégies trient des index et
+    répartissent le montant par sommes cumulées, sans parcourir de
+    recordsets ni recalculer de date par enregistrement.
+    """
+
+    _name = "cotisation.allocation.engine"
+    _description = "Moteur de répartition des paiements"
+
+    OPEN_STATES = ("pending", "partial", "overdue")
+    STATE_PRIORITY = {"overdue": 1000, "partial": 500}
+
+    @api.model
+    def load_columns(self, member_ids=None, cotisation_ids=None, states=OPEN_STATES, remaining_cents=None):
+        """Charge les cotisations ouvertes en colonnes, en une requête.
+
+        Si cotisation_ids est fourni, l'ordre des colonnes suit cet ordre
+        (utilisé par la stratégie manuelle). remaining_cents restreint aux
+        restants dus donnés en centimes (index member_cotisation_remaining_cents_index).
+        """
+        self.env["member.cotisation"].flush_model(
+            ["member_id", "state", "due_date", "amount_due", "amount_paid", "active"]
+        )
+
+        conditions = ["c.active = TRUE", "c.state IN %s", "c.amount_due > c.amount_paid"]
+        params = [tuple(states)]
+        if member_ids is not None:
+            conditions.append("c.member_id IN %s")
+            params.append(tuple(member_ids) or (0,))
+        if cotisation_ids is not None:
+            conditions.append("c.id IN %s")
+            params.append(tuple(cotisation_ids) or (0,))
+        if remaining_cents is not None:
+            # Même expression que l'index partiel pour qu'il soit retenu
+            conditions.append("round((c.amount_due - c.amount_paid) * 100) = ANY(%s::numeric[])")
+            params.append(list(remaining_cents))
+
+        # Les conditions sont des constantes internes, seules les valeurs sont paramétrées
+        self.env.cr.execute(
+            f"""
+            SELECT c.id, c.member_id, c.state, c.due_date, c.amount_due - c.amount_paid
+            FROM member_cotisation c
+            WHERE {" AND ".join(conditions)}
+            ORDER BY c.id
+            """,
+            params,
+        )
+        rows = self.env.cr.fetchall()
+
+        if cotisation_ids is not None:
+            position = {cotisation_id: index for index, cotisation_id in enumerate(cotisation_ids)}
+            rows.sort(key=lambda row: position[row[0]])
+
+        ids, member_column, states_column, due_dates, remaining = (
+            [list(column) for column in zip(*rows)] if rows else ([], [], [], [], [])
+        )
+        return {
+            "ids": ids,
+            "member_ids": member_column,
+            "states": states_column,
+            "due_dates": due_dates,
+            "remaining": [float(value) for value in remaining],
+        }
+
+    @api.model
+    def _sort_indexes(self, columns, method):
+        """Ordre de traitement des cotisations selon la stratégie"""
+        indexes = range(len(columns["ids"]))
+        today = fields.Date.today().toordinal()
+        due_ordinals = [
+            due_date.toordinal() if due_date else today for due_date in columns["due_dates"]
+        ]
+
+        if method == "oldest_first":
+            return sorted(indexes, key=due_ordinals.__getitem__)
+
+        if method == "amount_priority":
+            remaining = columns["remaining"]
+            return sorted(indexes, key=lambda i: -remaining[i])
+
+        if method in ("manual", "proportional", "equal"):
+            return list(indexes)
+
+        # auto: retard d'abord, puis partielles, puis ancienneté du retard
+        priorities = [
+            self.STATE_PRIORITY.get(state, 0) + max(today - due_ordinal, 0)
+            for state, due_ordinal in zip(columns["states"], due_ordinals)
+        ]
+        return sorted(indexes, key=lambda i: -priorities[i])
+
+    @api.model
+    def snapshot(self, columns, methods=("auto", "oldest_first", "amount_priority")):
+        """Sérialise les colonnes et leurs ordres de tri pour les réutiliser.
+
+        Les tris sont faits une fois ici; une variation de montant ne refait
+        ensuite que les sommes cumulées.
+        """
+        return json.dumps({
+            "ids": columns["ids"],
+            "member_ids": columns["member_ids"],
+            "states": columns["states"],
+            "due_dates": [fields.Date.to_string(d) if d else None for d in columns["due_dates"]],
+            "remaining": columns["remaining"],
+            "orders": {method: self._sort_indexes(columns, method) for method in methods},
+        })
+
+    @api.model
+    def from_snapshot(self, snapshot):
+        """Colonnes et ordres de tri restaurés depuis snapshot()"""
+        data = json.loads(snapshot)
+        data["due_dates"] = [fields.Date.to_date(d) for d in data["due_dates"]]
+        return data, data.pop("orders")
+
+    @api.model
+    def allocate(self, columns, amount, method="auto", consume=False, order=None):
+        """Répartit un montant et retourne le plan d'allocation.
+
+        Le plan est une liste de dicts (cotisation_id, member_id, amount,
+        remaining_before, remaining_after), dans l'ordre de traitement, et
+        le montant non réparti. Avec consume=True, les restants des colonnes
+        sont diminués pour enchaîner plusieurs paiements sur le même état.
+        order: ordre de traitement déjà calculé (voir snapshot()).
+        """
+        remaining = columns["remaining"]
+        if amount <= 0 or not remaining:
+            return [], max(amount, 0.0)
+
+        currency = self.env.company.currency_id
+        if order is None:
+            order = self._sort_indexes(columns, method)
+        ordered_remaining = [remaining[i] for i in order]
+
+        if method == "proportional":
+            ratio = min(amount / sum(ordered_remaining), 1.0)
+            allocations = [currency.round(value * ratio) for value in ordered_remaining]
+            self._settle_remainder(allocations, ordered_remaining, amount, currency)
+        elif method == "equal":
+            share = currency.round(amount / len(ordered_remaining))
+            allocations = [min(share, value) for value in ordered_remaining]
+            self._settle_remainder(allocations, ordered_remaining, amount, currency)
+        else:
+            # Sommes cumulées: chaque cotisation reçoit ce qu'il reste après celles qui la précèdent
+            consumed_before = accumulate(ordered_remaining, initial=0.0)
+            allocations = [
+                max(min(value, amount - before), 0.0)
+                for value, before in zip(ordered_remaining, consumed_before)
+            ]
+
+        plan = []
+        for index, allocation in zip(order, allocations):
+            if allocation <= 0:
+                continue
+            plan.append({
+                "cotisation_id": columns["ids"][index],
+                "member_id": columns["member_ids"][index],
+                "amount": allocation,
+                "remaining_before": remaining[index],
+                "remaining_after": remaining[index] - allocation,
+            })
+            if consume:
+                remaining[index] -= allocation
+
+        leftover = currency.round(amount - sum(line["amount"] for line in plan))
+        return plan, max(leftover, 0.0)
+
+    @api.model
+    def _settle_remainder(self, allocations, ordered_remaining, amount, currency):
+        """Ajuste les parts arrondies pour que leur somme égale min(amount, total restant).
+
+        L'écart (arrondis des parts, parts que les petites cotisations n'ont
+        pu absorber en mode égal) est reporté en partant de la dernière
+        ligne, dans la limite du restant de chaque cotisation.
+        """
+        target = currency.round(min(amount, sum(ordered_remaining)))
+        difference = currency.round(target - sum(allocations))
+        for position in reversed(range(len(allocations))):
+            if currency.is_zero(difference):
+                break
+            if difference > 0:
+                step = min(difference, ordered_remaining[position] - allocations[position])
+            else:
+                step = max(difference, -allocations[position])
+            allocations[position] = currency.round(allocations[position] + step)
+            difference = currency.round(difference - step)
+        return allocations
+
+    @api.model
+    def plan(self, amount, method="auto", member_ids=None, cotisation_ids=None):
+        """Charge les cotisations et répartit le montant en un appel"""
+        columns = self.load_columns(member_ids=member_ids, cotisation_ids=cotisation_ids)
+        return self.allocate(columns, amount, method)
+
+    @api.model
+    def sorted_cotisations(self, cotisations, method="auto"):
+        """Retourne les cotisations ouvertes triées selon la stratégie"""
+        columns = self.load_columns(cotisation_ids=cotisations.ids)
+        order = self._sort_indexes(columns, method)
+        return self.env["member.cotisation"].browse([columns["ids"][i] for i in order])
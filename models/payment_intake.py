@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+
+from odoo import models, fields, api
+from odoo.exceptions import UserError
+from psycopg2 import errors as pg_errors
+import logging
+import time
+
+_logger = logging.getLogger(__name__)
+
+
+class PaymentIntakeBusyError(UserError):
+    """Cotisations ou clé tenues par une autre transaction: la soumission peut être rejouée"""
+
+
+class CotisationPaymentIntakeLink(models.Model):
+    """Rattachement des paiements du registre à leur soumission"""
+
+    _inherit = "cotisation.payment"
+
+    intake_id = fields.Many2one(
+        "cotisation.payment.intake",
+        string="Soumission",
+        index=True,
+        ondelete="set null",
+        readonly=True,
+    )
+
+
+class CotisationPaymentIntake(models.Model):
+    """Point d'entrée unique des paiements soumis par les caisses et les webhooks.
+
+    Chaque soumission porte une clé d'idempotence unique en base: une
+    soumission rejouée (double clic, webhook livré deux fois, transaction
+    rejouée après un conflit de sérialisation) retourne les paiements déjà
+    créés au lieu d'en créer de nouveaux. Les cotisations concernées sont
+    verrouillées dans un ordre stable avant l'enregistrement.
+    """
+
+    _name = "cotisation.payment.intake"
+    _description = "Soumission de paiements"
+    _order = "create_date desc"
+
+    LOCK_ATTEMPTS = 5
+    LOCK_RETRY_DELAY = 0.2
+
+    idempotency_key = fields.Char(string="Clé d'idempotence", required=True, readonly=True)
+    source = fields.Char(string="Source", readonly=True)
+    state = fields.Selection(
+        [("processing", "En cours"), ("done", "Traitée")],
+        string="État",
+        default="processing",
+        required=True,
+        readonly=True,
+    )
+    payment_ids = fields.One2many(
+        "cotisation.payment", "intake_id", string="Paiements", readonly=True
+    )
+    skipped_cotisation_ids = fields.Many2many(
+        "member.cotisation",
+        "cotisation_payment_intake_skipped_rel",
+        "intake_id",
+        "cotisation_id",
+        string="Cotisations ignorées",
+        readonly=True,
+        help="Cotisations verrouillées par une autre caisse lors d'une soumission partielle",
+    )
+
+    _sql_constraints = [
+        (
+            "idempotency_key_unique",
+            "unique(idempotency_key)",
+            "Cette soumission de paiement a déjà été enregistrée.",
+        ),
+    ]
+
+    @api.model
+    def _claim_key(self, idempotency_key, source):
+        """Réserve la clé d'idempotence; retourne (soumission, déjà_traitée)"""
+        existing = self.search([("idempotency_key", "=", idempotency_key)], limit=1)
+        if existing:
+            return existing, True
+
+        try:
+            with self.env.cr.savepoint():
+                intake = self.create({"idempotency_key": idempotency_key, "source": source})
+                intake.flush_recordset()
+        except pg_errors.UniqueViolation:
+            # Une soumission concurrente a pris la clé et vient de se terminer
+            existing = self.search([("idempotency_key", "=", idempotency_key)], limit=1)
+            if not existing:
+                # Invisible depuis l'instantané de cette transaction
+                raise PaymentIntakeBusyError("Cette soumission de paiement est déjà en cours de traitement.")
+            return existing, True
+        return intake, False
+
+    @api.model
+    def _lock_cotisations(self, cotisation_ids, skip_locked=False):
+        """Verrouille les cotisations dans l'ordre des ids.
+
+        NOWAIT (par défaut): échoue vite si une autre caisse tient une des
+        lignes, et la tentative est rejouée quelques fois avec un délai
+        croissant. SKIP LOCKED: ne retient que les lignes disponibles.
+        L'ordre stable des verrous écarte les interblocages.
+        """
+        ids = tuple(sorted(set(cotisation_ids)))
+        if skip_locked:
+            self.env.cr.execute(
+                "SELECT id FROM member_cotisation WHERE id IN %s ORDER BY id FOR UPDATE SKIP LOCKED",
+                (ids,),
+            )
+            return {row[0] for row in self.env.cr.fetchall()}
+
+        for attempt in range(1, self.LOCK_ATTEMPTS + 1):
+            try:
+                with self.env.cr.savepoint():
+                    self.env.cr.execute(
+                        "SELECT id FROM member_cotisation WHERE id IN %s ORDER BY id FOR UPDATE NOWAIT",
+                        (ids,),
+                    )
+                return set(ids)
+            except pg_errors.LockNotAvailable:
+                if attempt == self.LOCK_ATTEMPTS:
+                    raise PaymentIntakeBusyError(
+                        "Ces cotisations sont en cours d'encaissement par une autre caisse. "
+                        "Réessayez dans quelques instants."
+                    )
+                time.sleep(self.LOCK_RETRY_DELAY * attempt)
+        return set()
+
+    @api.model
+    def submit(self, idempotency_key, plan, values=None, source=None, skip_locked=False, on_posted=None,
+               **posting_options):
+        """Enregistre un plan de paiement une seule fois par clé d'idempotence.
+
+        Retourne la soumission; ses payment_ids sont les paiements créés
+        (ou déjà créés lors d'une soumission précédente avec la même clé).
+        Les conflits de sérialisation ne sont pas masqués: le serveur rejoue
+        alors toute la transaction, et la clé garantit qu'aucun paiement
+        n'est créé deux fois. on_posted(soumission), s'il est fourni, est
+        appelé dans la même transaction après l'enregistrement du plan,
+        uniquement lors de la première soumission de la clé.
+        """
+        if not idempotency_key:
+            raise UserError("Une clé d'idempotence est requise pour enregistrer des paiements.")
+
+        intake, already_processed = self._claim_key(idempotency_key, source)
+        if already_processed:
+            _logger.info(f"Soumission {idempotency_key} déjà traitée: paiements existants retournés")
+            return intake
+
+        plan = [line for line in plan if line["amount"] > 0]
+        if plan:
+            locked_ids = self._lock_cotisations(
+                [line["cotisation_id"] for line in plan], skip_locked=skip_locked
+            )
+            skipped_ids = {line["cotisation_id"] for line in plan} - locked_ids
+            plan = [line for line in plan if line["cotisation_id"] in locked_ids]
+
+            values = dict(values or {}, intake_id=intake.id)
+            self.env["cotisation.payment.posting"].post_plan(plan, values, **posting_options)
+
+            if skipped_ids:
+                intake.skipped_cotisation_ids = [(6, 0, list(skipped_ids))]
+                _logger.warning(
+                    f"Soumission {idempotency_key}: {len(skipped_ids)} cotisations verrouillées ignorées"
+                )
+
+        if on_posted:
+            on_posted(intake)
+
+        intake.state = "done"
+        return intake
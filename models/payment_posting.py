@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+
+from odoo import models, fields, api
+from odoo.exceptions import ValidationError
+from collections import defaultdict
+import logging
+
+_logger = logging.getLogger(__name__)
+
+
+class CotisationPaymentPosting(models.AbstractModel):
+    """Enregistrement en lot d'un plan d'allocation.
+
+    Un plan (voir cotisation.allocation.engine) est posté en quelques
+    requêtes: verrouillage et contrôle des soldes, création de tous les
+    paiements du registre en un create() avec références réservées par
+    bloc (les soldes suivent par incrément ensembliste) et un message
+    récapitulatif par membre.
+    """
+
+    _name = "cotisation.payment.posting"
+    _description = "Enregistrement en lot des paiements"
+
+    @api.model
+    def _lock_cotisations(self, cotisation_ids):
+        """Verrouille les cotisations et retourne leurs soldes courants"""
+        self.env["member.cotisation"].flush_model(["amount_due", "amount_paid", "member_id"])
+        self.env.cr.execute(
+            """
+            SELECT id, member_id, amount_due, amount_paid
+            FROM member_cotisation
+            WHERE id IN %s
+            FOR UPDATE
+            """,
+            (tuple(cotisation_ids),),
+        )
+        return {
+            row[0]: {"member_id": row[1], "amount_due": float(row[2]), "amount_paid": float(row[3])}
+            for row in self.env.cr.fetchall()
+        }
+
+    @api.model
+    def post_plan(self, plan, values=None, cotisation_note=None, message_subject="Paiement enregistré",
+                  post_summary=True):
+        """Poste un plan d'allocation et retourne les paiements créés.
+
+        plan: liste de dicts avec au moins cotisation_id et amount, et
+        éventuellement des valeurs propres à la ligne sous la clé "values".
+        values: valeurs communes à tous les paiements (date, méthode,
+        référence, notes, échéance...).
+        cotisation_note: note ajoutée aux notes de paiement des cotisations.
+        post_summary: à désactiver si l'appelant publie son propre récapitulatif.
+        """
+        plan = [line for line in plan if line["amount"] > 0]
+        if not plan:
+            return self.env["cotisation.payment"]
+
+        values = dict(values or {})
+        values.setdefault("payment_date", fields.Date.today())
+        currency = self.env.company.currency_id
+
+        amounts = defaultdict(float)
+        for line in plan:
+            amounts[line["cotisation_id"]] += line["amount"]
+
+        balances = self._lock_cotisations(amounts)
+        errors = []
+        for cotisation_id, amount in amounts.items():
+            balance = balances.get(cotisation_id)
+            if balance is None:
+                errors.append(f"Cotisation {cotisation_id} introuvable")
+            elif currency.compare_amounts(balance["amount_paid"] + amount, balance["amount_due"]) > 0:
+                errors.append(
+                    f"Cotisation {cotisation_id}: {amount:.2f} dépasse le restant dû "
+                    f"({balance['amount_due'] - balance['amount_paid']:.2f})"
+                )
+        if errors:
+            raise ValidationError(
+                "Le plan de paiement ne peut pas être enregistré:\n" + "\n".join(errors)
+            )
+
+        # Un seul create, références réservées par bloc, sans suivi par paiement.
+        # Le registre répercute les montants sur les soldes en une requête.
+        payments = self.env["cotisation.payment"].with_context(
+            tracking_disable=True, mail_create_nolog=True, mail_notrack=True
+        ).create([
+            dict(
+                values,
+                cotisation_id=line["cotisation_id"],
+                member_id=balances[line["cotisation_id"]]["member_id"],
+                amount=line["amount"],
+                state="confirmed",
+                **line.get("values", {}),
+            )
+            for line in plan
+        ])
+
+        if cotisation_note:
+            self._append_cotisation_notes(list(amounts), cotisation_note)
+        if post_summary:
+            self._post_member_summaries(payments, message_subject)
+
+        _logger.info(
+            f"Paiements en lot: {len(payments)} paiements sur {len(amounts)} cotisations "
+            f"pour un total de {sum(amounts.values()):.2f}"
+        )
+        return payments
+
+    @api.model
+    def _append_cotisation_notes(self, cotisation_ids, note):
+        """Ajoute la note aux notes de paiement des cotisations, en une requête"""
+        self.env["member.cotisation"].flush_model(["payment_notes"])
+        self.env.cr.execute(
+            """
+            UPDATE member_cotisation
+            SET payment_notes = CASE
+                WHEN COALESCE(payment_notes, '') = '' THEN %s
+                ELSE payment_notes || E'\n---\n' || %s
+            END
+            WHERE id IN %s
+            """,
+            (note, note, tuple(cotisation_ids)),
+        )
+        self.env["member.cotisation"].browse(cotisation_ids).invalidate_recordset(["payment_notes"])
+
+    @api.model
+    def _post_member_summaries(self, payments, subject):
+        """Un message récapitulatif par membre, créés en une fois"""
+        lines_by_member = defaultdict(list)
+        for payment in payments:
+            lines_by_member[payment.member_id.id].append(payment)
+
+        bodies = {}
+        for member_id, member_payments in lines_by_member.items():
+            currency = member_payments[0].currency_id
+            total = sum(payment.amount for payment in member_payments)
+            items = "".join(
+                f"<li>{payment.name} - {payment.cotisation_id.display_name}: "
+                f"{payment.amount:.2f} {currency.symbol}</li>"
+                for payment in member_payments
+            )
+            bodies[member_id] = (
+                f"<p><strong>{subject}</strong></p>"
+                f"<p>Montant total: {total:.2f} {currency.symbol} "
+                f"({len(member_payments)} paiement(s))</p>"
+                f"<ul>{items}</ul>"
+            )
+
+        self.env["res.partner"].browse(list(bodies))._message_log_batch(bodies=bodies)
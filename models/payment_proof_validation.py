@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+
+from odoo import models, fields, api
+from odoo.exceptions import UserError
+import hashlib
+import logging
+
+_logger = logging.getLogger(__name__)
+
+
+class CotisationPaymentProofValidation(models.AbstractModel):
+    """Validation et rejet des justificatifs de paiement par lots.
+
+    Un lot de justificatifs est traité en une transaction: contrôle des
+    droits une fois, plafonnement au restant dû de chaque cotisation,
+    paiements enregistrés par une seule soumission (idempotente) au
+    registre, puis une écriture d'état, un message de suivi et une
+    notification groupée pour tout le lot. La file de revue est la vue
+    kanban des justificatifs en attente (miniatures servies par /web/image).
+    """
+
+    _name = "cotisation.payment.proof.validation"
+    _description = "Validation en lot des justificatifs"
+
+    PENDING_STATES = ("submitted", "under_review")
+
+    @api.model
+    def _check_validator(self):
+        """Contrôle des droits de validation, une fois par lot"""
+        if not self.env.user.has_group("contribution_management.group_cotisation_manager"):
+            raise UserError("Vous n'avez pas les droits pour valider ces justificatifs.")
+
+    @api.model
+    def validate(self, proofs, notes=None):
+        """Valide un lot de justificatifs et enregistre leurs paiements.
+
+        Retourne un dict: validated (justificatifs validés), total (montant
+        enregistré) et skipped ({id: raison} des justificatifs écartés).
+        """
+        self._check_validator()
+        Payment = self.env["cotisation.payment"]
+
+        proofs = proofs.exists().sorted("id")
+        skipped = {
+            proof.id: "Ce justificatif ne peut pas être validé dans son état actuel."
+            for proof in proofs
+            if proof.state not in self.PENDING_STATES
+        }
+
+        remaining_by_cotisation = {}
+        accepted = proofs.browse()
+        plan = []
+        for proof in proofs.filtered(lambda p: p.state in self.PENDING_STATES):
+            cotisation = proof.cotisation_id
+            if cotisation.state in ("paid", "cancelled"):
+                skipped[proof.id] = "Cette cotisation ne peut plus recevoir de paiement."
+                continue
+
+            # Plusieurs justificatifs d'une même cotisation se partagent son restant dû
+            remaining = remaining_by_cotisation.setdefault(cotisation.id, cotisation.remaining_amount)
+            amount = min(proof.amount, remaining)
+            if amount <= 0:
+                skipped[proof.id] = "Le restant dû de cette cotisation est déjà couvert."
+                continue
+            remaining_by_cotisation[cotisation.id] = remaining - amount
+
+            accepted |= proof
+            plan.append({
+                "cotisation_id": cotisation.id,
+                "amount": amount,
+                "values": {
+                    "payment_date": proof.payment_date,
+                    "payment_method": Payment._map_payment_method(proof.payment_method),
+                    "reference": proof.reference or f"PROOF-{proof.id}",
+                    "notes": f"Paiement validé via justificatif #{proof.id}",
+                    "currency_id": cotisation.currency_id.id,
+                },
+            })
+
+        if not accepted:
+            return {"validated": accepted, "total": 0.0, "skipped": skipped}
+
+        # La clé dérive des justificatifs acceptés et de leur dernière
+        # modification: une validation rejouée (double clic, transaction
+        # rejouée) ne crée aucun paiement en double, mais un justificatif
+        # remis en attente puis revalidé produit une nouvelle clé
+        key = hashlib.sha1(
+            ",".join(f"{proof.id}@{proof.write_date}" for proof in accepted).encode()
+        ).hexdigest()
+        self.env["cotisation.payment.intake"].submit(
+            f"proof_validation:{key}",
+            plan,
+            source="proof_validation",
+            message_subject="Justificatifs de paiement validés",
+        )
+
+        accepted.write({
+            "state": "validated",
+            "validation_date": fields.Datetime.now(),
+            "validator_id": self.env.user.id,
+            "validation_notes": notes or "Justificatif validé et paiement enregistré automatiquement",
+        })
+        accepted._message_log_batch(bodies={
+            proof.id: f"Justificatif validé et paiement de {proof.amount} {proof.currency_id.symbol} "
+                      f"enregistré par {self.env.user.name}"
+            for proof in accepted
+        })
+        accepted._notify_member_validation()
+
+        total = sum(line["amount"] for line in plan)
+        _logger.info(
+            f"Validation en lot: {len(accepted)} justificatifs validés ({total:.2f}), "
+            f"{len(skipped)} écartés"
+        )
+        return {"validated": accepted, "total": total, "skipped": skipped}
+
+    @api.model
+    def reject(self, proofs, reason, notes, notify=True):
+        """Rejette un lot de justificatifs en une écriture et une notification groupée"""
+        proofs = proofs.exists().filtered(lambda p: p.state in self.PENDING_STATES)
+        if not proofs:
+            return proofs
+
+        proofs.write({
+            "state": "rejected",
+            "rejection_date": fields.Datetime.now(),
+            "validator_id": self.env.user.id,
+            "rejection_reason": reason,
+            "validation_notes": notes,
+        })
+
+        reason_label = dict(proofs._fields["rejection_reason"].selection)[reason]
+        body = f"Justificatif rejeté par {self.env.user.name}. Raison: {reason_label}"
+        proofs._message_log_batch(bodies={proof.id: body for proof in proofs})
+
+        if notify:
+            proofs._notify_member_rejection()
+
+        _logger.info(f"Rejet en lot: {len(proofs)} justificatifs rejetés ({reason})")
+        return proofs
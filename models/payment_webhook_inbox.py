@@ -0,0 +1,273 @@
+# -*- coding: utf-8 -*-
+
+from odoo import models, fields, api
+from psycopg2 import errors as pg_errors
+from .payment_intake import PaymentIntakeBusyError
+import json
+import logging
+
+_logger = logging.getLogger(__name__)
+
+
+class CotisationWebhookInbox(models.Model):
+    """Boîte de réception des notifications de paiement des opérateurs.
+
+    Le webhook enregistre la notification brute et répond immédiatement.
+    Le cron de la boîte traite ensuite les notifications par lots, dans
+    l'ordre d'arrivée: une seule recherche des justificatifs par lot,
+    validation et enregistrement des paiements en bloc, et un résultat
+    consigné pour chaque notification.
+    """
+
+    _name = "cotisation.webhook.inbox"
+    _description = "Notifications de paiement reçues"
+    _order = "id"
+
+    BATCH_SIZE = 500
+    MAX_RETRIES = 5
+    AMOUNT_TOLERANCE = 0.01
+
+    provider = fields.Char(string="Opérateur", required=True, index=True, readonly=True)
+    transaction_ref = fields.Char(string="Transaction", index=True, readonly=True)
+    external_ref = fields.Char(string="Référence externe", readonly=True)
+    amount = fields.Float(string="Montant", readonly=True)
+    operator_status = fields.Char(string="Statut opérateur", readonly=True)
+    payload = fields.Text(string="Contenu brut", readonly=True)
+    state = fields.Selection(
+        [
+            ("received", "Reçue"),
+            ("processed", "Traitée"),
+            ("ignored", "Ignorée"),
+            ("failed", "En échec"),
+        ],
+        string="État",
+        default="received",
+        required=True,
+        index=True,
+        readonly=True,
+    )
+    result_message = fields.Char(string="Résultat", readonly=True)
+    retry_count = fields.Integer(string="Tentatives", default=0, readonly=True)
+    processed_date = fields.Datetime(string="Date de traitement", readonly=True)
+    proof_id = fields.Many2one(
+        "cotisation.payment.proof", string="Justificatif", readonly=True, ondelete="set null"
+    )
+
+    @api.model
+    def receive(self, provider, post):
+        """Enregistre une notification brute et réveille le traitement"""
+        try:
+            amount = float(post.get("amount") or 0)
+        except (TypeError, ValueError):
+            amount = 0.0
+
+        notification = self.sudo().create({
+            "provider": provider,
+            "transaction_ref": post.get("transaction_id"),
+            "external_ref": post.get("external_ref"),
+            "amount": amount,
+            "operator_status": post.get("status"),
+            "payload": json.dumps(post, default=str),
+        })
+
+        cron = self.env.ref("contribution_management.cron_process_webhook_inbox", False)
+        if cron:
+            cron.sudo()._trigger()
+        return notification
+
+    def _set_outcome(self, state, message, proof_by_notification=None):
+        """Consigne le résultat; une écriture par lot de même résultat"""
+        if not self:
+            return
+        now = fields.Datetime.now()
+        if not proof_by_notification:
+            self.write({"state": state, "result_message": message, "processed_date": now})
+            return
+        for notification in self:
+            notification.write({
+                "state": state,
+                "result_message": message,
+                "processed_date": now,
+                "proof_id": proof_by_notification.get(notification.id),
+            })
+
+    def _defer_retry(self, reason):
+        """Laisse la notification en attente pour le prochain passage (erreur passagère)"""
+        for notification in self:
+            retry_count = notification.retry_count + 1
+            if retry_count >= self.MAX_RETRIES:
+                notification.write({
+                    "state": "failed",
+                    "retry_count": retry_count,
+                    "result_message": f"Abandon après {retry_count} tentatives: {reason}"[:250],
+                    "processed_date": fields.Datetime.now(),
+                })
+            else:
+                notification.write({
+                    "retry_count": retry_count,
+                    "result_message": f"Nouvel essai prévu: {reason}"[:250],
+                })
+
+    def _process_individually(self, provider):
+        """Rejoue un lot en échec notification par notification.
+
+        Une notification invalide n'échoue que seule; un verrou ou un
+        conflit passager la laisse reçue pour le prochain passage.
+        """
+        for notification in self:
+            try:
+                with self.env.cr.savepoint():
+                    getattr(notification, f"_process_{provider}")()
+            except (PaymentIntakeBusyError, pg_errors.OperationalError) as e:
+                self.env.invalidate_all()
+                notification._defer_retry(str(e))
+            except Exception as e:
+                _logger.error(f"Boîte webhooks: échec de la notification {notification.id}: {e}", exc_info=True)
+                self.env.invalidate_all()
+                notification._set_outcome("failed", str(e)[:250])
+
+    def _process_mobile_money(self):
+        """Traite un lot de notifications Mobile Money"""
+        Proof = self.env["cotisation.payment.proof"]
+
+        invalid = self.filtered(
+            lambda n: n.operator_status != "successful" or not n.transaction_ref or n.amount <= 0
+        )
+        invalid._set_outcome("ignored", "Notification non exploitable (statut, référence ou montant)")
+        candidates = self - invalid
+
+        # Une seule recherche pour tout le lot, servie par l'index référence + méthode
+        refs = list(set(candidates.mapped("transaction_ref")))
+        proofs_by_ref = {}
+        for proof in Proof.search(
+            [
+                ("reference", "in", refs),
+                ("payment_method", "=", "mobile_money"),
+                ("state", "in", ["submitted", "under_review"]),
+            ],
+            order="id",
+        ):
+            proofs_by_ref.setdefault(proof.reference, proof)
+
+        # Références déjà enregistrées au registre (notifications rejouées)
+        self.env["cotisation.payment"].flush_model(["reference", "payment_method", "state"])
+        self.env.cr.execute(
+            """
+            SELECT DISTINCT reference FROM cotisation_payment
+            WHERE payment_method = 'mobile' AND state = 'confirmed' AND reference = ANY(%s)
+            """,
+            (refs,),
+        )
+        already_recorded = {row[0] for row in self.env.cr.fetchall()}
+
+        duplicates = self.browse()
+        unmatched = self.browse()
+        mismatched = self.browse()
+        accepted = self.browse()
+        seen_refs = set()
+        remaining_by_cotisation = {}
+        plan = []
+        proof_by_notification = {}
+
+        for notification in candidates:
+            ref = notification.transaction_ref
+            if ref in seen_refs or ref in already_recorded:
+                duplicates |= notification
+                continue
+            seen_refs.add(ref)
+
+            proof = proofs_by_ref.get(ref)
+            if not proof:
+                unmatched |= notification
+                continue
+            if abs(proof.amount - notification.amount) >= self.AMOUNT_TOLERANCE:
+                mismatched |= notification
+                continue
+
+            cotisation = proof.cotisation_id
+            remaining = remaining_by_cotisation.setdefault(cotisation.id, cotisation.remaining_amount)
+            amount = min(notification.amount, remaining)
+            remaining_by_cotisation[cotisation.id] = remaining - amount
+
+            accepted |= notification
+            proof_by_notification[notification.id] = proof.id
+            if amount > 0:
+                plan.append({
+                    "cotisation_id": cotisation.id,
+                    "amount": amount,
+                    "values": {
+                        "reference": ref,
+                        "notes": f"Paiement validé via justificatif #{proof.id} (webhook Mobile Money)",
+                        "currency_id": cotisation.currency_id.id,
+                    },
+                })
+
+        duplicates._set_outcome("ignored", "Transaction déjà traitée")
+        unmatched._set_outcome("ignored", "Aucun justificatif en attente pour cette référence")
+        mismatched._set_outcome("ignored", "Montant différent du justificatif")
+
+        if not accepted:
+            return
+
+        proofs = Proof.browse(list(proof_by_notification.values()))
+        proofs.write({
+            "state": "validated",
+            "validation_date": fields.Datetime.now(),
+            "validation_notes": "Validation automatique via webhook Mobile Money",
+        })
+        for notification in accepted.filtered("external_ref"):
+            Proof.browse(proof_by_notification[notification.id]).external_reference = notification.external_ref
+
+        # Toutes les écritures du lot en un seul enregistrement, idempotent par lot
+        self.env["cotisation.payment.intake"].submit(
+            f"webhook_inbox:{accepted[0].id}-{accepted[-1].id}",
+            plan,
+            {"payment_method": "mobile"},
+            source="mobile_money_webhook",
+            message_subject="Paiement Mobile Money validé",
+        )
+        proofs._notify_member_validation()
+        accepted._set_outcome("processed", "Justificatif validé et paiement enregistré", proof_by_notification)
+
+    @api.model
+    def _cron_process_inbox(self, batch_size=None):
+        """Cron: vide la boîte par lots et se relance s'il en reste"""
+        batch_size = batch_size or self.BATCH_SIZE
+
+        # SKIP LOCKED: deux workers ne traitent jamais la même notification
+        self.env.cr.execute(
+            """
+            SELECT id FROM cotisation_webhook_inbox
+            WHERE state = 'received'
+            ORDER BY id
+            LIMIT %s
+            FOR UPDATE SKIP LOCKED
+            """,
+            (batch_size + 1,),
+        )
+        ids = [row[0] for row in self.env.cr.fetchall()]
+        has_more = len(ids) > batch_size
+        notifications = self.browse(ids[:batch_size])
+
+        for provider in set(notifications.mapped("provider")):
+            batch = notifications.filtered(lambda n: n.provider == provider)
+            handler = getattr(batch, f"_process_{provider}", None)
+            if not handler:
+                batch._set_outcome("failed", f"Opérateur non pris en charge: {provider}")
+                continue
+            try:
+                with self.env.cr.savepoint():
+                    handler()
+            except Exception as e:
+                _logger.warning(f"Boîte webhooks: échec du lot {provider}, traitement unitaire: {e}")
+                self.env.invalidate_all()
+                batch._process_individually(provider)
+
+        if notifications:
+            _logger.info(f"Boîte webhooks: {len(notifications)} notifications traitées")
+
+        if has_more:
+            cron = self.env.ref("contribution_management.cron_process_webhook_inbox", False)
+            if cron:
+                cron._trigger()
+        return True
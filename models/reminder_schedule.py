@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+
+from odoo import models, fields, api
+from odoo.tools import create_index
+import logging
+
+_logger = logging.getLogger(__name__)
+
+
+class CotisationReminderSchedule(models.Model):
+    """File des campagnes de rappels programmées.
+
+    L'assistant de rappel enregistre ici la campagne (message, canal,
+    options et cotisations ciblées) au lieu de créer une tâche cron. Un
+    seul cron prend les campagnes échues par lots, les envoie via l'envoi
+    groupé de l'assistant, consigne le résultat par destinataire puis
+    archive les campagnes terminées.
+    """
+
+    _name = "cotisation.reminder.schedule"
+    _description = "Campagne de rappels programmée"
+    _order = "scheduled_at, id"
+
+    BATCH_SIZE = 20
+    # Statuts qui justifient encore un rappel au moment de l'envoi
+    UNPAID_STATES = ["pending", "partial", "overdue"]
+
+    name = fields.Char(string="Campagne", required=True, readonly=True)
+    active = fields.Boolean(default=True)
+    scheduled_at = fields.Datetime(string="Envoi prévu le", required=True, readonly=True)
+    state = fields.Selection(
+        [
+            ("pending", "Programmée"),
+            ("done", "Envoyée"),
+            ("failed", "En échec"),
+            ("cancelled", "Annulée"),
+        ],
+        string="État",
+        default="pending",
+        required=True,
+        readonly=True,
+    )
+
+    # Paramètres de la campagne, repris de l'assistant
+    cotisation_ids = fields.Many2many(
+        "member.cotisation",
+        "cotisation_reminder_schedule_cotisation_rel",
+        "schedule_id",
+        "cotisation_id",
+        string="Cotisations",
+        readonly=True,
+    )
+    reminder_type = fields.Selection(
+        [
+            ("first", "Premier rappel"),
+            ("second", "Rappel de relance"),
+            ("final", "Rappel final"),
+            ("custom", "Rappel personnalisé"),
+        ],
+        string="Type de rappel",
+        required=True,
+        readonly=True,
+    )
+    send_method = fields.Selection(
+        [
+            ("email", "Email"),
+            ("sms", "SMS"),
+            ("both", "Email et SMS"),
+            ("internal", "Message interne uniquement"),
+        ],
+        string="Méthode d'envoi",
+        required=True,
+        readonly=True,
+    )
+    subject = fields.Char(string="Sujet", required=True, readonly=True)
+    message_body = fields.Html(string="Corps du message", required=True, readonly=True)
+    mark_as_reminded = fields.Boolean(string="Marquer comme rappelé", readonly=True)
+    create_activity_followup = fields.Boolean(string="Créer une activité de suivi", readonly=True)
+    followup_days = fields.Integer(string="Jours avant suivi", readonly=True)
+    user_id = fields.Many2one(
+        "res.users", string="Programmée par", default=lambda self: self.env.user, readonly=True
+    )
+    company_id = fields.Many2one(
+        "res.company", string="Société", default=lambda self: self.env.company, readonly=True
+    )
+    currency_id = fields.Many2one(
+        "res.currency",
+        string="Devise",
+        default=lambda self: self.env.company.currency_id,
+        readonly=True,
+    )
+
+    # Résultat
+    sent_at = fields.Datetime(string="Envoyée le", readonly=True)
+    members_reached = fields.Integer(string="Membres relancés", readonly=True)
+    members_missed = fields.Integer(string="Membres non joints", readonly=True)
+    outcomes = fields.Json(
+        string="Résultats par destinataire",
+        readonly=True,
+        help="{membre: {canal: statut}} tel que retourné par l'envoi groupé",
+    )
+    result_message = fields.Char(string="Résultat", readonly=True)
+
+    def init(self):
+        create_index(
+            self.env.cr,
+            "cotisation_reminder_schedule_due_index",
+            self._table,
+            ["scheduled_at"],
+            where="state = 'pending'",
+        )
+
+    @api.model
+    def schedule(self, wizard, cotisations):
+        """Enregistre une campagne de l'assistant et réveille le cron à l'heure prévue"""
+        campaign = self.create({
+            "name": f"Rappels programmés - {wizard.reminder_type}",
+            "scheduled_at": wizard.scheduled_date,
+            "cotisation_ids": [(6, 0, cotisations.ids)],
+            "reminder_type": wizard.reminder_type,
+            "send_method": wizard.send_method,
+            "subject": wizard.subject,
+            "message_body": wizard.message_body,
+            "mark_as_reminded": wizard.mark_as_reminded,
+            "create_activity_followup": wizard.create_activity_followup,
+            "followup_days": wizard.followup_days,
+            "company_id": wizard.company_id.id,
+            "currency_id": wizard.currency_id.id,
+        })
+        cron = self.env.ref("contribution_management.cron_process_reminder_schedule", False)
+        if cron:
+            cron.sudo()._trigger(at=campaign.scheduled_at)
+        return campaign
+
+    def action_cancel(self):
+        """Annule les campagnes encore programmées"""
+        self.filtered(lambda c: c.state == "pending").write({"state": "cancelled", "active": False})
+
+    def _run(self):
+        """Envoie la campagne via l'envoi groupé de l'assistant"""
+        self.ensure_one()
+        cotisations = self.cotisation_ids.filtered(
+            lambda c: c.active and c.state in self.UNPAID_STATES
+        )
+        if not cotisations:
+            return {}, "Aucune cotisation impayée au moment de l'envoi"
+
+        sender = self.env["cotisation.reminder.wizard"].with_user(self.user_id).with_company(
+            self.company_id
+        ).create({
+            "cotisation_ids": [(6, 0, cotisations.ids)],
+            "reminder_type": self.reminder_type,
+            "send_method": self.send_method,
+            "subject": self.subject,
+            "message_body": self.message_body,
+            "mark_as_reminded": self.mark_as_reminded,
+            "create_activity_followup": self.create_activity_followup,
+            "followup_days": self.followup_days,
+            "company_id": self.company_id.id,
+            "currency_id": self.currency_id.id,
+        })
+        outcomes = sender._dispatch_reminders(cotisations)
+        return outcomes, f"{len(cotisations)} cotisations relancées"
+
+    @api.model
+    def _cron_process_reminder_schedule(self, batch_size=None):
+        """Cron: envoie les campagnes échues par lots et se relance s'il en reste"""
+        batch_size = batch_size or self.BATCH_SIZE
+
+        # SKIP LOCKED: deux workers n'envoient jamais la même campagne
+        self.env.cr.execute(
+            """
+            SELECT id FROM cotisation_reminder_schedule
+            WHERE state = 'pending' AND scheduled_at <= %s
+            ORDER BY scheduled_at, id
+            LIMIT %s
+            FOR UPDATE SKIP LOCKED
+            """,
+            (fields.Datetime.now(), batch_size + 1),
+        )
+        ids = [row[0] for row in self.env.cr.fetchall()]
+        has_more = len(ids) > batch_size
+        campaigns = self.browse(ids[:batch_size])
+
+        for campaign in campaigns:
+            try:
+                with self.env.cr.savepoint():
+                    outcomes, message = campaign._run()
+                reached = sum(1 for result in outcomes.values() if "sent" in result.values())
+                campaign.write({
+                    "state": "done",
+                    "active": False,
+                    "sent_at": fields.Datetime.now(),
+                    "members_reached": reached,
+                    "members_missed": len(outcomes) - reached,
+                    "outcomes": outcomes,
+                    "result_message": message,
+                })
+            except Exception as e:
+                _logger.error(f"Rappels programmés: échec de la campagne {campaign.id}: {e}", exc_info=True)
+                self.env.invalidate_all()
+                campaign.write({"state": "failed", "result_message": str(e)[:250]})
+
+        if campaigns:
+            _logger.info(f"Rappels programmés: {len(campaigns)} campagnes traitées")
+
+        if has_more:
+            cron = self.env.ref("contribution_management.cron_process_reminder_schedule", False)
+            if cron:
+                cron._trigger()
+        return True
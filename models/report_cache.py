@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+
+from odoo import models, fields, api
+from odoo.exceptions import UserError
+import logging
+import base64
+import hashlib
+
+_logger = logging.getLogger(__name__)
+
+
+class CotisationReportCache(models.Model):
+    """Cache des rapports PDF indexé par l'empreinte des données sources"""
+
+    _name = "cotisation.report.cache"
+    _description = "Cache des rapports PDF"
+    _order = "last_access_date desc"
+
+    report_ref = fields.Char(string="Rapport", required=True, index=True)
+    partner_id = fields.Many2one(
+        "res.partner",
+        string="Partenaire",
+        required=True,
+        index=True,
+        ondelete="cascade",
+    )
+    fingerprint = fields.Char(string="Empreinte", required=True)
+    attachment_id = fields.Many2one(
+        "ir.attachment", string="Fichier PDF", ondelete="cascade"
+    )
+    hit_count = fields.Integer(string="Utilisations", default=0)
+    last_access_date = fields.Datetime(
+        string="Dernier accès", default=fields.Datetime.now
+    )
+
+    _sql_constraints = [
+        (
+            "report_partner_unique",
+            "unique(report_ref, partner_id)",
+            "Une seule entrée de cache est autorisée par rapport et partenaire.",
+        ),
+    ]
+
+    @api.model
+    def _get_template_version(self, report):
+        """Version du template: dernière modification de l'action et de ses vues QWeb"""
+        self.env.cr.execute(
+            """
+            SELECT MAX(write_date) FROM ir_ui_view WHERE key = %s
+            """,
+            (report.report_name,),
+        )
+        view_date = self.env.cr.fetchone()[0]
+        return f"{report.write_date}|{view_date}"
+
+    @api.model
+    def _compute_fingerprints(self, report_ref, partners):
+        """Calcule l'empreinte de chaque partenaire en une requête par type.
+
+        Les membres sont rattachés à leurs cotisations par member_id, les
+        groupes par group_id. L'empreinte combine la date de modification du
+        partenaire, celles des cotisations et des paiements, ainsi que la
+        version du template.
+        """
+        report = self.env.ref(report_ref)
+        template_version = self._get_template_version(report)
+        rows = {}
+
+        for column, subset in (
+            ("member_id", partners.filtered(lambda p: not p.is_company)),
+            ("group_id", partners.filtered("is_company")),
+        ):
+            if not subset:
+                continue
+            # column est une constante interne, jamais une saisie utilisateur
+            self.env.cr.execute(
+                f"""
+                SELECT p.id, p.write_date,
+                       COUNT(DISTINCT c.id), MAX(c.write_date),
+                       COUNT(pay.id), MAX(pay.write_date)
+                FROM res_partner p
+                LEFT JOIN member_cotisation c ON c.{column} = p.id
+                LEFT JOIN cotisation_payment pay ON pay.cotisation_id = c.id
+                WHERE p.id IN %s
+                GROUP BY p.id, p.write_date
+                """,
+                (tuple(subset.ids),),
+            )
+            for row in self.env.cr.fetchall():
+                rows[row[0]] = row[1:]
+
+        fingerprints = {}
+        for partner_id, values in rows.items():
+            payload = "|".join([report_ref, template_version] + [str(v) for v in values])
+            fingerprints[partner_id] = hashlib.sha256(payload.encode()).hexdigest()
+        return fingerprints
+
+    def _get_attachment_name(self, report, partner):
+        """Nom du fichier PDF mis en cache"""
+        safe_name = partner.name.replace("/", "_").replace("\\", "_")[:50]
+        return f"{report.name.replace(' ', '_')}_{safe_name}.pdf"
+
+    @api.model
+    def get_report_attachments(self, report_ref, partners):
+        """Retourne {partner_id: ir.attachment} en ne rendant que les rapports périmés"""
+        if not partners:
+            return {}
+
+        report = self.env.ref(report_ref)
+        fingerprints = self._compute_fingerprints(report_ref, partners)
+        entries = {
+            entry.partner_id.id: entry
+            for entry in self.search(
+                [("report_ref", "=", report_ref), ("partner_id", "in", partners.ids)]
+            )
+        }
+
+        result = {}
+        hits = self.browse()
+        replaced = self.env["ir.attachment"]
+        now = fields.Datetime.now()
+
+        for partner in partners:
+            fingerprint = fingerprints.get(partner.id)
+            entry = entries.get(partner.id)
+
+            if entry and entry.attachment_id and entry.fingerprint == fingerprint:
+                hits |= entry
+                result[partner.id] = entry.attachment_id
+                continue
+
+            try:
+                pdf_content, _ = self.env["ir.actions.report"]._render_qweb_pdf(
+                    report_ref, [partner.id]
+                )
+            except Exception as e:
+                _logger.error(f"Erreur lors du rendu du rapport pour {partner.name}: {e}")
+                continue
+
+            attachment_vals = {
+                "name": self._get_attachment_name(report, partner),
+                "type": "binary",
+                "datas": base64.b64encode(pdf_content),
+                "res_model": "res.partner",
+                "res_id": partner.id,
+                "mimetype": "application/pdf",
+            }
+
+            # Toujours une nouvelle pièce jointe: l'ancienne peut être liée à
+            # des emails en file ou envoyés et ne doit pas changer de contenu
+            attachment = self.env["ir.attachment"].create(attachment_vals)
+            if entry:
+                replaced |= entry.attachment_id
+                entry.write({
+                    "fingerprint": fingerprint,
+                    "attachment_id": attachment.id,
+                    "last_access_date": now,
+                })
+            else:
+                entry = self.create({
+                    "report_ref": report_ref,
+                    "partner_id": partner.id,
+                    "fingerprint": fingerprint,
+                    "attachment_id": attachment.id,
+                })
+
+            result[partner.id] = entry.attachment_id
+
+        if hits:
+            # Une seule requête pour tracer les accès en cache
+            self.env.cr.execute(
+                """
+                UPDATE cotisation_report_cache
+                SET hit_count = hit_count + 1, last_access_date = %s
+                WHERE id IN %s
+                """,
+                (now, tuple(hits.ids)),
+            )
+            hits.invalidate_recordset(["hit_count", "last_access_date"])
+
+        self._release_attachments(replaced)
+
+        _logger.info(
+            f"Cache rapports {report_ref}: {len(hits)} hits, "
+            f"{len(result) - len(hits)} rendus sur {len(partners)} partenaires"
+        )
+        return result
+
+    @api.model
+    def _release_attachments(self, attachments):
+        """Supprime les pièces jointes sorties du cache qui ne sont liées à aucun message.
+
+        Celles jointes à un email (en file ou envoyé) restent en place: le
+        message garde le rapport tel qu'il était au moment de l'envoi.
+        """
+        if not attachments:
+            return
+        self.env.cr.execute(
+            """
+            SELECT DISTINCT attachment_id FROM message_attachment_rel
+            WHERE attachment_id IN %s
+            """,
+            (tuple(attachments.ids),),
+        )
+        linked_ids = {row[0] for row in self.env.cr.fetchall()}
+        attachments.filtered(lambda a: a.id not in linked_ids).unlink()
+
+    @api.model
+    def get_report_attachment(self, report_ref, partner):
+        """Version unitaire de get_report_attachments"""
+        attachment = self.get_report_attachments(report_ref, partner).get(partner.id)
+        if not attachment:
+            raise UserError(f"Impossible de générer le rapport pour {partner.name}.")
+        return attachment
+
+    @api.model
+    def cleanup_stale_entries(self, days=90):
+        """Supprime les entrées non consultées depuis longtemps"""
+        cutoff_date = fields.Datetime.subtract(fields.Datetime.now(), days=days)
+        stale = self.search([("last_access_date", "<", cutoff_date)])
+        attachments = stale.mapped("attachment_id")
+        stale.unlink()
+        self._release_attachments(attachments)
+        _logger.info(f"Cache rapports: {len(stale)} entrées expirées supprimées")
+        return True
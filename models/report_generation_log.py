@@ -2,8 +2,13 @@
 
 from odoo import models, fields, api
 from odoo.exceptions import UserError, ValidationError
+from odoo.tools import config
+from datetime import timedelta
+import hashlib
 import logging
-import base64
+import os
+import tempfile
+import zipfile
 
 _logger = logging.getLogger(__name__)
 class ReportGenerationLog(models.Model):
@@ -44,6 +49,12 @@ class ReportGenerationLog(models.Model):
     email_sent = fields.Boolean(string='Email envoyé', default=False)
     email_count = fields.Integer(string='Emails envoyés', default=0)
 
+    archive_fingerprint = fields.Char(
+        string='Empreinte de l\'archive',
+        readonly=True,
+        help="Empreinte des fichiers contenus dans l'archive ZIP en cache"
+    )
+
     @api.depends('partner_ids')
     def _compute_partner_count(self):
         for log in self:
@@ -67,41 +78,99 @@ class ReportGenerationLog(models.Model):
             raise UserError("Aucun fichier disponible pour téléchargement.")
 
     def _create_zip_archive(self):
-        """Crée une archive ZIP des fichiers"""
+        """Renvoie vers le téléchargement en flux de l'archive ZIP"""
+        self.ensure_one()
+        return {
+            'type': 'ir.actions.act_url',
+            'url': f'/contribution_management/report_log/{self.id}/archive',
+            'target': 'self',
+        }
+
+    def _get_archive_fingerprint(self):
+        """Empreinte des pièces jointes: change dès qu'un fichier est ajouté, retiré ou modifié"""
+        self.ensure_one()
+        payload = "|".join(
+            f"{attachment['id']}:{attachment['checksum']}"
+            for attachment in self.attachment_ids.sudo().read(['checksum'])
+        )
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def _get_archive_directory(self):
+        """Dossier des archives en cache, à côté du filestore de la base"""
+        directory = os.path.join(config.filestore(self.env.cr.dbname), 'report_archives')
+        os.makedirs(directory, exist_ok=True)
+        return directory
+
+    def _get_archive_path(self, fingerprint=None):
+        """Chemin de l'archive en cache pour ce log"""
+        self.ensure_one()
+        fingerprint = fingerprint or self.archive_fingerprint
+        return os.path.join(self._get_archive_directory(), f'log_{self.id}_{fingerprint}.zip')
+
+    def _get_archive_filename(self):
+        """Nom de l'archive proposé au téléchargement"""
+        self.ensure_one()
+        return f'Rapports_{self.name}_{fields.Date.today().strftime("%Y%m%d")}.zip'
+
+    def _build_zip_archive(self):
+        """Construit l'archive ZIP sur disque si elle est absente ou périmée.
+
+        Les fichiers du filestore sont copiés en flux dans l'archive, sans
+        décodage base64 ni chargement complet en mémoire. L'archive est
+        écrite dans un fichier temporaire puis renommée atomiquement.
+        """
+        self.ensure_one()
+        fingerprint = self._get_archive_fingerprint()
+        archive_path = self._get_archive_path(fingerprint)
+
+        if fingerprint == self.archive_fingerprint and os.path.exists(archive_path):
+            return archive_path
+
+        directory = self._get_archive_directory()
+        file_descriptor, temp_path = tempfile.mkstemp(dir=directory, suffix='.zip.tmp')
         try:
-            import zipfile
-            from io import BytesIO
-            
-            zip_buffer = BytesIO()
-            
-            with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-                for attachment in self.attachment_ids:
-                    file_data = base64.b64decode(attachment.datas)
-                    zip_file.writestr(attachment.name, file_data)
-            
-            zip_buffer.seek(0)
-            
-            # Créer une pièce jointe pour l'archive
-            zip_attachment = self.env['ir.attachment'].create({
-                'name': f'Rapports_{self.name}_{fields.Date.today().strftime("%Y%m%d")}.zip',
-                'type': 'binary',
-                'datas': base64.b64encode(zip_buffer.getvalue()),
-                'res_model': 'report.generation.log',
-                'res_id': self.id,
-                'mimetype': 'application/zip'
-            })
-            
-            return {
-                'type': 'ir.actions.act_url',
-                'url': f'/web/content/{zip_attachment.id}?download=true',
-                'target': 'self',
-            }
-            
-        except ImportError:
-            raise UserError("La bibliothèque zipfile n'est pas disponible.")
-        except Exception as e:
-            _logger.error(f"Erreur lors de la création de l'archive ZIP: {e}")
-            raise UserError(f"Erreur lors de la création de l'archive: {e}")
+            with os.fdopen(file_descriptor, 'wb') as archive_file:
+                with zipfile.ZipFile(archive_file, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+                    used_names = set()
+                    for attachment in self.attachment_ids.sudo():
+                        arcname = attachment.name
+                        if arcname in used_names:
+                            arcname = f'{attachment.id}_{arcname}'
+                        used_names.add(arcname)
+
+                        if attachment.store_fname:
+                            zip_file.write(attachment._full_path(attachment.store_fname), arcname)
+                        else:
+                            # Pièce jointe stockée en base: pas de fichier à lire en flux
+                            zip_file.writestr(arcname, attachment.raw or b'')
+            os.replace(temp_path, archive_path)
+        except Exception:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+            raise
+
+        self.sudo().write({'archive_fingerprint': fingerprint})
+        self._remove_archive_files(keep_current=True)
+        _logger.info(f"Archive ZIP construite pour le log {self.id}: {archive_path}")
+        return archive_path
+
+    def _remove_archive_files(self, keep_current=False):
+        """Supprime les archives en cache devenues inutiles"""
+        directory = self._get_archive_directory()
+        for log in self:
+            prefix = f'log_{log.id}_'
+            current = os.path.basename(log._get_archive_path()) if keep_current and log.archive_fingerprint else None
+            for filename in os.listdir(directory):
+                if filename.startswith(prefix) and filename != current:
+                    try:
+                        os.unlink(os.path.join(directory, filename))
+                    except OSError as e:
+                        _logger.warning(f"Impossible de supprimer l'archive {filename}: {e}")
+
+    def unlink(self):
+        """Supprime aussi les archives en cache"""
+        self._remove_archive_files()
+        return super().unlink()
 
     @api.model
     def cleanup_old_logs(self, days=30):
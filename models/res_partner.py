@@ -2,11 +2,62 @@
 
 from odoo import models, fields, api
 from odoo.exceptions import ValidationError, UserError
+from odoo.tools import create_index
+from bisect import bisect_right
+from collections import OrderedDict
+from contextlib import contextmanager
 import logging
+import threading
+import time
 from datetime import datetime, timedelta, date
 
 _logger = logging.getLogger(__name__)
 
+# Bandes de taux des badges kanban (bornes inférieures incluses)
+KANBAN_RATE_BANDS = (50.0, 75.0, 90.0)
+KANBAN_BAND_STYLES = (
+    ("text-bg-danger", "critical"),
+    ("text-bg-warning", "warning"),
+    ("text-bg-info", "good"),
+    ("text-bg-success", "excellent"),
+)
+KANBAN_MEMBER_SUMMARIES = ("🔴 À surveiller", "🟡 Payeur moyen", "🔵 Bon payeur", "🟢 Excellent payeur")
+KANBAN_GROUP_SUMMARIES = (
+    "🔴 Performance faible",
+    "🟡 Performance moyenne",
+    "🔵 Performance correcte",
+    "🟢 Performance excellente",
+)
+KANBAN_INDICATOR_BANDS = (70.0, 85.0, 95.0)
+KANBAN_INDICATORS = ("⚠️", "⭐", "⭐⭐", "⭐⭐⭐")
+
+# Cache des pages kanban formatées, propre au processus
+KANBAN_CACHE_TTL = 300
+KANBAN_CACHE_SIZE = 256
+_kanban_cache = OrderedDict()
+_kanban_cache_lock = threading.Lock()
+
+
+def _kanban_cache_get(key):
+    with _kanban_cache_lock:
+        entry = _kanban_cache.get(key)
+        if not entry:
+            return None
+        stored_at, rows = entry
+        if time.monotonic() - stored_at > KANBAN_CACHE_TTL:
+            del _kanban_cache[key]
+            return None
+        _kanban_cache.move_to_end(key)
+        return rows
+
+
+def _kanban_cache_put(key, rows):
+    with _kanban_cache_lock:
+        _kanban_cache[key] = (time.monotonic(), rows)
+        _kanban_cache.move_to_end(key)
+        while len(_kanban_cache) > KANBAN_CACHE_SIZE:
+            _kanban_cache.popitem(last=False)
+
 
 class MemberAllocationConfigWizard(models.TransientModel):
     """Assistant de configuration globale de l'allocation pour un membre"""
@@ -115,22 +166,14 @@ class MemberAllocationConfigWizard(models.TransientModel):
 
         # Mettre à jour les échéances existantes si demandé
         if self.update_existing_installments:
-            for installment in installments:
-                installment.write(
-                    {
-                        "allocation_method": self.default_allocation_method,
-                        "auto_allocate": self.auto_allocate_new_installments,
-                    }
-                )
-
-                # Auto-sélection des cotisations si pas de liens existants
-                if (
-                    not installment.cotisation_ids
-                    and self.auto_allocate_new_installments
-                ):
-                    installment._auto_select_cotisations()
-
-                updates_count += 1
+            # Une écriture pour toutes les échéances, liens ajoutés en une insertion
+            installments._apply_allocation_config(
+                {
+                    "allocation_method": self.default_allocation_method,
+                    "auto_allocate": self.auto_allocate_new_installments,
+                }
+            )
+            updates_count = len(installments)
 
         # Configurer les préférences du membre (si le champ existe)
         if hasattr(self.member_id, "default_allocation_method"):
@@ -232,19 +275,19 @@ class ResPartnerCotisation(models.Model):
     # Indicateurs de statut membre
     has_overdue_payments = fields.Boolean(
         string="A des paiements en retard",
-        compute="_compute_payment_status",
+        compute="_compute_display_fields",
         default=False,
     )
     is_good_payer = fields.Boolean(
         string="Bon payeur",
-        compute="_compute_payment_status",
+        compute="_compute_cotisation_stats",
         help="Membre ayant un taux de paiement > 80% et aucun retard critique",
         store=True,
         default=True,
     )
     days_since_last_payment = fields.Integer(
         string="Jours depuis dernier paiement",
-        compute="_compute_payment_status",
+        compute="_compute_display_fields",
         default=0,
     )
 
@@ -298,18 +341,23 @@ class ResPartnerCotisation(models.Model):
         default=0.0,
     )
 
+    # Tenus à jour par l'index des appartenances (cotisation.group.membership)
     group_members_count = fields.Integer(
         string="Nombre de membres du groupe",
-        compute="_compute_group_members_stats",
-        store=True,
+        readonly=True,
         default=0,
     )
     group_active_members_count = fields.Integer(
         string="Membres actifs du groupe",
-        compute="_compute_group_members_stats",
-        store=True,
+        readonly=True,
         default=0,
     )
+    group_membership_ids = fields.One2many(
+        "cotisation.group.membership",
+        "member_id",
+        string="Appartenances aux groupes",
+        readonly=True,
+    )
 
     # Nouveaux champs pour améliorer les rapports
     last_activity_date = fields.Datetime(
@@ -345,19 +393,19 @@ class ResPartnerCotisation(models.Model):
     # Nouveaux champs pour améliorer l'affichage kanban
     kanban_payment_rate_display = fields.Char(
         string="Affichage taux paiement",
-        compute="_compute_kanban_displays",
+        compute="_compute_display_fields",
         help="Affichage formaté du taux de paiement pour kanban",
     )
 
     kanban_collection_rate_display = fields.Char(
         string="Affichage taux collecte",
-        compute="_compute_kanban_displays",
+        compute="_compute_display_fields",
         help="Affichage formaté du taux de collecte pour kanban",
     )
 
     kanban_status_class = fields.Char(
         string="Classe CSS statut",
-        compute="_compute_kanban_displays",
+        compute="_compute_display_fields",
         help="Classe CSS pour l'affichage du statut",
     )
 
@@ -369,7 +417,7 @@ class ResPartnerCotisation(models.Model):
             ("excellent", "Excellent"),
         ],
         string="Niveau de priorité",
-        compute="_compute_kanban_displays",
+        compute="_compute_display_fields",
     )
 
     # Champs pour l'amélioration de l'affichage des informations
@@ -453,128 +501,184 @@ class ResPartnerCotisation(models.Model):
 
     # Nouveau champ pour compter les paiements
     payments_count = fields.Integer(
-        string="Nombre de paiements", compute="_compute_payments_count", store=True
+        string="Nombre de paiements", compute="_compute_cotisation_stats", store=True
     )
 
     # Champs pour l'analyse des paiements
     last_payment_amount = fields.Monetary(
         string="Montant dernier paiement",
-        compute="_compute_last_payment_info",
+        compute="_compute_payment_details",
         currency_field="currency_id",
     )
 
     last_payment_method = fields.Char(
-        string="Méthode dernier paiement", compute="_compute_last_payment_info"
+        string="Méthode dernier paiement", compute="_compute_payment_details"
     )
 
     total_payments_this_year = fields.Monetary(
         string="Total paiements année",
-        compute="_compute_payment_analytics",
+        compute="_compute_payment_details",
         currency_field="currency_id",
     )
 
     average_payment_delay = fields.Float(
         string="Délai moyen de paiement",
-        compute="_compute_payment_analytics",
+        compute="_compute_payment_details",
         help="Délai moyen en jours entre l'échéance et le paiement",
     )
 
     preferred_payment_method = fields.Char(
         string="Méthode préférée",
-        compute="_compute_payment_analytics",
+        compute="_compute_payment_details",
         help="Méthode de paiement la plus utilisée",
     )
 
-    @api.depends("cotisation_ids.payment_ids")
-    def _compute_payments_count(self):
-        """Calcule le nombre de paiements confirmés"""
-        for partner in self:
-            if partner.is_company:
-                partner.payments_count = 0
-            else:
-                confirmed_payments = self.env["cotisation.payment"].search(
-                    [("member_id", "=", partner.id), ("state", "=", "confirmed")]
-                )
-                partner.payments_count = len(confirmed_payments)
-
-    @api.depends("cotisation_ids.payment_ids")
-    def _compute_last_payment_info(self):
-        """Calcule les informations du dernier paiement"""
-        for partner in self:
-            if partner.is_company:
-                partner.last_payment_amount = 0.0
-                partner.last_payment_method = ""
-            else:
-                last_payment = self.env["cotisation.payment"].search(
-                    [("member_id", "=", partner.id), ("state", "=", "confirmed")],
-                    order="payment_date desc",
-                    limit=1,
-                )
-
-                if last_payment:
-                    partner.last_payment_amount = last_payment.amount
-                    payment_methods = dict(
-                        last_payment._fields["payment_method"].selection
-                    )
-                    partner.last_payment_method = payment_methods.get(
-                        last_payment.payment_method, ""
-                    )
-                else:
-                    partner.last_payment_amount = 0.0
-                    partner.last_payment_method = ""
-
-    @api.depends("cotisation_ids.payment_ids")
-    def _compute_payment_analytics(self):
-        """Calcule les analyses avancées des paiements"""
-        for partner in self:
-            if partner.is_company:
-                partner.total_payments_this_year = 0.0
-                partner.average_payment_delay = 0.0
-                partner.preferred_payment_method = ""
-            else:
-                current_year = fields.Date.today().year
-                year_start = date(current_year, 1, 1)
-
-                # Paiements de cette année
-                year_payments = self.env["cotisation.payment"].search(
-                    [
-                        ("member_id", "=", partner.id),
-                        ("state", "=", "confirmed"),
-                        ("payment_date", ">=", year_start),
-                    ]
-                )
-
-                partner.total_payments_this_year = sum(year_payments.mapped("amount"))
+    # === PIPELINE DES MÉTRIQUES MEMBRES ===
+    #
+    # Les champs stockés des membres (compteurs, montants, taux, bon payeur,
+    # nombre de paiements) sont dérivés d'un seul agrégat SQL pour tout le
+    # lot de partenaires recalculés; les champs d'affichage (dernier
+    # paiement, analyses de l'année, kanban, résumés) d'un second agrégat,
+    # évalué seulement à la lecture. Chaque passage est mesuré (partenaires,
+    # requêtes) dans les données de pré-commit de la transaction.
+
+    METRICS_STATS_KEY = "contribution_management.partner_metrics"
+    CRITICAL_OVERDUE_DAYS = 30
+
+    @contextmanager
+    def _metrics_probe(self, pipeline):
+        """Mesure un passage du pipeline: partenaires recalculés et requêtes émises"""
+        cr = self.env.cr
+        queries_before = cr.sql_log_count
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            queries = cr.sql_log_count - queries_before
+            stats = cr.precommit.data.setdefault(self.METRICS_STATS_KEY, {})
+            entry = stats.setdefault(pipeline, {"runs": 0, "partners": 0, "queries": 0})
+            entry["runs"] += 1
+            entry["partners"] += len(self)
+            entry["queries"] += queries
+            _logger.debug(
+                f"Métriques {pipeline}: {len(self)} partenaires, {queries} requêtes, "
+                f"{(time.perf_counter() - started) * 1000:.1f} ms"
+            )
 
-                # Délai moyen de paiement
-                delays = []
-                for payment in year_payments:
-                    if payment.cotisation_id.due_date and payment.payment_date:
-                        delay = (
-                            payment.payment_date - payment.cotisation_id.due_date
-                        ).days
-                        delays.append(delay)
+    @api.model
+    def get_metrics_stats(self, reset=False):
+        """Mesures du pipeline des métriques pour la transaction courante.
+
+        Retourne {pipeline: {runs, partners, queries}}; reset=True remet
+        les mesures à zéro après lecture.
+        """
+        data = self.env.cr.precommit.data
+        stats = data.pop(self.METRICS_STATS_KEY, {}) if reset else data.get(self.METRICS_STATS_KEY, {})
+        return {pipeline: dict(entry) for pipeline, entry in stats.items()}
+
+    def _fetch_member_metrics(self):
+        """Agrégat des cotisations actives et des paiements confirmés, par membre"""
+        member_ids = [partner._origin.id for partner in self if partner._origin.id]
+        if not member_ids:
+            return {}
+        self.env["member.cotisation"].flush_model(
+            ["member_id", "active", "state", "amount_due", "amount_paid", "due_date"]
+        )
+        self.env["cotisation.payment"].flush_model(["member_id", "state"])
+
+        critical_date = fields.Date.context_today(self) - timedelta(days=self.CRITICAL_OVERDUE_DAYS)
+        self.env.cr.execute(
+            """
+            WITH cotisations AS (
+                SELECT member_id,
+                       COUNT(*) AS total,
+                       COUNT(*) FILTER (WHERE state = 'paid') AS paid,
+                       COUNT(*) FILTER (WHERE state = 'pending') AS pending,
+                       COUNT(*) FILTER (WHERE state = 'partial') AS partial,
+                       COUNT(*) FILTER (WHERE state = 'overdue') AS overdue,
+                       COUNT(*) FILTER (WHERE state = 'overdue' AND due_date < %(critical_date)s) AS critical,
+                       COALESCE(SUM(amount_due), 0) AS amount_due,
+                       COALESCE(SUM(amount_paid), 0) AS amount_paid
+                FROM member_cotisation
+                WHERE active AND member_id = ANY(%(ids)s)
+                GROUP BY member_id
+            ),
+            payments AS (
+                SELECT member_id, COUNT(*) AS payments
+                FROM cotisation_payment
+                WHERE state = 'confirmed' AND member_id = ANY(%(ids)s)
+                GROUP BY member_id
+            )
+            SELECT member_id, c.total, c.paid, c.pending, c.partial, c.overdue, c.critical,
+                   c.amount_due, c.amount_paid, p.payments
+            FROM cotisations c
+            FULL JOIN payments p USING (member_id)
+            """,
+            {"ids": member_ids, "critical_date": critical_date},
+        )
+        keys = (
+            "total", "paid", "pending", "partial", "overdue", "critical",
+            "amount_due", "amount_paid", "payments",
+        )
+        return {
+            row[0]: {key: value or 0 for key, value in zip(keys, row[1:])}
+            for row in self.env.cr.fetchall()
+        }
 
-                partner.average_payment_delay = (
-                    sum(delays) / len(delays) if delays else 0.0
-                )
+    def _fetch_payment_details(self):
+        """Dernier paiement et analyses de l'année, par membre"""
+        member_ids = [partner._origin.id for partner in self if partner._origin.id]
+        if not member_ids:
+            return {}
+        self.env["member.cotisation"].flush_model(["due_date"])
+        self.env["cotisation.payment"].flush_model(
+            ["member_id", "cotisation_id", "state", "amount", "payment_method", "payment_date"]
+        )
 
-                # Méthode préférée
-                if year_payments:
-                    methods_count = {}
-                    for payment in year_payments:
-                        method = payment.payment_method
-                        methods_count[method] = methods_count.get(method, 0) + 1
+        year_start = date(fields.Date.context_today(self).year, 1, 1)
+        self.env.cr.execute(
+            """
+            WITH payments AS (
+                SELECT p.member_id, p.amount, p.payment_method, p.payment_date, c.due_date,
+                       ROW_NUMBER() OVER (
+                           PARTITION BY p.member_id ORDER BY p.payment_date DESC, p.id DESC
+                       ) AS recency
+                FROM cotisation_payment p
+                LEFT JOIN member_cotisation c ON c.id = p.cotisation_id
+                WHERE p.state = 'confirmed' AND p.member_id = ANY(%(ids)s)
+            )
+            SELECT member_id,
+                   MAX(amount) FILTER (WHERE recency = 1),
+                   MAX(payment_method) FILTER (WHERE recency = 1),
+                   SUM(amount) FILTER (WHERE payment_date >= %(year_start)s),
+                   AVG(payment_date - due_date)
+                       FILTER (WHERE payment_date >= %(year_start)s AND due_date IS NOT NULL),
+                   MODE() WITHIN GROUP (ORDER BY payment_method)
+                       FILTER (WHERE payment_date >= %(year_start)s)
+            FROM payments
+            GROUP BY member_id
+            """,
+            {"ids": member_ids, "year_start": year_start},
+        )
+        keys = ("last_amount", "last_method", "year_total", "average_delay", "preferred_method")
+        return {row[0]: dict(zip(keys, row[1:])) for row in self.env.cr.fetchall()}
 
-                    preferred_method = max(methods_count, key=methods_count.get)
-                    payment_methods = dict(
-                        year_payments[0]._fields["payment_method"].selection
-                    )
-                    partner.preferred_payment_method = payment_methods.get(
-                        preferred_method, ""
-                    )
-                else:
-                    partner.preferred_payment_method = ""
+    @api.model
+    def _fetch_last_settlement_dates(self, member_ids):
+        """Date du dernier règlement de cotisation, par membre, en une requête"""
+        if not member_ids:
+            return {}
+        self.env["member.cotisation"].flush_model(["member_id", "active", "payment_date"])
+        self.env.cr.execute(
+            """
+            SELECT member_id, MAX(payment_date)
+            FROM member_cotisation
+            WHERE active AND payment_date IS NOT NULL AND member_id = ANY(%s)
+            GROUP BY member_id
+            """,
+            (list(member_ids),),
+        )
+        return dict(self.env.cr.fetchall())
 
     def action_quick_payment(self):
         """Action de paiement rapide améliorée - CORRIGÉE"""
@@ -775,132 +879,200 @@ class ResPartnerCotisation(models.Model):
             "currency_symbol": self.currency_id.symbol or "€",
         }
 
-    @api.depends(
-        "payment_rate", "group_collection_rate", "overdue_cotisations", "is_good_payer"
-    )
-    def _compute_kanban_displays(self):
-        """Calcule les affichages spéciaux pour la vue kanban"""
-        for partner in self:
-            # Formatage sécurisé des pourcentages
-            if partner.is_company:
-                rate = float(partner.group_collection_rate or 0.0)
-                partner.kanban_collection_rate_display = f"{rate:.1f}%"
-                partner.kanban_payment_rate_display = ""
-
-                # Déterminer la classe CSS et le niveau de priorité pour les groupes
-                if rate >= 90:
-                    partner.kanban_status_class = "text-bg-success"
-                    partner.kanban_priority_level = "excellent"
-                elif rate >= 75:
-                    partner.kanban_status_class = "text-bg-info"
-                    partner.kanban_priority_level = "good"
-                elif rate >= 50:
-                    partner.kanban_status_class = "text-bg-warning"
-                    partner.kanban_priority_level = "warning"
-                else:
-                    partner.kanban_status_class = "text-bg-danger"
-                    partner.kanban_priority_level = "critical"
-            else:
-                rate = float(partner.payment_rate or 0.0)
-                partner.kanban_payment_rate_display = f"{rate:.1f}%"
-                partner.kanban_collection_rate_display = ""
-
-                # Déterminer la classe CSS et le niveau de priorité pour les membres
-                if partner.overdue_cotisations > 0:
-                    partner.kanban_status_class = "text-bg-danger"
-                    partner.kanban_priority_level = "critical"
-                elif rate >= 90 and partner.is_good_payer:
-                    partner.kanban_status_class = "text-bg-success"
-                    partner.kanban_priority_level = "excellent"
-                elif rate >= 75:
-                    partner.kanban_status_class = "text-bg-info"
-                    partner.kanban_priority_level = "good"
-                elif rate >= 50:
-                    partner.kanban_status_class = "text-bg-warning"
-                    partner.kanban_priority_level = "warning"
-                else:
-                    partner.kanban_status_class = "text-bg-danger"
-                    partner.kanban_priority_level = "critical"
+    @api.model
+    def _kanban_presentation(self, is_company, rate, overdue=0, is_good_payer=True, total=0, days=None):
+        """Badges et libellés kanban d'un partenaire, fonction pure de ses statistiques"""
+        rate = float(rate or 0.0)
+        indicator = KANBAN_INDICATORS[bisect_right(KANBAN_INDICATOR_BANDS, rate)]
+        band = bisect_right(KANBAN_RATE_BANDS, rate)
+
+        if is_company:
+            status_class, priority = KANBAN_BAND_STYLES[band]
+            return {
+                "kanban_payment_rate_display": "",
+                "kanban_collection_rate_display": f"{rate:.1f}%",
+                "kanban_status_class": status_class,
+                "kanban_priority_level": priority,
+                "last_payment_display": "",
+                "status_summary": KANBAN_GROUP_SUMMARIES[band],
+                "performance_indicator": indicator,
+            }
+
+        if overdue > 0:
+            status_class, priority = KANBAN_BAND_STYLES[0]
+            summary = f"🔴 {overdue} retard(s)"
+            indicator = "🚨"
+        else:
+            # Excellent seulement pour un bon payeur; sinon la bande inférieure
+            if band == len(KANBAN_RATE_BANDS) and not is_good_payer:
+                band -= 1
+            status_class, priority = KANBAN_BAND_STYLES[band]
+            summary = KANBAN_MEMBER_SUMMARIES[band]
+            if band == 0 and not total:
+                summary = "⚪ Nouveau membre"
+
+        return {
+            "kanban_payment_rate_display": f"{rate:.1f}%",
+            "kanban_collection_rate_display": "",
+            "kanban_status_class": status_class,
+            "kanban_priority_level": priority,
+            "last_payment_display": self._last_payment_label(days),
+            "status_summary": summary,
+            "performance_indicator": indicator,
+        }
+
+    @api.model
+    def _last_payment_label(self, days):
+        """Libellé relatif du dernier paiement (None: aucun paiement)"""
+        if days is None:
+            return "Aucun paiement"
+        if days == 0:
+            return "Aujourd'hui"
+        if days == 1:
+            return "Hier"
+        if days <= 30:
+            return f"Il y a {days} jours"
+        if days <= 365:
+            return f"Il y a {days//30} mois"
+        return f"Il y a {days//365} an(s)"
 
     @api.depends(
-        "days_since_last_payment",
-        "is_good_payer",
+        "is_company",
+        "total_cotisations",
         "overdue_cotisations",
         "payment_rate",
+        "is_good_payer",
         "group_collection_rate",
+        "cotisation_ids.payment_date",
     )
     def _compute_display_fields(self):
-        """Calcule les champs d'affichage améliorés"""
-        for partner in self:
-            # Affichage du dernier paiement
-            if partner.is_company:
-                partner.last_payment_display = ""
-            else:
-                days = partner.days_since_last_payment or 999
-                if days >= 999:
-                    partner.last_payment_display = "Aucun paiement"
-                elif days == 0:
-                    partner.last_payment_display = "Aujourd'hui"
-                elif days == 1:
-                    partner.last_payment_display = "Hier"
-                elif days <= 7:
-                    partner.last_payment_display = f"Il y a {days} jours"
-                elif days <= 30:
-                    partner.last_payment_display = f"Il y a {days} jours"
-                elif days <= 365:
-                    partner.last_payment_display = f"Il y a {days//30} mois"
-                else:
-                    partner.last_payment_display = f"Il y a {days//365} an(s)"
-
-            # Résumé du statut
-            if partner.is_company:
-                if partner.group_collection_rate >= 90:
-                    partner.status_summary = "🟢 Performance excellente"
-                elif partner.group_collection_rate >= 75:
-                    partner.status_summary = "🔵 Performance correcte"
-                elif partner.group_collection_rate >= 50:
-                    partner.status_summary = "🟡 Performance moyenne"
-                else:
-                    partner.status_summary = "🔴 Performance faible"
-            else:
-                if partner.overdue_cotisations > 0:
-                    partner.status_summary = (
-                        f"🔴 {partner.overdue_cotisations} retard(s)"
-                    )
-                elif partner.is_good_payer and partner.payment_rate >= 90:
-                    partner.status_summary = "🟢 Excellent payeur"
-                elif partner.payment_rate >= 75:
-                    partner.status_summary = "🔵 Bon payeur"
-                elif partner.payment_rate >= 50:
-                    partner.status_summary = "🟡 Payeur moyen"
-                elif partner.total_cotisations == 0:
-                    partner.status_summary = "⚪ Nouveau membre"
-                else:
-                    partner.status_summary = "🔴 À surveiller"
-
-            # Indicateur de performance
-            if partner.is_company:
-                rate = partner.group_collection_rate
-                if rate >= 95:
-                    partner.performance_indicator = "⭐⭐⭐"
-                elif rate >= 85:
-                    partner.performance_indicator = "⭐⭐"
-                elif rate >= 70:
-                    partner.performance_indicator = "⭐"
-                else:
-                    partner.performance_indicator = "⚠️"
-            else:
-                rate = partner.payment_rate
-                if partner.overdue_cotisations > 0:
-                    partner.performance_indicator = "🚨"
-                elif rate >= 95:
-                    partner.performance_indicator = "⭐⭐⭐"
-                elif rate >= 85:
-                    partner.performance_indicator = "⭐⭐"
-                elif rate >= 70:
-                    partner.performance_indicator = "⭐"
-                else:
-                    partner.performance_indicator = "⚠️"
+        """Champs de présentation (statut, kanban, dernier paiement).
+
+        Dérivés des statistiques stockées; seule la date du dernier
+        règlement est lue, en une requête pour tout le lot.
+        """
+        with self._metrics_probe("display"):
+            members = self.filtered(lambda p: not p.is_company)
+            last_dates = self._fetch_last_settlement_dates(
+                [partner._origin.id for partner in members if partner._origin.id]
+            )
+            today = fields.Date.context_today(self)
+
+            for partner in self:
+                last_date = last_dates.get(partner._origin.id)
+                days = max(0, (today - last_date).days) if last_date else None
+                values = self._kanban_presentation(
+                    partner.is_company,
+                    partner.group_collection_rate if partner.is_company else partner.payment_rate,
+                    partner.overdue_cotisations,
+                    partner.is_good_payer,
+                    partner.total_cotisations,
+                    days,
+                )
+                values.update(
+                    {
+                        "has_overdue_payments": not partner.is_company and partner.overdue_cotisations > 0,
+                        "days_since_last_payment": 0 if partner.is_company else (999 if days is None else days),
+                    }
+                )
+                partner.update(values)
+
+    @api.depends("is_company", "cotisation_ids.payment_ids", "cotisation_ids.payment_ids.state")
+    def _compute_payment_details(self):
+        """Dernier paiement et analyses de l'année, en un agrégat des paiements pour le lot"""
+        with self._metrics_probe("payments"):
+            details = self.filtered(lambda p: not p.is_company)._fetch_payment_details()
+            method_labels = dict(self.env["cotisation.payment"]._fields["payment_method"].selection)
+
+            for partner in self:
+                detail = {} if partner.is_company else details.get(partner._origin.id, {})
+                partner.update(
+                    {
+                        "last_payment_amount": float(detail.get("last_amount") or 0.0),
+                        "last_payment_method": method_labels.get(detail.get("last_method"), ""),
+                        "total_payments_this_year": float(detail.get("year_total") or 0.0),
+                        "average_payment_delay": float(detail.get("average_delay") or 0.0),
+                        "preferred_payment_method": method_labels.get(detail.get("preferred_method"), ""),
+                    }
+                )
+
+    def _compute_kanban_displays(self):
+        """Conservé pour les appelants existants: affichages recalculés par le pipeline"""
+        self._compute_display_fields()
+
+    # === DONNÉES KANBAN LÉGÈRES ===
+
+    KANBAN_RAW_FIELDS = [
+        "display_name",
+        "is_company",
+        "email",
+        "phone",
+        "total_cotisations",
+        "paid_cotisations",
+        "pending_cotisations",
+        "overdue_cotisations",
+        "payment_rate",
+        "group_collection_rate",
+        "is_good_payer",
+        "group_members_count",
+        "activities_count",
+        "active_activities_count",
+        "write_date",
+    ]
+
+    @api.model
+    def get_kanban_data(self, domain=None, offset=0, limit=80, order=None):
+        """Page kanban légère: statistiques brutes et badges dérivés.
+
+        Un seul search_read des champs stockés, une requête pour les dates
+        de dernier règlement, puis un formatage sans ORM. La page formatée
+        est gardée en cache (par processus) tant qu'aucun de ses
+        partenaires n'est modifié (write_date), et au plus
+        KANBAN_CACHE_TTL secondes.
+        """
+        rows = self.search_read(
+            domain or [], self.KANBAN_RAW_FIELDS, offset=offset, limit=limit, order=order
+        )
+        if not rows:
+            return []
+
+        today = fields.Date.context_today(self)
+        key = (
+            self.env.cr.dbname,
+            self.env.uid,
+            tuple(row["id"] for row in rows),
+            max(row["write_date"] for row in rows),
+            today,
+        )
+        cached = _kanban_cache_get(key)
+        if cached is not None:
+            return [dict(row) for row in cached]
+
+        rows = self._format_kanban_rows(rows, today)
+        _kanban_cache_put(key, rows)
+        return [dict(row) for row in rows]
+
+    @api.model
+    def _format_kanban_rows(self, rows, today=None):
+        """Ajoute badges et libellés à des lignes brutes de get_kanban_data"""
+        today = today or fields.Date.context_today(self)
+        last_dates = self._fetch_last_settlement_dates(
+            [row["id"] for row in rows if not row["is_company"]]
+        )
+        for row in rows:
+            last_date = last_dates.get(row["id"])
+            row.update(
+                self._kanban_presentation(
+                    row["is_company"],
+                    row["group_collection_rate"] if row["is_company"] else row["payment_rate"],
+                    row["overdue_cotisations"],
+                    row["is_good_payer"],
+                    row["total_cotisations"],
+                    max(0, (today - last_date).days) if last_date else None,
+                )
+            )
+            row["write_date"] = fields.Datetime.to_string(row["write_date"])
+        return rows
 
     @api.model
     def safe_format_percentage(self, value, decimals=1):
@@ -980,130 +1152,49 @@ class ResPartnerCotisation(models.Model):
                 return "badge text-bg-danger"
         return "badge text-bg-secondary"
 
-    # CORRECTION DE LA MÉTHODE DE CALCUL PRINCIPALE
     @api.depends(
+        "is_company",
         "cotisation_ids",
         "cotisation_ids.state",
         "cotisation_ids.amount_due",
         "cotisation_ids.amount_paid",
         "cotisation_ids.active",
+        "cotisation_ids.due_date",
+        "cotisation_ids.payment_ids",
+        "cotisation_ids.payment_ids.state",
     )
     def _compute_cotisation_stats(self):
-        """Calcule les statistiques de cotisation avec formatage correct des pourcentages"""
-        for partner in self:
-            if partner.is_company:
-                # Pour les organisations, on ne calcule pas les statistiques personnelles
+        """Métriques stockées des membres, dérivées d'un seul agrégat pour tout le lot"""
+        with self._metrics_probe("member"):
+            metrics = self.filtered(lambda p: not p.is_company)._fetch_member_metrics()
+
+            for partner in self:
+                values = {} if partner.is_company else metrics.get(partner._origin.id, {})
+                amount_due = float(values.get("amount_due", 0.0))
+                amount_paid = float(values.get("amount_paid", 0.0))
+                payment_rate = (
+                    max(0.0, min(100.0, amount_paid / amount_due * 100.0)) if amount_due > 0 else 0.0
+                )
                 partner.update(
                     {
-                        "total_cotisations": 0,
-                        "paid_cotisations": 0,
-                        "pending_cotisations": 0,
-                        "partial_cotisations": 0,
-                        "overdue_cotisations": 0,
-                        "total_amount_due": 0.0,
-                        "total_amount_paid": 0.0,
-                        "remaining_amount": 0.0,
-                        "payment_rate": 0.0,
+                        "total_cotisations": values.get("total", 0),
+                        "paid_cotisations": values.get("paid", 0),
+                        "pending_cotisations": values.get("pending", 0),
+                        "partial_cotisations": values.get("partial", 0),
+                        "overdue_cotisations": values.get("overdue", 0),
+                        "total_amount_due": max(0.0, amount_due),
+                        "total_amount_paid": max(0.0, amount_paid),
+                        "remaining_amount": max(0.0, amount_due - amount_paid),
+                        "payment_rate": payment_rate,  # Valeur 0-100 pour widget percentage
+                        "payments_count": values.get("payments", 0),
+                        # Bon payeur: taux >= 80% et aucune cotisation à plus de 30 jours de retard
+                        "is_good_payer": partner.is_company
+                        or (payment_rate >= 80.0 and not values.get("critical", 0)),
                     }
                 )
-            else:
-                try:
-                    cotisations = partner.cotisation_ids.filtered("active")
-
-                    # Calculs de base avec gestion des erreurs
-                    total_cotisations = len(cotisations)
-                    paid_cotisations = len(
-                        cotisations.filtered(lambda c: c.state == "paid")
-                    )
-                    pending_cotisations = len(
-                        cotisations.filtered(lambda c: c.state == "pending")
-                    )
-                    partial_cotisations = len(
-                        cotisations.filtered(lambda c: c.state == "partial")
-                    )
-                    overdue_cotisations = len(
-                        cotisations.filtered(lambda c: c.state == "overdue")
-                    )
-
-                    # Calculs monétaires avec protection contre les valeurs nulles
-                    total_amount_due = 0.0
-                    total_amount_paid = 0.0
-
-                    for cotisation in cotisations:
-                        try:
-                            due_amount = float(cotisation.amount_due or 0.0)
-                            paid_amount = float(cotisation.amount_paid or 0.0)
-                            total_amount_due += due_amount
-                            total_amount_paid += paid_amount
-                        except (TypeError, ValueError) as e:
-                            _logger.warning(
-                                f"Erreur de conversion pour cotisation {cotisation.id}: {e}"
-                            )
-                            continue
-
-                    remaining_amount = max(0.0, total_amount_due - total_amount_paid)
-
-                    # Calcul CORRIGÉ du taux de paiement (maintenant en valeur décimale, pas en pourcentage)
-                    payment_rate = 0.0
-                    if total_amount_due > 0:
-                        try:
-                            # IMPORTANT: Stocker en décimal (0.0 à 100.0) pour compatibilité widget percentage
-                            payment_rate = (
-                                total_amount_paid / total_amount_due
-                            ) * 100.0
-                            # S'assurer que le taux est dans une plage raisonnable
-                            payment_rate = max(0.0, min(100.0, payment_rate))
-                            # S'assurer que c'est un float valide (pas NaN ou Inf)
-                            if not (payment_rate >= 0 and payment_rate <= 100):
-                                payment_rate = 0.0
-                        except (
-                            ZeroDivisionError,
-                            TypeError,
-                            ValueError,
-                            OverflowError,
-                        ) as e:
-                            _logger.warning(
-                                f"Erreur de calcul du taux pour {partner.name}: {e}"
-                            )
-                            payment_rate = 0.0
-
-                    # Mise à jour des champs avec validation stricte
-                    partner.update(
-                        {
-                            "total_cotisations": max(0, total_cotisations),
-                            "paid_cotisations": max(0, paid_cotisations),
-                            "pending_cotisations": max(0, pending_cotisations),
-                            "partial_cotisations": max(0, partial_cotisations),
-                            "overdue_cotisations": max(0, overdue_cotisations),
-                            "total_amount_due": max(0.0, total_amount_due),
-                            "total_amount_paid": max(0.0, total_amount_paid),
-                            "remaining_amount": max(0.0, remaining_amount),
-                            "payment_rate": float(
-                                payment_rate
-                            ),  # Valeur 0-100 pour widget percentage
-                        }
-                    )
-
-                except Exception as e:
-                    _logger.error(
-                        f"Erreur lors du calcul des statistiques pour {partner.name}: {e}"
-                    )
-                    # Valeurs par défaut ultra-sécurisées en cas d'erreur
-                    partner.update(
-                        {
-                            "total_cotisations": 0,
-                            "paid_cotisations": 0,
-                            "pending_cotisations": 0,
-                            "partial_cotisations": 0,
-                            "overdue_cotisations": 0,
-                            "total_amount_due": 0.0,
-                            "total_amount_paid": 0.0,
-                            "remaining_amount": 0.0,
-                            "payment_rate": 0.0,
-                        }
-                    )
 
     @api.depends(
+        "is_company",
         "group_activities",
         "group_activities.total_collected",
         "group_activities.total_expected",
@@ -1112,98 +1203,49 @@ class ResPartnerCotisation(models.Model):
         "monthly_cotisations.total_expected",
     )
     def _compute_group_financial_stats(self):
-        """Calcule les statistiques financières pour les groupes avec formatage correct"""
-        for partner in self:
-            if partner.is_company:
-                try:
-                    activities = partner.group_activities.filtered("active")
-                    monthly_cotisations = partner.monthly_cotisations.filtered("active")
-
-                    # Calculs avec protection contre les valeurs nulles
-                    activities_collected = 0.0
-                    activities_expected = 0.0
-
-                    for activity in activities:
-                        try:
-                            activities_collected += float(
-                                activity.total_collected or 0.0
-                            )
-                            activities_expected += float(activity.total_expected or 0.0)
-                        except (TypeError, ValueError):
-                            continue
-
-                    monthly_collected = 0.0
-                    monthly_expected = 0.0
-
-                    for monthly in monthly_cotisations:
-                        try:
-                            monthly_collected += float(monthly.total_collected or 0.0)
-                            monthly_expected += float(monthly.total_expected or 0.0)
-                        except (TypeError, ValueError):
-                            continue
-
-                    # Totaux globaux
-                    group_total_collected = max(
-                        0.0, activities_collected + monthly_collected
-                    )
-                    group_total_expected = max(
-                        0.0, activities_expected + monthly_expected
-                    )
-
-                    # Calcul CORRIGÉ du taux de collecte (en valeur 0-100 pour widget percentage)
-                    group_collection_rate = 0.0
-                    if group_total_expected > 0:
-                        try:
-                            group_collection_rate = (
-                                group_total_collected / group_total_expected
-                            ) * 100.0
-                            # S'assurer que le taux est dans une plage raisonnable
-                            group_collection_rate = max(
-                                0.0, min(100.0, group_collection_rate)
-                            )
-                            # S'assurer que c'est un float valide (pas NaN ou Inf)
-                            if not (
-                                group_collection_rate >= 0
-                                and group_collection_rate <= 100
-                            ):
-                                group_collection_rate = 0.0
-                        except (
-                            ZeroDivisionError,
-                            TypeError,
-                            ValueError,
-                            OverflowError,
-                        ):
-                            group_collection_rate = 0.0
-
-                    partner.update(
-                        {
-                            "group_total_collected": float(group_total_collected),
-                            "group_total_expected": float(group_total_expected),
-                            "group_collection_rate": float(
-                                group_collection_rate
-                            ),  # Valeur 0-100
-                        }
-                    )
-
-                except Exception as e:
-                    _logger.error(
-                        f"Erreur lors du calcul des statistiques financières pour {partner.name}: {e}"
-                    )
-                    partner.update(
-                        {
-                            "group_total_collected": 0.0,
-                            "group_total_expected": 0.0,
-                            "group_collection_rate": 0.0,
-                        }
-                    )
-            else:
-                partner.update(
-                    {
-                        "group_total_collected": 0.0,
-                        "group_total_expected": 0.0,
-                        "group_collection_rate": 0.0,
-                    }
+        """Statistiques financières des groupes, en un agrégat sur activités et cotisations mensuelles"""
+        groups = self.filtered("is_company")
+        totals = {}
+        with groups._metrics_probe("group"):
+            group_ids = [group._origin.id for group in groups if group._origin.id]
+            if group_ids:
+                fnames = ["group_id", "active", "total_collected", "total_expected"]
+                self.env["group.activity"].flush_model(fnames)
+                self.env["monthly.cotisation"].flush_model(fnames)
+                self.env.cr.execute(
+                    """
+                    SELECT group_id, SUM(total_collected), SUM(total_expected)
+                    FROM (
+                        SELECT group_id, total_collected, total_expected
+                        FROM group_activity WHERE active AND group_id = ANY(%(ids)s)
+                        UNION ALL
+                        SELECT group_id, total_collected, total_expected
+                        FROM monthly_cotisation WHERE active AND group_id = ANY(%(ids)s)
+                    ) AS sources
+                    GROUP BY group_id
+                    """,
+                    {"ids": group_ids},
                 )
+                totals = {
+                    row[0]: (float(row[1] or 0.0), float(row[2] or 0.0))
+                    for row in self.env.cr.fetchall()
+                }
+
+        for partner in self:
+            collected, expected = (
+                totals.get(partner._origin.id, (0.0, 0.0)) if partner.is_company else (0.0, 0.0)
+            )
+            collected, expected = max(0.0, collected), max(0.0, expected)
+            partner.update(
+                {
+                    "group_total_collected": collected,
+                    "group_total_expected": expected,
+                    # Valeur 0-100 pour widget percentage
+                    "group_collection_rate": (
+                        max(0.0, min(100.0, collected / expected * 100.0)) if expected > 0 else 0.0
+                    ),
+                }
+            )
 
     # Méthodes utilitaires pour l'affichage amélioré
     def get_priority_color(self):
@@ -1314,37 +1356,8 @@ class ResPartnerCotisation(models.Model):
     # Méthodes d'amélioration des performances pour le kanban
     @api.model
     def get_kanban_data_optimized(self, domain=None, limit=None):
-        """Méthode optimisée pour récupérer les données kanban"""
-        if domain is None:
-            domain = []
-
-        # Recherche avec tous les champs nécessaires
-        partners = self.search(domain, limit=limit)
-
-        # Précharger toutes les relations nécessaires
-        partners.read(
-            [
-                "display_name",
-                "is_company",
-                "email",
-                "phone",
-                "total_cotisations",
-                "paid_cotisations",
-                "pending_cotisations",
-                "overdue_cotisations",
-                "payment_rate",
-                "group_collection_rate",
-                "is_good_payer",
-                "group_members_count",
-                "activities_count",
-                "active_activities_count",
-                "kanban_status_class",
-                "status_summary",
-                "performance_indicator",
-            ]
-        )
-
-        return partners
+        """Conservé pour compatibilité: voir get_kanban_data"""
+        return self.get_kanban_data(domain=domain, limit=limit)
 
     # Actions améliorées pour l'interface
     def action_add_group_member(self):
@@ -1532,78 +1545,10 @@ class ResPartnerCotisation(models.Model):
             else:
                 partner.last_monthly_cotisation_date = False
 
-    @api.depends(
-        "cotisation_ids", "cotisation_ids.payment_date", "cotisation_ids.state"
-    )
     def _compute_payment_status(self):
-        """Calcule les indicateurs de statut de paiement avec gestion ultra-sécurisée"""
-        for partner in self:
-            if partner.is_company:
-                partner.update(
-                    {
-                        "has_overdue_payments": False,
-                        "is_good_payer": True,
-                        "days_since_last_payment": 0,  # Toujours un entier valide
-                    }
-                )
-            else:
-                try:
-                    # Vérifier s'il y a des paiements en retard
-                    overdue_cotisations = partner.cotisation_ids.filtered(
-                        lambda c: c.state == "overdue" and c.active
-                    )
-                    has_overdue_payments = bool(overdue_cotisations)
-
-                    # Déterminer si c'est un bon payeur avec gestion sécurisée
-                    payment_rate = float(partner.payment_rate or 0.0)
-                    critical_overdue = overdue_cotisations.filtered(
-                        lambda c: getattr(c, "days_overdue", 0) > 30
-                    )
-                    is_good_payer = payment_rate >= 80.0 and len(critical_overdue) == 0
-
-                    # Calculer les jours depuis le dernier paiement
-                    paid_cotisations = partner.cotisation_ids.filtered(
-                        lambda c: c.payment_date and c.active
-                    ).sorted("payment_date", reverse=True)
-
-                    days_since_last_payment = 0
-                    if paid_cotisations:
-                        try:
-                            last_payment_date = paid_cotisations[0].payment_date
-                            days_since_last_payment = (
-                                fields.Date.today() - last_payment_date
-                            ).days
-                            # S'assurer que c'est un entier positif
-                            days_since_last_payment = max(
-                                0, int(days_since_last_payment)
-                            )
-                        except (TypeError, AttributeError, ValueError):
-                            days_since_last_payment = 999
-                    else:
-                        days_since_last_payment = 999  # Aucun paiement
-
-                    partner.update(
-                        {
-                            "has_overdue_payments": has_overdue_payments,
-                            "is_good_payer": is_good_payer,
-                            "days_since_last_payment": int(
-                                days_since_last_payment
-                            ),  # Toujours un entier
-                        }
-                    )
-
-                except Exception as e:
-                    _logger.error(
-                        f"Erreur lors du calcul du statut de paiement pour {partner.name}: {e}"
-                    )
-                    # Valeurs par défaut ultra-sécurisées
-                    partner.update(
-                        {
-                            "has_overdue_payments": False,
-                            "is_good_payer": True,
-                            "days_since_last_payment": 999,
-                        }
-                    )
+        """Conservé pour les appelants existants: statut recalculé par le pipeline"""
+        self._compute_cotisation_stats()
+        self._compute_display_fields()
 
     @api.depends("group_activities", "monthly_cotisations")
     def _compute_group_cotisation_counts(self):
@@ -1665,7 +1610,6 @@ class ResPartnerCotisation(models.Model):
                     if doc.is_company:
                         doc._compute_group_financial_stats()
                         doc._compute_group_cotisation_counts()
-                        doc._compute_group_members_stats()
 
                     # Vérification et correction des valeurs critiques
                     if (
@@ -1770,39 +1714,59 @@ class ResPartnerCotisation(models.Model):
                 "safe_format_float": lambda x: 0.0,
             }
 
-    @api.depends("child_ids")
-    def _compute_group_members_stats(self):
-        """Calcule les statistiques des membres pour les groupes"""
-        for partner in self:
-            if partner.is_company:
-                try:
-                    members = partner.child_ids.filtered(lambda c: not c.is_company)
-                    group_members_count = len(members)
-                    group_active_members_count = len(members.filtered("active"))
+    def init(self):
+        super().init()
+        # Sélection des participants par critères sur les statistiques stockées;
+        # le prédicat reprend la condition générée par l'ORM pour is_company = False
+        self.env.cr.execute("DROP INDEX IF EXISTS res_partner_member_eligibility_index")
+        create_index(
+            self.env.cr,
+            "res_partner_member_eligibility_idx",
+            self._table,
+            ["payment_rate", "is_good_payer", "overdue_cotisations"],
+            where="active = TRUE AND (is_company IS NULL OR is_company = FALSE)",
+        )
 
-                    partner.update(
-                        {
-                            "group_members_count": group_members_count,
-                            "group_active_members_count": group_active_members_count,
-                        }
-                    )
-                except Exception as e:
-                    _logger.error(
-                        f"Erreur lors du calcul des membres pour {partner.name}: {e}"
-                    )
-                    partner.update(
-                        {
-                            "group_members_count": 0,
-                            "group_active_members_count": 0,
-                        }
-                    )
-            else:
-                partner.update(
-                    {
-                        "group_members_count": 0,
-                        "group_active_members_count": 0,
-                    }
-                )
+    # ================= APPARTENANCE AUX GROUPES =================
+
+    def _sync_group_memberships(self, extra_group_ids=()):
+        """Met à jour l'index des appartenances et les compteurs des groupes"""
+        Membership = self.env["cotisation.group.membership"].sudo()
+        groups = Membership._sync_memberships(self.ids)
+        groups.update(extra_group_ids)
+        Membership._refresh_member_counts(groups)
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        partners = super().create(vals_list)
+        partners._sync_group_memberships()
+        return partners
+
+    def write(self, vals):
+        result = super().write(vals)
+        trigger_fields = self.env["cotisation.group.membership"]._membership_trigger_fields()
+        if trigger_fields.intersection(vals):
+            self._sync_group_memberships()
+        return result
+
+    def unlink(self):
+        # Les appartenances disparaissent en cascade: seuls les compteurs sont à refaire
+        Membership = self.env["cotisation.group.membership"].sudo()
+        group_ids = Membership._open_group_ids(self.ids) - set(self.ids)
+        result = super().unlink()
+        Membership._refresh_member_counts(group_ids)
+        return result
+
+    def _get_group_members(self, at_date=None):
+        """Membres des groupes, actuels ou à une date passée.
+
+        Une seule requête indexée sur cotisation.group.membership, quel que
+        soit le type d'organisation du groupe.
+        """
+        member_ids = self.env["cotisation.group.membership"].sudo()._member_ids(
+            self.ids, at_date=at_date
+        )
+        return self.env["res.partner"].browse(member_ids)
 
     # MÉTHODES UTILITAIRES SÉCURISÉES POUR LES TEMPLATES
 
@@ -2217,7 +2181,7 @@ class ResPartnerCotisation(models.Model):
                         partner._compute_group_financial_stats()
                         partner._compute_payment_status()
                         partner._compute_group_cotisation_counts()
-                        partner._compute_group_members_stats()
+                        partner._sync_group_memberships(extra_group_ids=partner.ids)
 
                         # Vérifier que les valeurs sont correctes
                         if (
@@ -2338,9 +2302,14 @@ class ResPartnerCotisation(models.Model):
         if self.is_company:
             return {"type": "ir.actions.act_window_close"}
 
-        return self.env.ref(
-            "contribution_management.action_report_member_cotisations"
-        ).report_action(self)
+        attachment = self.env["cotisation.report.cache"].get_report_attachment(
+            "contribution_management.action_report_member_cotisations", self
+        )
+        return {
+            "type": "ir.actions.act_url",
+            "url": f"/web/content/{attachment.id}?download=true",
+            "target": "self",
+        }
 
     def action_print_group_report(self):
         """Action bouton pour imprimer le rapport groupe"""
@@ -2348,9 +2317,14 @@ class ResPartnerCotisation(models.Model):
         if not self.is_company:
             return {"type": "ir.actions.act_window_close"}
 
-        return self.env.ref(
-            "contribution_management.action_report_group_synthesis"
-        ).report_action(self)
+        attachment = self.env["cotisation.report.cache"].get_report_attachment(
+            "contribution_management.action_report_group_synthesis", self
+        )
+        return {
+            "type": "ir.actions.act_url",
+            "url": f"/web/content/{attachment.id}?download=true",
+            "target": "self",
+        }
 
     @api.model
     def _cron_generate_monthly_reports_pdf(self):
@@ -2365,40 +2339,35 @@ class ResPartnerCotisation(models.Model):
                 ]
             )
 
-            current_date = fields.Date.today()
             report_count = 0
 
+            # Seuls les groupes dont les données ont changé sont re-rendus
+            attachments = self.env["cotisation.report.cache"].get_report_attachments(
+                "contribution_management.action_report_group_synthesis", groups
+            )
+
+            mail_attachments = {}
+
             for group in groups:
-                try:
-                    # Générer le rapport PDF
-                    report_pdf = self.env.ref(
-                        "contribution_management.action_report_group_synthesis"
-                    ).render_qweb_pdf([group.id])
-
-                    if report_pdf and report_pdf[0]:
-                        # Créer une pièce jointe avec le PDF
-                        attachment = self.env["ir.attachment"].create(
-                            {
-                                "name": f'Rapport_mensuel_{group.name}_{current_date.strftime("%Y_%m")}.pdf',
-                                "type": "binary",
-                                "datas": base64.b64encode(report_pdf[0]),
-                                "res_model": "res.partner",
-                                "res_id": group.id,
-                                "mimetype": "application/pdf",
-                            }
-                        )
+                attachment = attachments.get(group.id)
 
-                        # Envoyer par email si configuré
-                        if group.email:
-                            self._send_monthly_report_email(group, attachment)
+                if attachment:
+                    # Envoyer par email si configuré
+                    if group.email:
+                        mail_attachments[group.id] = attachment
 
-                        report_count += 1
+                    report_count += 1
 
-                except Exception as e:
-                    _logger.error(
-                        f"Erreur lors de la génération du rapport pour {group.name}: {e}"
-                    )
-                    continue
+            # Un seul rendu du template et une seule mise en file pour tous les groupes
+            mail_template = self.env.ref(
+                "contribution_management.email_template_monthly_report", False
+            )
+            if mail_template and mail_attachments:
+                self.env["cotisation.mail.dispatcher"].enqueue_template(
+                    mail_template,
+                    list(mail_attachments),
+                    attachments_by_res_id=mail_attachments,
+                )
 
             _logger.info(f"Rapports mensuels PDF générés pour {report_count} groupes")
             return True
@@ -2416,16 +2385,12 @@ class ResPartnerCotisation(models.Model):
                 "contribution_management.email_template_monthly_report", False
             )
             if mail_template and group.email:
-                # Attacher le PDF au template
-                mail_template.attachment_ids = [(6, 0, [attachment.id])]
-
-                # Envoyer l'email
-                mail_template.send_mail(group.id, force_send=True)
-
-                # Nettoyer les pièces jointes du template
-                mail_template.attachment_ids = [(5, 0, 0)]
+                # Pièce jointe propre à cet email, le template n'est pas modifié
+                self.env["cotisation.mail.dispatcher"].enqueue_template(
+                    mail_template, [group.id], attachments_by_res_id={group.id: attachment}
+                )
 
-                _logger.info(f"Rapport mensuel PDF envoyé par email à {group.name}")
+                _logger.info(f"Rapport mensuel PDF mis en file pour {group.name}")
         except Exception as e:
             _logger.warning(
                 f"Erreur lors de l'envoi du rapport PDF par email pour {group.name}: {e}"
@@ -2981,8 +2946,10 @@ class ResPartnerCotisation(models.Model):
                 "contribution_management.email_template_monthly_report", False
             )
             if mail_template and group.email:
-                mail_template.send_mail(group.id, force_send=True)
-                _logger.info(f"Rapport mensuel envoyé par email à {group.name}")
+                self.env["cotisation.mail.dispatcher"].enqueue_template(
+                    mail_template, [group.id]
+                )
+                _logger.info(f"Rapport mensuel mis en file pour {group.name}")
         except Exception as e:
             _logger.warning(
                 f"Erreur lors de l'envoi du rapport par email pour {group.name}: {e}"
@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+
+from odoo import models, fields, api
+from odoo.tools import create_index
+import logging
+
+_logger = logging.getLogger(__name__)
+
+
+class CotisationRecomputeSchedule(models.Model):
+    """Index des prochaines échéances des champs calculés dépendant de la date.
+
+    Certains champs stockés dépendent du jour courant (retard d'une
+    cotisation, jours de retard d'une échéance, justificatif en attente de
+    validation depuis trop longtemps, tâche en retard ou urgente, bon
+    payeur...). L'ORM ne les recalcule que lorsque leurs dépendances
+    déclarées changent. Cet index garde, pour chaque enregistrement, la
+    prochaine date à laquelle ces champs changeront; le cron quotidien
+    recalcule exactement les enregistrements dont la date est atteinte,
+    par lots, puis les réindexe.
+    """
+
+    _name = "cotisation.recompute.schedule"
+    _description = "Échéancier des recalculs dépendant de la date"
+    _log_access = False
+
+    BATCH_SIZE = 1000
+    LAST_RUN_PARAM = "contribution_management.temporal_recompute_last_run"
+    EPOCH = "1970-01-01 00:00:00"
+
+    # Pour chaque modèle: champs à recalculer, enregistrements modifiés depuis
+    # %(changed_since)s, et prochaine date de changement postérieure à %(since)s
+    RULES = {
+        "member.cotisation": {
+            "fields": ["state", "days_overdue"],
+            "changed": "SELECT id FROM member_cotisation WHERE write_date >= %(changed_since)s",
+            "next": """
+                SELECT id, GREATEST(due_date + 1, %(since)s::date + 1)
+                FROM member_cotisation
+                WHERE id IN %(ids)s AND active AND due_date IS NOT NULL
+                  AND state IN ('pending', 'overdue')
+            """,
+        },
+        "res.partner": {
+            # Bon payeur: aucune cotisation à plus de 30 jours de retard
+            "fields": ["is_good_payer"],
+            "changed": """
+                SELECT DISTINCT member_id FROM member_cotisation
+                WHERE write_date >= %(changed_since)s
+            """,
+            "next": """
+                SELECT member_id, MIN(due_date + 31)
+                FROM member_cotisation
+                WHERE member_id IN %(ids)s AND active AND due_date IS NOT NULL
+                  AND state IN ('pending', 'overdue') AND due_date + 31 > %(since)s::date
+                GROUP BY member_id
+            """,
+        },
+        "member.payment.installment": {
+            "fields": ["days_overdue"],
+            "changed": "SELECT id FROM member_payment_installment WHERE write_date >= %(changed_since)s",
+            "next": """
+                SELECT id, GREATEST(due_date + 1, %(since)s::date + 1)
+                FROM member_payment_installment
+                WHERE id IN %(ids)s AND due_date IS NOT NULL AND state IN ('pending', 'partial')
+            """,
+        },
+        "cotisation.payment.proof": {
+            # Validation en retard au-delà de 3 jours pleins d'attente
+            "fields": ["is_overdue_validation"],
+            "changed": "SELECT id FROM cotisation_payment_proof WHERE write_date >= %(changed_since)s",
+            "next": """
+                SELECT id, GREATEST(submitted_date::date + 4, %(since)s::date + 1)
+                FROM cotisation_payment_proof
+                WHERE id IN %(ids)s AND submitted_date IS NOT NULL
+                  AND state IN ('submitted', 'under_review') AND NOT COALESCE(is_overdue_validation, FALSE)
+            """,
+        },
+        "activity.task": {
+            # Urgente deux jours avant la date limite, en retard le lendemain
+            "fields": ["is_overdue", "is_urgent"],
+            "changed": "SELECT id FROM activity_task WHERE write_date >= %(changed_since)s",
+            "next": """
+                SELECT id, CASE WHEN deadline - 2 > %(since)s::date THEN deadline - 2 ELSE deadline + 1 END
+                FROM activity_task
+                WHERE id IN %(ids)s AND deadline IS NOT NULL AND state != 'completed'
+                  AND deadline + 1 > %(since)s::date
+            """,
+        },
+        "group.activity": {
+            "fields": ["overdue_task_count", "organization_status"],
+            "changed": """
+                SELECT DISTINCT activity_id FROM activity_task
+                WHERE write_date >= %(changed_since)s AND activity_id IS NOT NULL
+            """,
+            "next": """
+                SELECT activity_id, MIN(deadline + 1)
+                FROM activity_task
+                WHERE activity_id IN %(ids)s AND deadline IS NOT NULL AND state != 'completed'
+                  AND deadline + 1 > %(since)s::date
+                GROUP BY activity_id
+            """,
+        },
+    }
+
+    model_name = fields.Char(string="Modèle", required=True, readonly=True)
+    res_id = fields.Integer(string="Enregistrement", required=True, readonly=True)
+    next_date = fields.Date(string="Prochain recalcul", required=True, readonly=True)
+
+    _sql_constraints = [
+        (
+            "model_res_unique",
+            "unique(model_name, res_id)",
+            "Un enregistrement n'a qu'une prochaine date de recalcul.",
+        ),
+    ]
+
+    def init(self):
+        create_index(
+            self._cr,
+            "cotisation_recompute_schedule_due_index",
+            self._table,
+            ["next_date", "model_name"],
+        )
+
+    @api.model
+    def _reindex(self, model_name, ids, since):
+        """Remplace les entrées des enregistrements par leur prochaine date après since"""
+        rule = self.RULES[model_name]
+        for start in range(0, len(ids), self.BATCH_SIZE):
+            batch = tuple(ids[start:start + self.BATCH_SIZE])
+            self.env.cr.execute(
+                f"DELETE FROM {self._table} WHERE model_name = %s AND res_id IN %s",
+                (model_name, batch),
+            )
+            # La requête de la règle est une constante du modèle, seules les valeurs sont paramétrées
+            self.env.cr.execute(
+                f"""
+                INSERT INTO {self._table} (model_name, res_id, next_date)
+                SELECT %(model_name)s, n.res_id, n.next_date
+                FROM ({rule["next"]}) AS n(res_id, next_date)
+                WHERE n.next_date IS NOT NULL
+                """,
+                {"model_name": model_name, "ids": batch, "since": since},
+            )
+
+    @api.model
+    def _index_changed(self, model_name, changed_since):
+        """Indexe les enregistrements modifiés depuis le dernier passage"""
+        self.env.cr.execute(
+            self.RULES[model_name]["changed"],
+            {"changed_since": changed_since or self.EPOCH},
+        )
+        ids = [row[0] for row in self.env.cr.fetchall() if row[0]]
+        # Valeurs calculées au plus tôt au dernier passage: seuils postérieurs à cette date
+        since = fields.Datetime.to_datetime(changed_since or self.EPOCH).date()
+        self._reindex(model_name, ids, since)
+        return len(ids)
+
+    @api.model
+    def _recompute_due(self, model_name, today):
+        """Recalcule, par lots, les enregistrements dont la date est atteinte"""
+        Model = self.env[model_name].with_context(active_test=False)
+        fnames = self.RULES[model_name]["fields"]
+        total = 0
+        while True:
+            self.env.cr.execute(
+                f"""
+                SELECT res_id FROM {self._table}
+                WHERE next_date <= %s AND model_name = %s
+                ORDER BY res_id
+                LIMIT %s
+                """,
+                (today, model_name, self.BATCH_SIZE),
+            )
+            ids = [row[0] for row in self.env.cr.fetchall()]
+            if not ids:
+                return total
+
+            records = Model.browse(ids).exists()
+            for fname in fnames:
+                self.env.add_to_compute(Model._fields[fname], records)
+            records.flush_recordset(fnames)
+            self.env.flush_all()
+
+            # Réindexés à partir d'aujourd'hui; les enregistrements supprimés sortent de l'index
+            self._reindex(model_name, ids, today)
+            self.env.invalidate_all()
+            total += len(records)
+
+    @api.model
+    def _cron_recompute_temporal_fields(self):
+        """Cron: indexe les modifications récentes puis recalcule les échéances atteintes"""
+        params = self.env["ir.config_parameter"].sudo()
+        changed_since = params.get_param(self.LAST_RUN_PARAM)
+        started_at = fields.Datetime.now()
+        today = fields.Date.context_today(self)
+
+        self.env.flush_all()
+        for model_name in self.RULES:
+            indexed = self._index_changed(model_name, changed_since)
+            recomputed = self._recompute_due(model_name, today)
+            if indexed or recomputed:
+                _logger.info(
+                    f"Recalculs datés {model_name}: {indexed} enregistrements indexés, "
+                    f"{recomputed} recalculés"
+                )
+
+        params.set_param(self.LAST_RUN_PARAM, fields.Datetime.to_string(started_at))
+        return True
+
@@ -0,0 +1,4 @@
+# -*- coding: utf-8 -*-
+
+from . import test_mail_dispatcher
+from . import test_payment_ledger
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+
+from unittest.mock import patch
+import smtplib
+
+from odoo import fields
+from odoo.addons.base.tests.common import MockSmtplibCase
+from odoo.tests import TransactionCase, tagged
+
+
+@tagged("post_install", "-at_install")
+class TestCotisationMailDispatcher(TransactionCase, MockSmtplibCase):
+    """File d'envoi des emails, contre un serveur SMTP local simulé"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.dispatcher = cls.env["cotisation.mail.dispatcher"]
+        cls.partners = cls.env["res.partner"].create([
+            {"name": f"Membre {index}", "email": f"membre{index}@example.com"}
+            for index in range(3)
+        ])
+
+    def _enqueue(self, count=3):
+        return self.dispatcher.enqueue_values([
+            {
+                "subject": f"Reçu {index}",
+                "body_html": "<p>Merci pour votre cotisation</p>",
+                "email_from": "tresorerie@example.com",
+                "email_to": f"membre{index}@example.com",
+                "auto_delete": False,
+            }
+            for index in range(count)
+        ])
+
+    def test_core_queue_ignores_cotisation_mails(self):
+        mails = self._enqueue()
+        with self.mock_smtplib_connection():
+            self.env["mail.mail"].process_email_queue()
+        self.assertEqual(set(mails.mapped("state")), {"outgoing"})
+        self.assertFalse(self.emails)
+
+    def test_batch_uses_single_smtp_connection(self):
+        mails = self._enqueue()
+        with self.mock_smtplib_connection():
+            self.dispatcher._cron_process_mail_queue()
+        self.assertEqual(set(mails.mapped("state")), {"sent"})
+        self.assertEqual(len(self.emails), 3)
+        self.assertEqual(self.connect_mocked.call_count, 1)
+
+    def test_template_attachments_are_per_recipient(self):
+        template = self.env["mail.template"].create({
+            "name": "Rapport de test",
+            "model_id": self.env.ref("base.model_res_partner").id,
+            "subject": "Rapport",
+            "email_from": "tresorerie@example.com",
+            "email_to": "{{ object.email }}",
+            "body_html": "<p>Votre rapport</p>",
+            "auto_delete": False,
+        })
+        attachments = {
+            partner.id: self.env["ir.attachment"].create({
+                "name": f"rapport_{partner.id}.pdf",
+                "raw": b"%PDF-1.4",
+                "mimetype": "application/pdf",
+            })
+            for partner in self.partners
+        }
+        mails = self.dispatcher.enqueue_template(
+            template, self.partners.ids, attachments_by_res_id=attachments
+        )
+        self.assertFalse(template.attachment_ids)
+        for mail in mails:
+            self.assertEqual(mail.attachment_ids, attachments[mail.res_id])
+
+    def test_failed_mails_are_retried_with_backoff(self):
+        mails = self._enqueue(count=1)
+        with self.mock_smtplib_connection():
+            with patch.object(
+                self.testing_smtp_session, "send_message", side_effect=smtplib.SMTPDataError(554, b"refus")
+            ), patch.object(
+                self.testing_smtp_session, "sendmail", side_effect=smtplib.SMTPDataError(554, b"refus")
+            ):
+                self.dispatcher._cron_process_mail_queue()
+        self.assertEqual(mails.state, "exception")
+
+        with self.mock_smtplib_connection():
+            self.dispatcher._cron_process_mail_queue()
+        # Re-planifié dans le futur: le lot suivant ne le prend pas encore
+        self.assertEqual(mails.state, "outgoing")
+        self.assertEqual(mails.cotisation_retry_count, 1)
+        self.assertGreater(mails.scheduled_date, fields.Datetime.now())
+        self.assertFalse(self.emails)
+
+        mails.scheduled_date = fields.Datetime.subtract(fields.Datetime.now(), minutes=1)
+        with self.mock_smtplib_connection():
+            self.dispatcher._cron_process_mail_queue()
+        self.assertEqual(mails.state, "sent")
+        self.assertEqual(len(self.emails), 1)
@@ -0,0 +1,248 @@
+# -*- coding: utf-8 -*-
+
+from contextlib import closing, contextmanager
+from psycopg2 import errors as pg_errors
+import logging
+import random
+import threading
+import time
+
+from odoo import SUPERUSER_ID, api, fields, sql_db
+from odoo.addons.contribution_management.models.payment_intake import PaymentIntakeBusyError
+from odoo.tests import TransactionCase, tagged
+from odoo.tests.common import BaseCase, get_db_name
+
+_logger = logging.getLogger(__name__)
+
+
+@tagged("post_install", "-at_install")
+class TestPaymentLedgerConcurrency(BaseCase):
+    """Registre des paiements sous charge: caisses concurrentes, chacune sur
+    sa propre connexion, qui valident (commit) chaque soumission.
+
+    Les données sont créées et supprimées dans des transactions validées:
+    les curseurs de test ne peuvent pas être partagés entre threads.
+    """
+
+    WORKERS = 6
+    MEMBER_COUNT = 30
+    PAYMENTS_PER_MEMBER = 10
+    AMOUNT_DUE = 100.0
+    MAX_ATTEMPTS = 20
+    KEY_PREFIX = "stress-ledger"
+    RETRYABLE_ERRORS = (
+        PaymentIntakeBusyError,
+        pg_errors.SerializationFailure,
+        pg_errors.DeadlockDetected,
+        pg_errors.LockNotAvailable,
+        pg_errors.UniqueViolation,
+    )
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.dbname = get_db_name()
+        with cls._committed_env() as env:
+            today = fields.Date.today()
+            group = env["res.partner"].create({"name": "Groupe de charge", "is_company": True})
+            monthly = env["monthly.cotisation"].create({
+                "group_id": group.id,
+                "month": str(today.month),
+                "year": today.year,
+                "amount": cls.AMOUNT_DUE,
+            })
+            members = env["res.partner"].create([
+                {"name": f"Membre de charge {index}"} for index in range(cls.MEMBER_COUNT)
+            ])
+            cotisations = env["member.cotisation"].create([
+                {
+                    "member_id": member.id,
+                    "cotisation_type": "monthly",
+                    "monthly_cotisation_id": monthly.id,
+                    "amount_due": cls.AMOUNT_DUE,
+                    "due_date": today,
+                }
+                for member in members
+            ])
+            cls.partner_ids = (group | members).ids
+            cls.monthly_id = monthly.id
+            cls.cotisation_ids = cotisations.ids
+        cls.addClassCleanup(cls._cleanup)
+
+    @classmethod
+    @contextmanager
+    def _committed_env(cls):
+        """Environnement sur une connexion propre, validé à la sortie"""
+        with closing(sql_db.db_connect(cls.dbname).cursor()) as cr:
+            env = api.Environment(cr, SUPERUSER_ID, {})
+            yield env
+            env.flush_all()
+            cr.commit()
+
+    @classmethod
+    def _cleanup(cls):
+        # Le registre interdit la suppression des paiements confirmés: nettoyage en SQL
+        with closing(sql_db.db_connect(cls.dbname).cursor()) as cr:
+            cr.execute("DELETE FROM cotisation_payment WHERE cotisation_id IN %s", (tuple(cls.cotisation_ids),))
+            cr.execute(
+                "DELETE FROM cotisation_payment_intake WHERE idempotency_key LIKE %s",
+                (f"{cls.KEY_PREFIX}:%",),
+            )
+            cr.execute("DELETE FROM member_cotisation WHERE id IN %s", (tuple(cls.cotisation_ids),))
+            cr.execute("DELETE FROM monthly_cotisation WHERE id = %s", (cls.monthly_id,))
+            cr.execute("DELETE FROM res_partner WHERE id IN %s", (tuple(cls.partner_ids),))
+            cr.commit()
+
+    def _submissions(self):
+        """Soumissions de toutes les caisses, chacune livrée deux fois"""
+        amount = self.AMOUNT_DUE / self.PAYMENTS_PER_MEMBER
+        submissions = [
+            (f"{self.KEY_PREFIX}:{cotisation_id}:{index}", [{"cotisation_id": cotisation_id, "amount": amount}])
+            for cotisation_id in self.cotisation_ids
+            for index in range(self.PAYMENTS_PER_MEMBER)
+        ]
+        return submissions * 2
+
+    def _worker(self, submissions, failures, retries):
+        """Une caisse: soumet et valide chaque paiement, rejoue les conflits"""
+        with closing(sql_db.db_connect(self.dbname).cursor()) as cr:
+            env = api.Environment(cr, SUPERUSER_ID, {})
+            Intake = env["cotisation.payment.intake"]
+            for key, plan in submissions:
+                for attempt in range(1, self.MAX_ATTEMPTS + 1):
+                    try:
+                        Intake.submit(key, plan, {"payment_method": "cash"}, source="stress", post_summary=False)
+                        env.flush_all()
+                        cr.commit()
+                        break
+                    except self.RETRYABLE_ERRORS:
+                        cr.rollback()
+                        retries.append(key)
+                        time.sleep(0.01 * attempt)
+                    except Exception as e:
+                        cr.rollback()
+                        failures.append(f"{key}: {e}")
+                        break
+                else:
+                    failures.append(f"{key}: abandon après {self.MAX_ATTEMPTS} tentatives")
+
+    def test_concurrent_postings_keep_balances_exact(self):
+        submissions = self._submissions()
+        random.Random(42).shuffle(submissions)
+        slices = [submissions[index::self.WORKERS] for index in range(self.WORKERS)]
+        failures, retries = [], []
+
+        threads = [
+            threading.Thread(target=self._worker, args=(chunk, failures, retries))
+            for chunk in slices
+        ]
+        started = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        duration = time.monotonic() - started
+        _logger.info(
+            f"Registre: {len(submissions)} soumissions par {self.WORKERS} caisses en {duration:.2f}s "
+            f"({len(submissions) / max(duration, 0.001):.0f}/s, {len(retries)} conflits rejoués)"
+        )
+        self.assertFalse(failures, "\n".join(failures[:20]))
+
+        expected_count = self.MEMBER_COUNT * self.PAYMENTS_PER_MEMBER
+        with closing(sql_db.db_connect(self.dbname).cursor()) as cr:
+            # Aucune mise à jour perdue: chaque solde égale son registre et le montant dû
+            cr.execute(
+                """
+                SELECT c.id, c.amount_paid, COALESCE(SUM(p.amount), 0), COUNT(p.id)
+                FROM member_cotisation c
+                LEFT JOIN cotisation_payment p ON p.cotisation_id = c.id AND p.state = 'confirmed'
+                WHERE c.id IN %s
+                GROUP BY c.id, c.amount_paid
+                """,
+                (tuple(self.cotisation_ids),),
+            )
+            rows = cr.fetchall()
+            self.assertEqual(len(rows), self.MEMBER_COUNT)
+            for cotisation_id, amount_paid, ledger_total, payment_count in rows:
+                self.assertAlmostEqual(float(amount_paid), self.AMOUNT_DUE, msg=f"cotisation {cotisation_id}")
+                self.assertAlmostEqual(float(ledger_total), float(amount_paid), msg=f"cotisation {cotisation_id}")
+                self.assertEqual(payment_count, self.PAYMENTS_PER_MEMBER)
+
+            # Aucun doublon: une soumission traitée et un paiement par clé
+            cr.execute(
+                """
+                SELECT i.idempotency_key, i.state, COUNT(p.id)
+                FROM cotisation_payment_intake i
+                LEFT JOIN cotisation_payment p ON p.intake_id = i.id
+                WHERE i.idempotency_key LIKE %s
+                GROUP BY i.id, i.idempotency_key, i.state
+                """,
+                (f"{self.KEY_PREFIX}:%",),
+            )
+            intakes = cr.fetchall()
+            self.assertEqual(len(intakes), expected_count)
+            for key, state, payment_count in intakes:
+                self.assertEqual(state, "done", key)
+                self.assertEqual(payment_count, 1, key)
+
+
+@tagged("post_install", "-at_install")
+class TestPaymentLedgerReconciliation(TransactionCase):
+    """Réconciliation des soldes contre le registre des paiements"""
+
+    MEMBER_COUNT = 20
+    AMOUNT_DUE = 100.0
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        today = fields.Date.today()
+        group = cls.env["res.partner"].create({"name": "Groupe de test", "is_company": True})
+        monthly = cls.env["monthly.cotisation"].create({
+            "group_id": group.id,
+            "month": str(today.month),
+            "year": today.year,
+            "amount": cls.AMOUNT_DUE,
+        })
+        members = cls.env["res.partner"].create([
+            {"name": f"Membre {index}"} for index in range(cls.MEMBER_COUNT)
+        ])
+        cls.cotisations = cls.env["member.cotisation"].create([
+            {
+                "member_id": member.id,
+                "cotisation_type": "monthly",
+                "monthly_cotisation_id": monthly.id,
+                "amount_due": cls.AMOUNT_DUE,
+                "due_date": today,
+            }
+            for member in members
+        ])
+        cls.intake = cls.env["cotisation.payment.intake"]
+        cls.Cotisation = cls.env["member.cotisation"]
+
+    def test_reconciliation_ignores_rounding_drift(self):
+        for cotisation in self.cotisations:
+            self.intake.submit(
+                f"drift:{cotisation.id}",
+                [{"cotisation_id": cotisation.id, "amount": 20.0}],
+                {"payment_method": "cash"},
+                source="stress",
+                post_summary=False,
+            )
+        self.Cotisation.flush_model()
+
+        # Écarts inférieurs à l'arrondi sur toutes les cotisations sauf la dernière
+        drifted, broken = self.cotisations[:-1], self.cotisations[-1]
+        self.env.cr.execute(
+            "UPDATE member_cotisation SET amount_paid = amount_paid + 0.001 WHERE id IN %s",
+            (tuple(drifted.ids),),
+        )
+        self.env.cr.execute(
+            "UPDATE member_cotisation SET amount_paid = amount_paid - 5 WHERE id = %s",
+            (broken.id,),
+        )
+        self.Cotisation.invalidate_model(["amount_paid"])
+
+        # Avec une limite de 1, seul l'écart réel doit être traité
+        self.Cotisation._cron_reconcile_payment_ledger(batch_size=1)
+        self.assertAlmostEqual(broken.amount_paid, 20.0)
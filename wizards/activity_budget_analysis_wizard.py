@@ -133,17 +133,10 @@ class ActivityBudgetAnalysisWizard(models.TransientModel):
                 }
             )
 
-            # Générer le contenu HTML pour le PDF
-            html_content = self._generate_pdf_template(data)
-            
-            # Créer un rapport PDF temporaire
-            report_name = f"budget_analysis_{self.activity_id.name.replace(' ', '_')}"
-            
-            # Utiliser le moteur de rapport Odoo pour générer le PDF
+            # Le template QWeb compilé du rapport lit directement report_data
             pdf_content = self.env['ir.actions.report']._render_qweb_pdf(
                 'contribution_management.budget_analysis_report',
                 [report_wizard.id],
-                data={'html_content': html_content, 'data': data}
             )[0]
 
             # Créer l'attachement PDF
@@ -168,478 +161,6 @@ class ActivityBudgetAnalysisWizard(models.TransientModel):
         except Exception as e:
             _logger.error(f"Erreur lors de l'export PDF: {e}")
             raise UserError(f"Impossible de générer le PDF: {str(e)}")
-
-    def _generate_pdf_template(self, data):
-        """Génère le template HTML optimisé pour l'export PDF"""
-        
-        # Helper functions pour la sécurité des données
-        def safe_float(val, default=0.0):
-            try:
-                return float(val) if val is not None else default
-            except:
-                return default
-
-        def safe_int(val, default=0):
-            try:
-                return int(val) if val is not None else default
-            except:
-                return default
-
-        # Extraction sécurisée des données
-        budget_amount = safe_float(data.get("budget_amount"))
-        total_expenses = safe_float(data.get("total_expenses"))
-        budget_remaining = safe_float(data.get("budget_remaining"))
-        budget_used_percentage = safe_float(data.get("budget_used_percentage"))
-        total_collected = safe_float(data.get("total_collected"))
-        net_result = safe_float(data.get("net_result"))
-        profitability_rate = safe_float(data.get("profitability_rate"))
-        participant_count = safe_int(data.get("participant_count"))
-        activity_name = str(data.get("activity_name", "Activité non spécifiée"))
-
-        # Gestion de la date d'analyse
-        analysis_date = "Date non disponible"
-        if data.get("analysis_date"):
-            try:
-                analysis_date = str(data["analysis_date"]).split(".")[0]
-            except Exception:
-                pass
-
-        # CSS pour le PDF
-        css_styles = """
-        <style>
-            body { 
-                font-family: 'DejaVu Sans', Arial, sans-serif; 
-                font-size: 12px; 
-                line-height: 1.4; 
-                margin: 0; 
-                padding: 20px;
-            }
-            .header { 
-                text-align: center; 
-                margin-bottom: 30px; 
-                border-bottom: 2px solid #00477a; 
-                padding-bottom: 15px;
-            }
-            .header h1 { 
-                color: #00477a; 
-                font-size: 24px; 
-                margin: 0 0 10px 0;
-            }
-            .header h2 { 
-                color: #666; 
-                font-size: 18px; 
-                margin: 0 0 5px 0;
-            }
-            .header p { 
-                color: #999; 
-                font-size: 11px; 
-                margin: 0;
-            }
-            .section { 
-                margin-bottom: 25px; 
-                page-break-inside: avoid;
-            }
-            .section-title { 
-                background-color: #00477a; 
-                color: white; 
-                padding: 8px 12px; 
-                font-size: 14px; 
-                font-weight: bold; 
-                margin-bottom: 0;
-            }
-            .section-content { 
-                border: 1px solid #dee2e6; 
-                border-top: none; 
-                padding: 15px;
-            }
-            .financial-grid { 
-                display: grid; 
-                grid-template-columns: 1fr 1fr; 
-                gap: 20px; 
-                margin-bottom: 20px;
-            }
-            .metric-card { 
-                border: 1px solid #e0e0e0; 
-                padding: 12px; 
-                text-align: center;
-            }
-            .metric-value { 
-                font-size: 16px; 
-                font-weight: bold; 
-                margin-bottom: 5px;
-            }
-            .metric-label { 
-                font-size: 11px; 
-                color: #666; 
-                text-transform: uppercase;
-            }
-            .positive { color: #28a745; }
-            .negative { color: #dc3545; }
-            .warning { color: #ffc107; }
-            table { 
-                width: 100%; 
-                border-collapse: collapse; 
-                margin-top: 10px;
-            }
-            th, td { 
-                border: 1px solid #dee2e6; 
-                padding: 8px; 
-                text-align: left;
-            }
-            th { 
-                background-color: #f8f9fa; 
-                font-weight: bold; 
-                font-size: 11px;
-            }
-            td { 
-                font-size: 11px;
-            }
-            .text-right { text-align: right; }
-            .text-center { text-align: center; }
-            .recommendation { 
-                padding: 10px; 
-                margin: 5px 0; 
-                border-left: 4px solid;
-            }
-            .rec-success { 
-                border-left-color: #28a745; 
-                background-color: #d4edda;
-            }
-            .rec-warning { 
-                border-left-color: #ffc107; 
-                background-color: #fff3cd;
-            }
-            .rec-danger { 
-                border-left-color: #dc3545; 
-                background-color: #f8d7da;
-            }
-            .rec-info { 
-                border-left-color: #17a2b8; 
-                background-color: #d1ecf1;
-            }
-            .forecast-grid { 
-                display: grid; 
-                grid-template-columns: repeat(2, 1fr); 
-                gap: 15px;
-            }
-            .progress-bar-container { 
-                background-color: #e9ecef; 
-                height: 20px; 
-                border-radius: 4px; 
-                overflow: hidden; 
-                margin: 10px 0;
-            }
-            .progress-bar { 
-                height: 100%; 
-                background-color: #007bff; 
-                transition: width 0.3s ease;
-            }
-            .footer { 
-                margin-top: 30px; 
-                text-align: center; 
-                font-size: 10px; 
-                color: #666; 
-                border-top: 1px solid #dee2e6; 
-                padding-top: 15px;
-            }
-        </style>
-        """
-
-        # Construction du HTML pour PDF
-        html_template = f"""
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <meta charset="utf-8"/>
-            <title>Analyse Budgétaire - {activity_name}</title>
-            {css_styles}
-        </head>
-        <body>
-            <!-- En-tête -->
-            <div class="header">
-                <h1>Analyse Budgétaire</h1>
-                <h2>{activity_name}</h2>
-                <p>Rapport généré le {analysis_date}</p>
-            </div>
-
-            <!-- Résumé Exécutif -->
-            <div class="section">
-                <div class="section-title">Résumé Exécutif</div>
-                <div class="section-content">
-                    <div class="financial-grid">
-                        <div class="metric-card">
-                            <div class="metric-value {'positive' if net_result >= 0 else 'negative'}">{net_result:.2f} F</div>
-                            <div class="metric-label">Résultat Net</div>
-                        </div>
-                        <div class="metric-card">
-                            <div class="metric-value">{profitability_rate:.1f}%</div>
-                            <div class="metric-label">Rentabilité</div>
-                        </div>
-                        <div class="metric-card">
-                            <div class="metric-value {'negative' if budget_remaining < 0 else 'positive'}">{budget_remaining:.2f} F</div>
-                            <div class="metric-label">Budget Restant</div>
-                        </div>
-                        <div class="metric-card">
-                            <div class="metric-value">{participant_count}</div>
-                            <div class="metric-label">Participants</div>
-                        </div>
-                    </div>
-                </div>
-            </div>
-
-            <!-- Analyse Budgétaire Détaillée -->
-            <div class="section">
-                <div class="section-title">Analyse Budgétaire Détaillée</div>
-                <div class="section-content">
-                    <table>
-                        <tr>
-                            <td><strong>Budget Alloué</strong></td>
-                            <td class="text-right">{budget_amount:.2f} F</td>
-                        </tr>
-                        <tr>
-                            <td><strong>Dépenses Totales</strong></td>
-                            <td class="text-right">{total_expenses:.2f} F</td>
-                        </tr>
-                        <tr>
-                            <td><strong>Budget Restant</strong></td>
-                            <td class="text-right {'positive' if budget_remaining >= 0 else 'negative'}">{budget_remaining:.2f} F</td>
-                        </tr>
-                        <tr>
-                            <td><strong>% Budget Utilisé</strong></td>
-                            <td class="text-right">{budget_used_percentage:.1f}%</td>
-                        </tr>
-                    </table>
-                    
-                    <div class="progress-bar-container">
-                        <div class="progress-bar" style="width: {min(budget_used_percentage, 100):.1f}%;"></div>
-                    </div>
-                    <p class="text-center" style="font-size: 10px; margin-top: 5px;">
-                        Utilisation du budget: {budget_used_percentage:.1f}%
-                    </p>
-                </div>
-            </div>
-
-            <!-- Analyse Financière -->
-            <div class="section">
-                <div class="section-title">Analyse Financière</div>
-                <div class="section-content">
-                    <table>
-                        <tr>
-                            <td><strong>Recettes Collectées</strong></td>
-                            <td class="text-right">{total_collected:.2f} F</td>
-                        </tr>
-                        <tr>
-                            <td><strong>Dépenses Totales</strong></td>
-                            <td class="text-right">{total_expenses:.2f} F</td>
-                        </tr>
-                        <tr>
-                            <td><strong>Résultat Net</strong></td>
-                            <td class="text-right {'positive' if net_result >= 0 else 'negative'}">{net_result:.2f} F</td>
-                        </tr>
-                        <tr>
-                            <td><strong>Taux de Rentabilité</strong></td>
-                            <td class="text-right">{profitability_rate:.1f}%</td>
-                        </tr>
-                        <tr>
-                            <td><strong>Nombre de Participants</strong></td>
-                            <td class="text-right">{participant_count}</td>
-                        </tr>
-                    </table>
-                </div>
-            </div>
-
-            {self._generate_expenses_section_pdf(data.get("expenses_by_category", {}))}
-            {self._generate_recommendations_section_pdf(data.get("recommendations", []))}
-            {self._generate_forecast_section_pdf(data.get("forecast", {}))}
-
-            <!-- Pied de page -->
-            <div class="footer">
-                <p>Rapport généré automatiquement par le système de gestion d'activités</p>
-                <p>© {fields.Date.today().year} - Document confidentiel</p>
-            </div>
-        </body>
-        </html>
-        """
-
-        return html_template
-
-    def _generate_expenses_section_pdf(self, expenses_by_category):
-        """Génère la section des dépenses par catégorie pour le PDF"""
-        if not expenses_by_category:
-            return ""
-
-        rows = ""
-        total_amount = sum(cat_data.get("amount", 0) for cat_data in expenses_by_category.values() if isinstance(cat_data, dict))
-        
-        for category, cat_data in expenses_by_category.items():
-            if isinstance(cat_data, dict):
-                amount = cat_data.get("amount", 0)
-                count = cat_data.get("count", 0)
-                percentage = cat_data.get("percentage", 0)
-                
-                rows += f"""
-                <tr>
-                    <td>{category}</td>
-                    <td class="text-right">{amount:.2f} F</td>
-                    <td class="text-center">{count}</td>
-                    <td class="text-right">{percentage:.1f}%</td>
-                </tr>
-                """
-
-        return f"""
-        <div class="section">
-            <div class="section-title">Répartition des Dépenses par Catégorie</div>
-            <div class="section-content">
-                <table>
-                    <thead>
-                        <tr>
-                            <th>Catégorie</th>
-                            <th class="text-right">Montant</th>
-                            <th class="text-center">Nombre</th>
-                            <th class="text-right">Pourcentage</th>
-                        </tr>
-                    </thead>
-                    <tbody>
-                        {rows}
-                    </tbody>
-                    <tfoot>
-                        <tr style="font-weight: bold; background-color: #f8f9fa;">
-                            <td>TOTAL</td>
-                            <td class="text-right">{total_amount:.2f} F</td>
-                            <td class="text-center">{sum(cat_data.get('count', 0) for cat_data in expenses_by_category.values() if isinstance(cat_data, dict))}</td>
-                            <td class="text-right">100.0%</td>
-                        </tr>
-                    </tfoot>
-                </table>
-            </div>
-        </div>
-        """
-
-    def _generate_recommendations_section_pdf(self, recommendations):
-        """Génère la section des recommandations pour le PDF"""
-        if not recommendations:
-            return ""
-
-        rec_html = ""
-        type_mapping = {
-            "success": "rec-success",
-            "warning": "rec-warning", 
-            "danger": "rec-danger",
-            "error": "rec-danger",
-            "info": "rec-info"
-        }
-
-        for rec in recommendations:
-            if isinstance(rec, dict):
-                rec_type = rec.get("type", "info")
-                css_class = type_mapping.get(rec_type, "rec-info")
-                title = rec.get("title", "")
-                message = rec.get("message", "")
-                
-                rec_html += f"""
-                <div class="recommendation {css_class}">
-                    <strong>{title}</strong><br/>
-                    {message}
-                </div>
-                """
-
-        return f"""
-        <div class="section">
-            <div class="section-title">Recommandations</div>
-            <div class="section-content">
-                {rec_html}
-            </div>
-        </div>
-        """
-
-    def _generate_forecast_section_pdf(self, forecast):
-        """Génère la section des prévisions pour le PDF"""
-        if not forecast:
-            return ""
-
-        progress = forecast.get("progress_percentage", 0)
-        projected_expenses = forecast.get("projected_total_expenses", 0)
-        projected_collected = forecast.get("projected_total_collected", 0)
-        projected_net = forecast.get("projected_net_result", 0)
-        projected_budget_usage = forecast.get("projected_budget_usage", 0)
-
-        return f"""
-        <div class="section">
-            <div class="section-title">Prévisions et Projections</div>
-            <div class="section-content">
-                <p><strong>Progression de l'activité:</strong> {progress:.1f}%</p>
-                <div class="progress-bar-container">
-                    <div class="progress-bar" style="width: {min(progress, 100):.1f}%; background-color: #28a745;"></div>
-                </div>
-                
-                <div class="forecast-grid">
-                    <div>
-                        <h4>Projections Financières</h4>
-                        <table>
-                            <tr>
-                                <td><strong>Dépenses Projetées</strong></td>
-                                <td class="text-right">{projected_expenses:.2f} F</td>
-                            </tr>
-                            <tr>
-                                <td><strong>Recettes Projetées</strong></td>
-                                <td class="text-right">{projected_collected:.2f} F</td>
-                            </tr>
-                            <tr>
-                                <td><strong>Résultat Net Projeté</strong></td>
-                                <td class="text-right {'positive' if projected_net >= 0 else 'negative'}">{projected_net:.2f} F</td>
-                            </tr>
-                        </table>
-                    </div>
-                    <div>
-                        <h4>Projection Budgétaire</h4>
-                        <table>
-                            <tr>
-                                <td><strong>Usage Budget Projeté</strong></td>
-                                <td class="text-right">{projected_budget_usage:.1f}%</td>
-                            </tr>
-                        </table>
-                        <div class="progress-bar-container">
-                            <div class="progress-bar" style="width: {min(projected_budget_usage, 100):.1f}%; 
-                                background-color: {'#dc3545' if projected_budget_usage > 100 else '#007bff'};"></div>
-                        </div>
-                    </div>
-                </div>
-            </div>
-        </div>
-        """
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
 
     def action_generate_analysis(self):
         """Génère l'analyse budgétaire"""
@@ -1469,171 +990,94 @@ class ActivityBudgetReportDisplay(models.TransientModel):
                 _logger.exception("Erreur lors du calcul du rapport HTML : %s", e)
                 wizard.report_html = f"<div style='padding: 20px; color: red;'>Erreur : {str(e)}</div>"
 
+    # Couleurs des recommandations, résolues une fois lors de la préparation
+    RECOMMENDATION_COLORS = {
+        "success": "#d1edcc",
+        "warning": "#fff3cd",
+        "info": "#d1ecf1",
+        "error": "#f8d7da",
+    }
+
     def _generate_html_report(self, data):
-        """Génère le rapport HTML avec gestion robuste des valeurs"""
+        """Génère le rapport HTML via le template QWeb compilé"""
         try:
-            # Helper sécurisé pour conversion numérique
-            def safe_float(val, default=0.0):
-                try:
-                    return float(val) if val is not None else default
-                except:
-                    return default
-
-            def safe_int(val, default=0):
-                try:
-                    return int(val) if val is not None else default
-                except:
-                    return default
-
-            budget_amount = safe_float(data.get("budget_amount"))
-            total_expenses = safe_float(data.get("total_expenses"))
-            budget_remaining = safe_float(data.get("budget_remaining"))
-            budget_used_percentage = safe_float(data.get("budget_used_percentage"))
-            total_collected = safe_float(data.get("total_collected"))
-            net_result = safe_float(data.get("net_result"))
-            profitability_rate = safe_float(data.get("profitability_rate"))
-            participant_count = safe_int(data.get("participant_count"))
-
-            activity_name = str(data.get("activity_name", "Activité non spécifiée"))
-
-            # Gestion sécurisée de la date
-            analysis_date = "Date non disponible"
-            if data.get("analysis_date"):
-                try:
-                    analysis_date = str(data["analysis_date"]).split(".")[0]
-                except Exception:
-                    pass
-
-            # Construction HTML
-            html = f"""
-            <div style="width: 100%; padding: 15px;">
-                <div style="flex: 1; min-width: 900px;">
-                    <div style="text-align: center; margin-bottom: 30px;">
-                        <h2>Analyse Budgétaire</h2>
-                        <h4 style="color: #6c757d;">{activity_name}</h4>
-                        <p style="color: #6c757d;">Générée le {analysis_date}</p>
-                    </div>
-                </div>
-                {self._render_budget_summary(budget_amount, total_expenses, budget_remaining, budget_used_percentage)}
-                {self._render_financial_analysis(total_collected, net_result, profitability_rate, participant_count)}
-                {self._render_expenses_by_category(data.get("expenses_by_category", {}))}
-                {self._render_recommendations(data.get("recommendations", []))}
-                {self._render_forecast(data.get("forecast", {}))}
-            </div>
-            """
-            return html
+            values = self._prepare_render_values(data)
+            return self.env["ir.qweb"]._render(
+                "contribution_management.budget_analysis_display_html", values
+            )
 
         except Exception as e:
             _logger.error("Erreur lors de la génération HTML : %s", str(e))
             return "<div style='padding: 20px; color: red;'>Erreur lors de la génération du rapport.</div>"
 
-    # === SOUS-FONCTIONS POUR GÉNÉRER CHAQUE SECTION ===
-
-    def _render_budget_summary(self, budget_amount, total_expenses, budget_remaining, budget_used_percentage):
-        return f"""
-        <div style="display: flex; gap: 20px;">
-            <div style="flex: 1; min-width: 900px;">
-                <div style="border: 1px solid #dee2e6; border-radius: 0.375rem;">
-                    <div style="background-color: #00477a; color: #ffffff; padding: 12px;">
-                        <h5 style="color: #ffffff;">Résumé Budgétaire</h5>
-                    </div>
-                    <div style="padding: 15px;">
-                        <table style="width: 100%;">
-                            <tr><td><b>Budget alloué:</b></td><td style="text-align: right;">{budget_amount:.2f} F</td></tr>
-                            <tr><td><b>Dépenses totales:</b></td><td style="text-align: right;">{total_expenses:.2f} F</td></tr>
-                            <tr><td><b>Budget restant:</b></td><td style="text-align: right; color:{'red' if budget_remaining<0 else 'green'};">{budget_remaining:.2f} F</td></tr>
-                            <tr><td><b>% Budget utilisé:</b></td><td style="text-align: right;">{budget_used_percentage:.1f}%</td></tr>
-                        </table>
-                    </div>
-                </div>
-            </div>
-        </div>
-        """
-
-    def _render_financial_analysis(self, total_collected, net_result, profitability_rate, participant_count):
-        return f"""
-        <div style="margin-top: 20px;">
-            <div style="flex: 1; min-width: 900px;">
-                <div style="border: 1px solid #dee2e6; border-radius: 0.375rem;">
-                    <div style="background-color: #006400; color: #ffffff; padding: 12px;">
-                        <h5 style="color: #ffffff;">Analyse Financière</h5>
-                    </div>
-                    <div style="padding: 15px;">
-                        <table style="width: 100%;">
-                            <tr><td><b>Recettes collectées:</b></td><td style="text-align: right;">{total_collected:.2f} F</td></tr>
-                            <tr><td><b>Résultat net:</b></td><td style="text-align: right; color:{'green' if net_result>=0 else 'red'};">{net_result:.2f} F</td></tr>
-                            <tr><td><b>Taux de rentabilité:</b></td><td style="text-align: right;">{profitability_rate:.1f}%</td></tr>
-                            <tr><td><b>Participants:</b></td><td style="text-align: right;">{participant_count}</td></tr>
-                        </table>
-                    </div>
-                </div>
-            </div>
-        </div>
-        """
-
-    def _render_expenses_by_category(self, expenses):
-        if not expenses:
-            return ""
-        rows = "".join(
-            f"<tr><td style='text-align:center;'>{cat}</td><td style='text-align:center;'>{vals.get('amount',0):.2f} F</td><td style='text-align:center;'>{vals.get('count',0)}</td><td style='text-align:center;'>{vals.get('percentage',0):.1f}%</td></tr>"
-            for cat, vals in expenses.items() if isinstance(vals, dict)
-        )
-        return f"""
-        <div style="margin-top: 20px;">
-            <div style="flex: 1; min-width: 900px;">
-                <div style="border: 1px solid #dee2e6; border-radius: 0.375rem;">
-                    <div style="background-color: #0dcaf0; color: white; padding: 12px;">
-                        <h5>Répartition des Dépenses</h5>
-                    </div>
-                    <div style="padding: 15px;">
-                        <table style="width: 100%; border:1px solid #dee2e6 collapse;">
-                            <thead><tr><th style='text-align:center; text-weight: bold;'>Catégorie</th><th style='text-align:center; text-weight: bold;'>Montant</th><th style='text-align:center; text-weight: bold;'>Nombre</th><th style='text-align:center; text-weight: bold;'>%</th></tr></thead>
-                            <tbody>{rows}</tbody>
-                        </table>
-                    </div>
-                </div>
-            </div>
-        </div>
-        """
-
-    def _render_recommendations(self, recommendations):
-        if not recommendations:
-            return ""
-        blocks = ""
-        alert_colors = {"success": "#d1edcc","warning": "#fff3cd","info": "#d1ecf1","error": "#f8d7da"}
-        for rec in recommendations:
-            if isinstance(rec, dict):
-                color = alert_colors.get(rec.get("type","info"), "#d1ecf1")
-                blocks += f"""
-                <div style="flex: 1; min-width: 900px;">
-                    <div style="background-color:{color}; border:1px solid #dee2e6; border-radius: 0.375rem; padding: 10px; margin-bottom: 10px;">
-                        <h6>{rec.get('title','')}</h6><p>{rec.get('message','')}</p>
-                    </div>
-                </div>
-                """
-        return f"<div style='margin-top:20px;'>{blocks}</div>"
-
-    def _render_forecast(self, forecast):
-        if not forecast:
-            return ""
-        return f"""
-        <div style="margin-top: 20px;">
-            <div style="flex: 1; min-width: 900px;">
-                <div style="border: 1px solid #dee2e6; border-radius: 0.375rem;">
-                    <div style="background-color: #6c757d; color: white; padding: 12px;">
-                        <h5>Prévisions</h5>
-                    </div>
-                    <div style="padding: 15px;">
-                        <p><b>Progression:</b> {forecast.get('progress_percentage',0):.1f}%</p>
-                        <p><b>Dépenses projetées:</b> {forecast.get('projected_total_expenses',0):.2f} F</p>
-                        <p><b>Recettes projetées:</b> {forecast.get('projected_total_collected',0):.2f} F</p>
-                        <p><b>Résultat net projeté:</b> <span style="color:{'green' if forecast.get('projected_net_result',0)>=0 else 'red'};">{forecast.get('projected_net_result',0):.2f} F</span></p>
-                        <p><b>Usage budget projeté:</b> {forecast.get('projected_budget_usage',0):.1f}%</p>
-                    </div>
-                </div>
-            </div>
-        </div>
-        """
+    def _prepare_render_values(self, data):
+        """Prépare en une passe le jeu de données consommé par le template"""
+
+        def safe_float(val, default=0.0):
+            try:
+                return float(val) if val is not None else default
+            except (TypeError, ValueError):
+                return default
+
+        def safe_int(val, default=0):
+            try:
+                return int(val) if val is not None else default
+            except (TypeError, ValueError):
+                return default
+
+        analysis_date = "Date non disponible"
+        if data.get("analysis_date"):
+            analysis_date = str(data["analysis_date"]).split(".")[0]
+
+        categories = [
+            {
+                "name": name,
+                "amount": safe_float(vals.get("amount")),
+                "count": safe_int(vals.get("count")),
+                "percentage": safe_float(vals.get("percentage")),
+            }
+            for name, vals in (data.get("expenses_by_category") or {}).items()
+            if isinstance(vals, dict)
+        ]
+
+        recommendations = [
+            {
+                "title": rec.get("title", ""),
+                "message": rec.get("message", ""),
+                "color": self.RECOMMENDATION_COLORS.get(rec.get("type", "info"), "#d1ecf1"),
+            }
+            for rec in (data.get("recommendations") or [])
+            if isinstance(rec, dict)
+        ]
+
+        forecast = data.get("forecast") or {}
+        if forecast:
+            forecast = {
+                key: safe_float(forecast.get(key))
+                for key in (
+                    "progress_percentage",
+                    "projected_total_expenses",
+                    "projected_total_collected",
+                    "projected_net_result",
+                    "projected_budget_usage",
+                )
+            }
+
+        return {
+            "activity_name": str(data.get("activity_name", "Activité non spécifiée")),
+            "analysis_date": analysis_date,
+            "budget_amount": safe_float(data.get("budget_amount")),
+            "total_expenses": safe_float(data.get("total_expenses")),
+            "budget_remaining": safe_float(data.get("budget_remaining")),
+            "budget_used_percentage": safe_float(data.get("budget_used_percentage")),
+            "total_collected": safe_float(data.get("total_collected")),
+            "net_result": safe_float(data.get("net_result")),
+            "profitability_rate": safe_float(data.get("profitability_rate")),
+            "participant_count": safe_int(data.get("participant_count")),
+            "categories": categories,
+            "recommendations": recommendations,
+            "forecast": forecast,
+        }
 
 class ActivityFinancialAnalysis(models.TransientModel):
     """Modèle temporaire pour les analyses financières complexes"""
@@ -1646,6 +1090,19 @@ class ActivityFinancialAnalysis(models.TransientModel):
     date_from = fields.Date(string="Date de début")
     date_to = fields.Date(string="Date de fin")
 
+    ranking_metric = fields.Selection(
+        [
+            ("net_result", "Résultat net"),
+            ("total_collected", "Recettes"),
+            ("total_expenses", "Dépenses"),
+            ("profitability_rate", "Rentabilité"),
+            ("participant_count", "Participants"),
+            ("completion_rate", "Taux de collecte"),
+        ],
+        string="Classer par",
+        default="net_result",
+    )
+
     analysis_result = fields.Html(string="Résultat de l'analyse")
 
     def action_generate_comparative_analysis(self):
@@ -1668,95 +1125,28 @@ class ActivityFinancialAnalysis(models.TransientModel):
         }
 
     def _generate_comparative_report(self):
-        """Génère un rapport comparatif HTML"""
+        """Génère un rapport comparatif HTML via le template QWeb compilé"""
+        return self.env["ir.qweb"]._render(
+            "contribution_management.budget_comparative_analysis_html",
+            self._prepare_comparative_values(),
+        )
+
+    def _prepare_comparative_values(self):
+        """Construit lignes, cumuls par groupe et totaux depuis une requête agrégée"""
+        engine = self.env["activity.analytics.engine"]
         activities = self.activity_ids
+        state_labels = dict(activities._fields["state"].selection)
 
-        html = """
-        <div class="container-fluid">
-            <h3 class="text-center mb-4">Analyse Comparative des Activités</h3>
-            <table class="table table-striped table-hover">
-                <thead class="table-dark">
-                    <tr>
-                        <th>Activité</th>
-                        <th>Participants</th>
-                        <th>Recettes</th>
-                        <th>Dépenses</th>
-                        <th>Résultat Net</th>
-                        <th>Rentabilité</th>
-                        <th>Statut</th>
-                    </tr>
-                </thead>
-                <tbody>
-        """
-
-        total_collected = 0
-        total_expenses = 0
-
-        for activity in activities:
-            total_collected += activity.total_collected
-            total_expenses += activity.total_expenses
-
-            result_class = "text-success" if activity.net_result >= 0 else "text-danger"
-
-            html += f"""
-                <tr>
-                    <td><strong>{activity.name}</strong><br/><small class="text-muted">{activity.group_id.name}</small></td>
-                    <td>{activity.participant_count}</td>
-                    <td>{activity.total_collected:.2f} F</td>
-                    <td>{activity.total_expenses:.2f} F</td>
-                    <td class="{result_class}">{activity.net_result:.2f} F</td>
-                    <td>{activity.profitability_rate:.1f}%</td>
-                    <td><span class="badge bg-{'success' if activity.state == 'completed' else 'primary'}">{dict(activity._fields['state'].selection)[activity.state]}</span></td>
-                </tr>
-            """
-
-        total_net = total_collected - total_expenses
-        overall_profitability = (
-            (total_net / total_collected * 100) if total_collected > 0 else 0
+        rows = engine.compute_metrics(
+            activity_ids=activities.ids,
+            date_from=self.date_from,
+            date_to=self.date_to,
         )
+        for row in rows:
+            row["state_label"] = state_labels.get(row["state"], row["state"])
+        rows = engine.rank(rows, self.ranking_metric or "net_result")
+
+        group_rollups, totals = engine.rollup(rows, keys=("group_id",))
+        group_rollups = engine.rank(group_rollups, self.ranking_metric or "net_result")
 
-        html += f"""
-                </tbody>
-                <tfoot class="table-dark">
-                    <tr>
-                        <td><strong>TOTAL</strong></td>
-                        <td><strong>{sum(activities.mapped('participant_count'))}</strong></td>
-                        <td><strong>{total_collected:.2f} F</strong></td>
-                        <td><strong>{total_expenses:.2f} F</strong></td>
-                        <td class="{'text-success' if total_net >= 0 else 'text-danger'}"><strong>{total_net:.2f} F</strong></td>
-                        <td><strong>{overall_profitability:.1f}%</strong></td>
-                        <td>-</td>
-                    </tr>
-                </tfoot>
-            </table>
-            
-            <div class="row mt-4">
-                <div class="col-md-4">
-                    <div class="card text-center">
-                        <div class="card-body">
-                            <h5 class="card-title text-primary">{len(activities)}</h5>
-                            <p class="card-text">Activités analysées</p>
-                        </div>
-                    </div>
-                </div>
-                <div class="col-md-4">
-                    <div class="card text-center">
-                        <div class="card-body">
-                            <h5 class="card-title {'text-success' if total_net >= 0 else 'text-danger'}">{total_net:.2f} F</h5>
-                            <p class="card-text">Résultat net total</p>
-                        </div>
-                    </div>
-                </div>
-                <div class="col-md-4">
-                    <div class="card text-center">
-                        <div class="card-body">
-                            <h5 class="card-title text-info">{overall_profitability:.1f}%</h5>
-                            <p class="card-text">Rentabilité globale</p>
-                        </div>
-                    </div>
-                </div>
-            </div>
-        </div>
-        """
-
-        return html
\ No newline at end of file
+        return {"rows": rows, "group_rollups": group_rollups, "totals": totals}
@@ -13,6 +13,9 @@ class ActivityParticipantWizard(models.TransientModel):
     _description = "Assistant d'ajout de participants à une activité"
     _check_company_auto = True
 
+    # Taille d'une page de candidats pour la sélection interactive
+    ELIGIBLE_PAGE_SIZE = 80
+
     # Activité concernée
     activity_id = fields.Many2one(
         "group.activity",
@@ -185,11 +188,10 @@ class ActivityParticipantWizard(models.TransientModel):
         """Calcule le nombre de membres éligibles selon les critères"""
         for wizard in self:
             if wizard.selection_mode == 'criteria':
-                eligible_members = wizard._get_eligible_members()
-                wizard.eligible_members_count = len(eligible_members)
+                wizard.eligible_members_count = wizard._count_eligible_members()
             elif wizard.selection_mode == 'group_members' and wizard.group_id:
-                group_members = wizard._get_group_members(wizard.group_id)
-                wizard.eligible_members_count = len(group_members)
+                # Compteur mis en cache par l'index des appartenances
+                wizard.eligible_members_count = wizard.group_id.group_active_members_count
             else:
                 wizard.eligible_members_count = 0
     
@@ -289,8 +291,7 @@ class ActivityParticipantWizard(models.TransientModel):
         """Vérifie la sélection manuelle"""
         if self.selection_mode == 'manual' and self.selected_member_ids:
             # Vérifier que les membres ne participent pas déjà
-            existing_members = self.activity_id.cotisation_ids.filtered('active').mapped('member_id')
-            already_participating = self.selected_member_ids & existing_members
+            already_participating = self._existing_participants(self.selected_member_ids)
             
             if already_participating:
                 member_names = ', '.join(already_participating.mapped('name'))
@@ -319,57 +320,75 @@ class ActivityParticipantWizard(models.TransientModel):
         """Retourne les membres d'un groupe"""
         if not group:
             return self.env['res.partner']
-        
-        return self.env['res.partner'].search([
-            ('is_company', '=', False),
-            ('parent_id', '=', group.id),
-            ('active', '=', True)
-        ])
+        return group._get_group_members()
     
-    def _get_eligible_members(self):
-        """Retourne les membres éligibles selon les critères"""
+    def _existing_participants(self, members):
+        """Parmi members, ceux qui ont déjà une cotisation active pour l'activité"""
+        if not members or not self.activity_id:
+            return self.env['res.partner']
+        return self.env['member.cotisation'].search([
+            ('activity_id', '=', self.activity_id._origin.id),
+            ('member_id', 'in', members._origin.ids),
+        ]).member_id
+
+    def _eligibility_domain(self):
+        """Domaine des membres éligibles: critères sur les statistiques stockées
+        des partenaires, appartenance au groupe via l'index des appartenances
+        et exclusion des participants existants.
+
+        Passe par l'ORM pour que les règles d'accès (sociétés, partenaires)
+        s'appliquent aux candidats.
+        """
         domain = [
             ('is_company', '=', False),
-            ('active', '=', True)
+            ('cotisation_ids', 'not any', [('activity_id', '=', self.activity_id._origin.id or 0)]),
         ]
-        
-        # Filtrer par groupe si spécifié
         if self.member_group_id:
-            domain.append(('parent_id', '=', self.member_group_id.id))
-        
-        members = self.env['res.partner'].search(domain)
-        
-        # Appliquer les critères de paiement
+            domain.append(('group_membership_ids', 'any', [
+                ('group_id', '=', self.member_group_id._origin.id),
+                ('date_left', '=', False),
+            ]))
         if self.include_good_payers_only:
-            members = members.filtered('is_good_payer')
-        
+            domain.append(('is_good_payer', '=', True))
         if self.exclude_overdue_members:
-            members = members.filtered(lambda m: not m.has_overdue_payments)
-        
+            domain += ['|', ('overdue_cotisations', '=', 0), ('overdue_cotisations', '=', False)]
         if self.min_payment_rate > 0:
-            members = members.filtered(lambda m: m.payment_rate >= self.min_payment_rate)
-        
-        # Exclure les membres déjà participants
-        existing_members = self.activity_id.cotisation_ids.filtered('active').mapped('member_id')
-        members = members - existing_members
-        
-        return members
-    
+            domain.append(('payment_rate', '>=', self.min_payment_rate))
+        return domain
+
+    def _count_eligible_members(self):
+        """Nombre de membres éligibles, en une requête"""
+        return self.env['res.partner'].search_count(self._eligibility_domain())
+
+    def _get_eligible_member_ids(self, offset=0, limit=None):
+        """Identifiants des membres éligibles, triés par nom, éventuellement paginés"""
+        return self.env['res.partner'].search(
+            self._eligibility_domain(), offset=offset, limit=limit, order='name, id'
+        ).ids
+
+    def _get_eligible_members(self):
+        """Retourne les membres éligibles selon les critères"""
+        return self.env['res.partner'].browse(self._get_eligible_member_ids())
+
     def action_preview_selection(self):
         """Prévisualise la sélection de participants"""
         self.ensure_one()
         
+        # Domaine plutôt que liste d'identifiants: la liste est paginée par la vue
         if self.selection_mode == 'manual':
-            members = self.selected_member_ids
+            domain = [('id', 'in', self.selected_member_ids.ids)]
             title = "Participants sélectionnés manuellement"
         elif self.selection_mode == 'group_members':
-            members = self._get_group_members(self.group_id)
+            domain = [('group_membership_ids', 'any', [
+                ('group_id', '=', self.group_id.id),
+                ('date_left', '=', False),
+            ])]
             title = f"Tous les membres du groupe {self.group_id.name}"
         elif self.selection_mode == 'criteria':
-            members = self._get_eligible_members()
+            domain = self._eligibility_domain()
             title = "Membres selon critères"
         else:
-            members = self.env['res.partner']
+            domain = [('id', '=', False)]
             title = "Aucune sélection"
         
         return {
@@ -377,7 +396,8 @@ class ActivityParticipantWizard(models.TransientModel):
             'type': 'ir.actions.act_window',
             'res_model': 'res.partner',
             'view_mode': 'tree',
-            'domain': [('id', 'in', members.ids)],
+            'domain': domain,
+            'limit': self.ELIGIBLE_PAGE_SIZE,
             'target': 'new',
             'context': {'create': False, 'edit': False}
         }
@@ -427,8 +447,7 @@ class ActivityParticipantWizard(models.TransientModel):
             raise UserError("Aucun membre à ajouter.")
         
         # Vérifier les doublons
-        existing_members = self.activity_id.cotisation_ids.filtered('active').mapped('member_id')
-        duplicate_members = members_to_add & existing_members
+        duplicate_members = self._existing_participants(members_to_add)
         
         if duplicate_members:
             duplicate_names = ', '.join(duplicate_members.mapped('name'))
@@ -457,14 +476,24 @@ class ActivityParticipantWizard(models.TransientModel):
                 'currency_id': self.currency_id.id,
                 'company_id': self.company_id.id,
                 'description': f"Cotisation pour l'activité: {self.activity_id.name} (ajout manuel)",
-                'amount_paid': amount if self.auto_confirm_payment else 0.0,
-                'payment_date': fields.Date.today() if self.auto_confirm_payment else False
             })
         
         try:
             # Créer les cotisations en lot
             cotisations = self.env['member.cotisation'].create(cotisations_data)
             
+            # Paiements confirmés d'office: écritures du registre en un lot
+            if self.auto_confirm_payment:
+                self.env['cotisation.payment.posting'].post_plan(
+                    [{'cotisation_id': cotisation.id, 'amount': amount} for cotisation in cotisations],
+                    {
+                        'payment_method': 'other',
+                        'notes': "Paiement confirmé à l'ajout du participant",
+                        'currency_id': self.currency_id.id,
+                    },
+                    post_summary=False,
+                )
+            
             # Message de suivi dans l'activité
             self.activity_id.message_post(
                 body=f"{len(cotisations)} participants ajoutés manuellement: {', '.join(members_to_add.mapped('name'))}",
@@ -166,10 +166,39 @@ class ActivityOrganizationDashboard(models.TransientModel):
                 'is_overdue': task.is_overdue
             })
         
+        # Chemin critique et chaînes bloquées: valeurs stockées, une seule lecture
+        open_tasks = self.env['activity.task'].search_read(
+            [('activity_id', '=', activity.id), ('state', 'not in', ['completed', 'cancelled'])],
+            ['name', 'state', 'earliest_start_hours', 'slack_hours', 'is_critical',
+             'blocked_by_count', 'depends_on_task_ids'],
+            order='earliest_start_hours, id',
+        )
+        critical_path = [
+            {
+                'name': task['name'],
+                'state': task['state'],
+                'earliest_start_hours': task['earliest_start_hours'],
+            }
+            for task in open_tasks if task['is_critical']
+        ]
+        blocked_chains = [
+            {
+                'name': task['name'],
+                'blocked_by_count': task['blocked_by_count'],
+                'depends_on_task_ids': task['depends_on_task_ids'],
+                'earliest_start_hours': task['earliest_start_hours'],
+                'slack_hours': task['slack_hours'],
+                'is_critical': task['is_critical'],
+            }
+            for task in open_tasks if task['blocked_by_count']
+        ]
+        
         return {
             'organizers': organizer_data,
             'task_types': task_type_data,
             'timeline': timeline_data,
+            'critical_path': critical_path,
+            'blocked_chains': blocked_chains,
             'overall_stats': {
                 'organization_status': activity.organization_status,
                 'completion_rate': activity.task_completion_rate,
@@ -100,42 +100,34 @@ class BulkReportWizard(models.TransientModel):
         generated_reports = []
         email_sent_count = 0
         
+        if self.report_type == 'member':
+            report_ref = 'contribution_management.action_report_member_cotisations'
+        else:
+            report_ref = 'contribution_management.action_report_group_synthesis'
+        
+        # Les rapports inchangés sont servis depuis le cache
+        attachments = self.env['cotisation.report.cache'].get_report_attachments(
+            report_ref, self.partner_ids
+        )
+        
+        mail_attachments = {}
+        
         for partner in self.partner_ids:
-            try:
-                # Générer le rapport PDF
-                if self.report_type == 'member':
-                    report_ref = 'contribution_management.action_report_member_cotisations'
-                else:
-                    report_ref = 'contribution_management.action_report_group_synthesis'
-                
-                report_pdf = self.env.ref(report_ref).render_qweb_pdf([partner.id])
+            attachment = attachments.get(partner.id)
+            
+            if attachment:
+                generated_reports.append({
+                    'partner': partner.name,
+                    'attachment_id': attachment.id,
+                    'filename': attachment.name
+                })
                 
-                if report_pdf and report_pdf[0]:
-                    # Créer une pièce jointe
-                    filename = self._get_report_filename(partner)
-                    attachment = self.env['ir.attachment'].create({
-                        'name': filename,
-                        'type': 'binary',
-                        'datas': base64.b64encode(report_pdf[0]),
-                        'res_model': 'res.partner',
-                        'res_id': partner.id,
-                        'mimetype': 'application/pdf'
-                    })
-                    
-                    generated_reports.append({
-                        'partner': partner.name,
-                        'attachment_id': attachment.id,
-                        'filename': filename
-                    })
-                    
-                    # Envoyer par email si demandé
-                    if self.include_email and partner.email:
-                        self._send_report_email(partner, attachment)
-                        email_sent_count += 1
-                        
-            except Exception as e:
-                _logger.error(f"Erreur lors de la génération du rapport pour {partner.name}: {e}")
-                continue
+                # Envoyer par email si demandé
+                if self.include_email and partner.email:
+                    mail_attachments[partner.id] = attachment
+        
+        if mail_attachments:
+            email_sent_count = self._send_report_emails(mail_attachments)
         
         # Retourner le résumé
         return self._show_generation_summary(generated_reports, email_sent_count)
@@ -372,7 +364,7 @@ class BulkReportWizard(models.TransientModel):
             row += 1
         
         # Liste des membres
-        members = group.child_ids.filtered(lambda c: not c.is_company and c.active)
+        members = group._get_group_members()
         if members:
             row += 2
             ws[f'A{row}'] = "MEMBRES DU GROUPE"
@@ -524,30 +516,28 @@ class BulkReportWizard(models.TransientModel):
         }
         return labels.get(state, state)
 
-    def _send_report_email(self, partner, attachment):
-        """Envoie le rapport par email"""
+    def _send_report_emails(self, attachments_by_partner):
+        """Met en file les emails de rapport, chacun avec sa pièce jointe"""
+        if self.report_type == 'member':
+            template_ref = 'contribution_management.email_template_member_monthly_report'
+        else:
+            template_ref = 'contribution_management.email_template_group_monthly_report'
+        
+        mail_template = self.env.ref(template_ref, False)
+        if not mail_template:
+            return 0
+        
         try:
-            if self.report_type == 'member':
-                template_ref = 'contribution_management.email_template_member_monthly_report'
-                subject = f'Rapport de cotisations - {partner.name}'
-            else:
-                template_ref = 'contribution_management.email_template_group_monthly_report'
-                subject = f'Synthèse du groupe - {partner.name}'
-            
-            mail_template = self.env.ref(template_ref, False)
-            if mail_template:
-                # Créer l'email avec la pièce jointe
-                mail_values = mail_template.generate_email(partner.id)
-                mail_values['attachment_ids'] = [(4, attachment.id)]
-                
-                # Envoyer l'email
-                mail = self.env['mail.mail'].create(mail_values)
-                mail.send()
-                
-                _logger.info(f"Rapport envoyé par email à {partner.name} ({partner.email})")
-            
+            mails = self.env['cotisation.mail.dispatcher'].enqueue_template(
+                mail_template,
+                list(attachments_by_partner),
+                attachments_by_res_id=attachments_by_partner,
+            )
+            _logger.info(f"{len(mails)} rapports mis en file d'envoi")
+            return len(mails)
         except Exception as e:
-            _logger.warning(f"Erreur lors de l'envoi email pour {partner.name}: {e}")
+            _logger.warning(f"Erreur lors de la mise en file des emails de rapport: {e}")
+            return 0
 
     def _show_generation_summary(self, generated_reports, email_sent_count):
         """Affiche le résumé de génération"""
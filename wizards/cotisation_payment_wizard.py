@@ -347,19 +347,30 @@ class CotisationPaymentWizard(models.TransientModel):
             difference = cotisation.remaining_amount - actual_payment
             payment_notes += f"\nDifférence acceptée: {difference} {cotisation.currency_id.symbol}"
         
-        # Conserver les anciennes notes si elles existent
-        if cotisation.payment_notes:
-            payment_notes = f"{cotisation.payment_notes}\n---\n{payment_notes}"
-        
-        # Mettre à jour la cotisation
-        update_values = {
-            'amount_paid': new_amount_paid,
-            'payment_date': self.payment_date,
-            'payment_notes': payment_notes
-        }
+        # Écritures du registre: le paiement reçu et, le cas échéant, la différence acceptée
+        recorded_payment = min(actual_payment, new_amount_paid - cotisation.amount_paid)
+        plan = [{'cotisation_id': cotisation.id, 'amount': recorded_payment}]
+        accepted_difference = new_amount_paid - cotisation.amount_paid - recorded_payment
+        if accepted_difference > 0:
+            plan.append({
+                'cotisation_id': cotisation.id,
+                'amount': accepted_difference,
+                'values': {'payment_method': 'other', 'notes': "Différence acceptée"},
+            })
         
         try:
-            cotisation.write(update_values)
+            self.env['cotisation.payment.posting'].post_plan(
+                plan,
+                {
+                    'payment_date': self.payment_date,
+                    'payment_method': self.env['cotisation.payment']._map_payment_method(self.payment_method),
+                    'reference': self.reference,
+                    'notes': self.notes,
+                    'currency_id': cotisation.currency_id.id,
+                },
+                cotisation_note=payment_notes,
+                post_summary=False,
+            )
             
             # Créer un message de suivi dans le chatter
             cotisation.message_post(
@@ -430,9 +441,9 @@ class CotisationPaymentWizard(models.TransientModel):
         }
         
         try:
-            template.with_context(template_values).send_mail(
-                cotisation.id,
-                force_send=True,
+            self.env['cotisation.mail.dispatcher'].enqueue_template(
+                template.with_context(template_values),
+                [cotisation.id],
                 email_values={
                     'email_to': cotisation.member_id.email,
                     'subject': f'Reçu de paiement - {cotisation.display_name}'
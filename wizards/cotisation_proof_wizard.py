@@ -16,10 +16,15 @@ class CotisationPaymentProofRejectWizard(models.TransientModel):
     proof_id = fields.Many2one(
         "cotisation.payment.proof",
         string="Justificatif",
-        required=True,
         ondelete='cascade'
     )
     
+    proof_ids = fields.Many2many(
+        "cotisation.payment.proof",
+        string="Justificatifs",
+        default=lambda self: self._default_proof_ids()
+    )
+    
     rejection_reason = fields.Selection([
         ('invalid_proof', 'Justificatif invalide ou illisible'),
         ('amount_mismatch', 'Montant incorrect'),
@@ -41,26 +46,36 @@ class CotisationPaymentProofRejectWizard(models.TransientModel):
         default=True
     )
 
+    @api.model
+    def _default_proof_ids(self):
+        """Justificatifs sélectionnés dans la liste ou passés par le contexte"""
+        context = self.env.context
+        if context.get('active_model') == 'cotisation.payment.proof' and context.get('active_ids'):
+            return [(6, 0, context['active_ids'])]
+        if context.get('default_proof_id'):
+            return [(6, 0, [context['default_proof_id']])]
+        return []
+
     def action_confirm_reject(self):
-        """Confirme le rejet du justificatif"""
+        """Confirme le rejet des justificatifs en un lot"""
         self.ensure_one()
         
-        if not self.proof_id:
+        proofs = self.proof_ids | self.proof_id
+        if not proofs:
             raise UserError("Aucun justificatif sélectionné.")
         
-        # Effectuer le rejet
-        self.proof_id.do_reject(self.rejection_reason, self.rejection_notes)
-        
-        # Envoyer notification si demandé
-        if self.send_notification:
-            self.proof_id._notify_member_rejection()
+        # Rejet et notification groupés pour tout le lot
+        rejected = proofs.do_reject(
+            self.rejection_reason, self.rejection_notes, notify=self.send_notification
+        )
         
         return {
             'type': 'ir.actions.client',
             'tag': 'display_notification',
             'params': {
-                'title': 'Justificatif rejeté',
-                'message': f'Le justificatif a été rejeté. Le membre sera notifié.',
+                'title': 'Justificatif rejeté' if len(proofs) == 1 else 'Justificatifs rejetés',
+                'message': f'{len(rejected)} justificatif(s) rejeté(s). Les membres seront notifiés.'
+                           if self.send_notification else f'{len(rejected)} justificatif(s) rejeté(s).',
                 'type': 'warning',
             }
-        }
\ No newline at end of file
+        }
@@ -2,6 +2,8 @@
 
 from odoo import models, fields, api
 from odoo.exceptions import ValidationError, UserError
+from collections import defaultdict
+from datetime import timedelta
 import logging
 
 _logger = logging.getLogger(__name__)
@@ -13,6 +15,22 @@ class CotisationReminderWizard(models.TransientModel):
     _description = "Assistant de rappel de cotisations"
     _check_company_auto = True
 
+    # Statuts retenus par le filtre de statut
+    STATE_FILTERS = {
+        'pending': ['pending'],
+        'overdue': ['overdue'],
+        'partial_overdue': ['partial', 'overdue'],
+        'all_unpaid': ['pending', 'partial', 'overdue'],
+    }
+    # Canaux utilisés par chaque méthode d'envoi
+    SEND_METHOD_CHANNELS = {
+        'email': ['email'],
+        'sms': ['sms'],
+        'both': ['email', 'sms'],
+        'internal': ['internal'],
+    }
+    CHANNEL_LABELS = {'email': 'emails', 'sms': 'SMS', 'internal': 'messages internes'}
+
     # Cotisations concernées
     cotisation_ids = fields.Many2many(
         "member.cotisation",
@@ -186,12 +204,15 @@ class CotisationReminderWizard(models.TransientModel):
                  'filter_by_days_overdue', 'min_days_overdue', 'max_days_overdue',
                  'filter_by_amount', 'min_amount')
     def _compute_statistics(self):
-        """Calcule les statistiques des cotisations filtrées"""
+        """Calcule les statistiques des cotisations filtrées (un agrégat SQL)"""
         for wizard in self:
-            filtered_cotisations = wizard._get_filtered_cotisations()
-            wizard.total_cotisations = len(filtered_cotisations)
-            wizard.total_members = len(filtered_cotisations.mapped('member_id'))
-            wizard.total_amount = sum(filtered_cotisations.mapped('remaining_amount'))
+            [(count, members, amount)] = self.env['member.cotisation']._read_group(
+                wizard._get_filtered_domain(),
+                aggregates=['__count', 'member_id:count_distinct', 'remaining_amount:sum'],
+            )
+            wizard.total_cotisations = count
+            wizard.total_members = members
+            wizard.total_amount = amount or 0.0
     
     @api.depends('cotisation_ids', 'filter_by_state', 'selected_states', 
                  'filter_by_days_overdue', 'min_days_overdue', 'max_days_overdue',
@@ -199,8 +220,10 @@ class CotisationReminderWizard(models.TransientModel):
     def _compute_preview(self):
         """Calcule l'aperçu des membres qui recevront le rappel"""
         for wizard in self:
-            filtered_cotisations = wizard._get_filtered_cotisations()
-            wizard.preview_member_ids = filtered_cotisations.mapped('member_id')
+            groups = self.env['member.cotisation']._read_group(
+                wizard._get_filtered_domain(), groupby=['member_id']
+            )
+            wizard.preview_member_ids = [(6, 0, [member.id for member, in groups if member])]
     
     @api.onchange('reminder_type')
     def _onchange_reminder_type(self):
@@ -248,32 +271,32 @@ class CotisationReminderWizard(models.TransientModel):
             if wizard.schedule_sending and wizard.scheduled_date < fields.Datetime.now():
                 raise ValidationError("La date d'envoi programmée ne peut pas être dans le passé.")
     
-    def _get_filtered_cotisations(self):
-        """Retourne les cotisations filtrées selon les critères"""
-        cotisations = self.cotisation_ids.filtered('active')
+    def _get_filtered_domain(self):
+        """Domaine des cotisations ciblées: tous les filtres en une seule recherche"""
+        domain = [
+            ('id', 'in', self.cotisation_ids._origin.ids),
+            ('active', '=', True),
+        ]
         
         # Filtrage par statut
-        if self.filter_by_state:
-            if self.selected_states == 'pending':
-                cotisations = cotisations.filtered(lambda c: c.state == 'pending')
-            elif self.selected_states == 'overdue':
-                cotisations = cotisations.filtered(lambda c: c.state == 'overdue')
-            elif self.selected_states == 'partial_overdue':
-                cotisations = cotisations.filtered(lambda c: c.state in ['partial', 'overdue'])
-            elif self.selected_states == 'all_unpaid':
-                cotisations = cotisations.filtered(lambda c: c.state in ['pending', 'partial', 'overdue'])
+        if self.filter_by_state and self.selected_states in self.STATE_FILTERS:
+            domain.append(('state', 'in', self.STATE_FILTERS[self.selected_states]))
         
         # Filtrage par jours de retard
         if self.filter_by_days_overdue:
-            cotisations = cotisations.filtered(lambda c: c.days_overdue >= self.min_days_overdue)
+            domain.append(('days_overdue', '>=', self.min_days_overdue))
             if self.max_days_overdue > 0:
-                cotisations = cotisations.filtered(lambda c: c.days_overdue <= self.max_days_overdue)
+                domain.append(('days_overdue', '<=', self.max_days_overdue))
         
         # Filtrage par montant
         if self.filter_by_amount and self.min_amount > 0:
-            cotisations = cotisations.filtered(lambda c: c.remaining_amount >= self.min_amount)
+            domain.append(('remaining_amount', '>=', self.min_amount))
         
-        return cotisations
+        return domain
+    
+    def _get_filtered_cotisations(self):
+        """Retourne les cotisations filtrées selon les critères"""
+        return self.env['member.cotisation'].search(self._get_filtered_domain(), order='member_id, id')
     
     def _get_default_message_template(self, reminder_type):
         """Retourne le template de message par défaut selon le type"""
@@ -358,29 +381,25 @@ class CotisationReminderWizard(models.TransientModel):
             }
         }
     
-    def _render_message_template(self, cotisation):
-        """Rend le template de message pour une cotisation spécifique"""
+    def _render_messages(self, cotisations):
+        """Rend le corps du message pour toutes les cotisations en un seul appel"""
+        if not cotisations:
+            return {}
         try:
-            template = self.env['mail.template'].create({
-                'name': 'Temp Reminder Template',
-                'model_id': self.env.ref('contribution_management.model_member_cotisation').id,
-                'subject': self.subject,
-                'body_html': self.message_body,
-            })
-            
-            rendered = template._render_template(
-                template.body_html,
+            return self.env['mail.render.mixin']._render_template(
+                self.message_body,
                 'member.cotisation',
-                cotisation.id,
-                post_process=True
-            )[cotisation.id]
-            
-            template.unlink()  # Nettoyer le template temporaire
-            return rendered
-            
+                cotisations.ids,
+                engine='qweb',
+                options={'post_process': True},
+            )
         except Exception as e:
             _logger.error(f"Erreur lors du rendu du template: {e}")
-            return self.message_body
+            return dict.fromkeys(cotisations.ids, self.message_body)
+    
+    def _render_message_template(self, cotisation):
+        """Rend le template de message pour une cotisation spécifique"""
+        return self._render_messages(cotisation)[cotisation.id]
     
     def action_send_reminders(self):
         """Envoie les rappels aux membres sélectionnés"""
@@ -396,55 +415,31 @@ class CotisationReminderWizard(models.TransientModel):
             return self._send_reminders_now(filtered_cotisations)
     
     def _send_reminders_now(self, cotisations):
-        """Envoie les rappels immédiatement"""
-        sent_count = 0
-        failed_count = 0
+        """Envoie les rappels immédiatement et rend compte par destinataire"""
+        outcomes = self._dispatch_reminders(cotisations)
         
-        for cotisation in cotisations:
-            try:
-                if self.send_method in ['email', 'both']:
-                    if cotisation.member_id.email:
-                        self._send_email_reminder(cotisation)
-                        sent_count += 1
-                    else:
-                        failed_count += 1
-                        _logger.warning(f"Pas d'email pour {cotisation.member_id.name}")
-                
-                if self.send_method in ['sms', 'both']:
-                    if cotisation.member_id.phone or cotisation.member_id.mobile:
-                        self._send_sms_reminder(cotisation)
-                        if self.send_method == 'sms':  # Éviter le double comptage
-                            sent_count += 1
-                    else:
-                        if self.send_method == 'sms':
-                            failed_count += 1
-                        _logger.warning(f"Pas de téléphone pour {cotisation.member_id.name}")
-                
-                if self.send_method == 'internal':
-                    self._send_internal_message(cotisation)
-                    sent_count += 1
-                
-                # Marquer comme rappelé si demandé
-                if self.mark_as_reminded:
-                    cotisation.message_post(
-                        body=f"Rappel {self.reminder_type} envoyé le {fields.Datetime.now()}",
-                        message_type='comment'
-                    )
-                
-                # Créer une activité de suivi si demandé
-                if self.create_activity_followup:
-                    self._create_followup_activity(cotisation)
-                
-            except Exception as e:
-                failed_count += 1
-                _logger.error(f"Erreur lors de l'envoi du rappel pour {cotisation.display_name}: {e}")
+        reached = [member_id for member_id, result in outcomes.items() if 'sent' in result.values()]
+        missed = self.env['res.partner'].browse(
+            [member_id for member_id in outcomes if member_id not in reached]
+        )
         
         # Message de résultat
-        message = f"{sent_count} rappels envoyés avec succès"
-        if failed_count > 0:
-            message += f", {failed_count} échecs"
+        message = f"{len(reached)} membres relancés ({len(cotisations)} cotisations)"
+        channel_totals = defaultdict(int)
+        for result in outcomes.values():
+            for channel, status in result.items():
+                if status == 'sent':
+                    channel_totals[channel] += 1
+        if channel_totals:
+            message += " - " + ", ".join(
+                f"{self.CHANNEL_LABELS[channel]}: {count}" for channel, count in channel_totals.items()
+            )
+        if missed:
+            names = ', '.join(missed[:10].mapped('name'))
+            more = f" et {len(missed) - 10} autres" if len(missed) > 10 else ""
+            message += f"\n{len(missed)} membres non joints (coordonnées manquantes ou canal indisponible): {names}{more}"
         
-        notification_type = 'success' if failed_count == 0 else 'warning'
+        notification_type = 'success' if not missed else 'warning'
         
         return {
             'type': 'ir.actions.client',
@@ -453,118 +448,188 @@ class CotisationReminderWizard(models.TransientModel):
                 'title': 'Envoi de rappels terminé',
                 'message': message,
                 'type': notification_type,
-                'sticky': True if failed_count > 0 else False,
+                'sticky': bool(missed),
             }
         }
     
-    def _schedule_reminders(self, cotisations):
-        """Programme l'envoi des rappels"""
-        # Créer une tâche cron pour chaque cotisation
-        cron_vals = {
-            'name': f'Rappels programmés - {self.reminder_type}',
-            'model_id': self.env.ref('contribution_management.model_member_cotisation').id,
-            'state': 'code',
-            'code': f"""
-env['cotisation.reminder.wizard']._execute_scheduled_reminders({self.id}, {cotisations.ids})
-            """,
-            'nextcall': self.scheduled_date,
-            'numbercall': 1,
-            'active': True,
-        }
+    def _dispatch_reminders(self, cotisations):
+        """Met les rappels en file par lot, un message par membre et par canal.
         
-        cron = self.env['ir.cron'].create(cron_vals)
+        Les corps sont rendus en un appel, les emails et SMS créés en une
+        écriture chacun puis envoyés par les files (emails: file des
+        cotisations, SMS: planificateur du module sms), les messages
+        internes, notes de rappel et activités de suivi créés en lot.
         
-        return {
-            'type': 'ir.actions.client',
-            'tag': 'display_notification',
-            'params': {
-                'title': 'Rappels programmés',
-                'message': f'{len(cotisations)} rappels programmés pour le {self.scheduled_date}',
-                'type': 'success',
-            }
-        }
-    
-    def _send_email_reminder(self, cotisation):
-        """Envoie un rappel par email"""
-        if not cotisation.member_id.email:
-            return False
+        Retourne {member_id: {canal: 'sent' | 'missing_address' | 'unavailable'}}.
+        """
+        Cotisation = self.env['member.cotisation']
+        dispatcher = self.env['cotisation.mail.dispatcher']
+        by_member = defaultdict(list)
+        for cotisation in cotisations:
+            by_member[cotisation.member_id].append(cotisation.id)
         
-        rendered_body = self._render_message_template(cotisation)
+        channels = self.SEND_METHOD_CHANNELS[self.send_method]
+        bodies = self._render_messages(cotisations) if {'email', 'internal'} & set(channels) else {}
+        email_from = self.env.user.email or self.env.company.email
         
-        mail_values = {
-            'subject': self.subject,
-            'body_html': rendered_body,
-            'email_to': cotisation.member_id.email,
-            'email_from': self.env.user.email or self.env.company.email,
-            'res_id': cotisation.id,
-            'model': 'member.cotisation',
-            'auto_delete': False,
-        }
+        outcomes = {}
+        mail_values = []
+        sms_values = []
+        sms_members = []
+        internal_values = []
+        internal_members = []
+        comment_subtype_id = self.env['ir.model.data']._xmlid_to_res_id('mail.mt_comment')
+        for member, cotisation_ids in by_member.items():
+            member_cotisations = Cotisation.browse(cotisation_ids)
+            body = '<hr/>'.join(bodies[cotisation_id] for cotisation_id in cotisation_ids) if bodies else ''
+            result = outcomes[member.id] = {}
+            
+            if 'email' in channels:
+                if member.email:
+                    mail_values.append({
+                        'subject': self.subject,
+                        'body_html': body,
+                        'email_to': member.email,
+                        'email_from': email_from,
+                        'model': 'member.cotisation',
+                        'res_id': cotisation_ids[0],
+                        'auto_delete': False,
+                    })
+                    result['email'] = 'sent'
+                else:
+                    result['email'] = 'missing_address'
+            
+            if 'sms' in channels:
+                phone = member.phone or member.mobile
+                if phone:
+                    sms_values.append({
+                        'number': phone,
+                        'partner_id': member.id,
+                        'body': self._sms_body(member_cotisations),
+                    })
+                    sms_members.append(member.id)
+                    result['sms'] = 'sent'
+                else:
+                    result['sms'] = 'missing_address'
+            
+            if 'internal' in channels:
+                internal_values.append({
+                    'model': 'member.cotisation',
+                    'res_id': cotisation_ids[0],
+                    'body': body,
+                    'subject': self.subject,
+                    'message_type': 'comment',
+                    'subtype_id': comment_subtype_id,
+                    'author_id': self.env.user.partner_id.id,
+                    'partner_ids': [(4, member.id)],
+                })
+                internal_members.append(member)
+                result['internal'] = 'sent'
         
-        mail = self.env['mail.mail'].create(mail_values)
-        mail.send()
-        return True
-    
-    def _send_sms_reminder(self, cotisation):
-        """Envoie un rappel par SMS"""
-        phone = cotisation.member_id.phone or cotisation.member_id.mobile
-        if not phone:
-            return False
+        dispatcher.enqueue_values(mail_values)
+        self._post_internal_messages(internal_values, internal_members)
+        if sms_values and dispatcher.enqueue_sms(sms_values) is None:
+            for member_id in sms_members:
+                outcomes[member_id]['sms'] = 'unavailable'
+            _logger.warning("Rappels SMS non envoyés: module sms non installé")
         
-        # Message SMS simplifié
-        sms_body = f"""
-Rappel cotisation: {cotisation.remaining_amount} {cotisation.currency_id.name}
-Échéance: {cotisation.due_date}
-Retard: {cotisation.days_overdue} jours
-        """.strip()
+        # Marquer comme rappelé si demandé
+        if self.mark_as_reminded:
+            note = f"Rappel {self.reminder_type} envoyé le {fields.Datetime.now()}"
+            cotisations._message_log_batch(bodies=dict.fromkeys(cotisations.ids, note))
         
-        sms_values = {
-            'number': phone,
-            'body': sms_body,
-            'res_id': cotisation.id,
-            'res_model': 'member.cotisation',
-        }
+        # Créer une activité de suivi si demandé
+        if self.create_activity_followup:
+            self._create_followup_activities(cotisations)
         
-        sms = self.env['sms.sms'].create(sms_values)
-        sms.send()
-        return True
+        missing = sum(1 for result in outcomes.values() if 'sent' not in result.values())
+        _logger.info(
+            f"Rappels {self.reminder_type}: {len(outcomes)} membres, {len(mail_values)} emails, "
+            f"{len(sms_values)} SMS en file, {len(internal_values)} messages internes, "
+            f"{missing} sans coordonnées"
+        )
+        return outcomes
     
-    def _send_internal_message(self, cotisation):
-        """Envoie un message interne"""
-        rendered_body = self._render_message_template(cotisation)
+    def _post_internal_messages(self, values_list, members):
+        """Crée les messages internes en une écriture, notifications comprises.
         
-        cotisation.message_post(
-            body=rendered_body,
-            subject=self.subject,
-            message_type='comment',
-            partner_ids=[cotisation.member_id.id]
+        Les membres ayant un utilisateur interne reçoivent le message dans
+        leur boîte de réception; pour les autres, il reste visible dans la
+        discussion de la cotisation (portail compris), sans email.
+        """
+        if not values_list:
+            return self.env['mail.message']
+        messages = self.env['mail.message'].sudo().create(values_list)
+        notifications = [
+            {
+                'mail_message_id': message.id,
+                'res_partner_id': member.id,
+                'notification_type': 'inbox',
+                'is_read': False,
+            }
+            for message, member in zip(messages, members)
+            if any(not user.share for user in member.user_ids)
+        ]
+        if notifications:
+            self.env['mail.notification'].sudo().create(notifications)
+        return messages
+    
+    def _sms_body(self, cotisations):
+        """SMS unique résumant les cotisations impayées d'un membre"""
+        remaining = sum(cotisations.mapped('remaining_amount'))
+        if len(cotisations) == 1:
+            return (
+                f"Rappel cotisation: {remaining} {cotisations.currency_id.name}\n"
+                f"Échéance: {cotisations.due_date}\n"
+                f"Retard: {cotisations.days_overdue} jours"
+            )
+        return (
+            f"Rappel: {len(cotisations)} cotisations impayées, "
+            f"{remaining} {cotisations[0].currency_id.name} au total\n"
+            f"Retard max: {max(cotisations.mapped('days_overdue'))} jours"
         )
-        return True
     
-    def _create_followup_activity(self, cotisation):
-        """Crée une activité de suivi"""
+    def _schedule_reminders(self, cotisations):
+        """Programme l'envoi des rappels dans la file des campagnes"""
+        self.env['cotisation.reminder.schedule'].schedule(self, cotisations)
+        
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'title': 'Rappels programmés',
+                'message': f'{len(cotisations)} rappels programmés pour le {self.scheduled_date}',
+                'type': 'success',
+            }
+        }
+    
+    def _create_followup_activities(self, cotisations):
+        """Crée les activités de suivi en une écriture"""
         activity_type = self.env.ref('mail.mail_activity_data_todo', raise_if_not_found=False)
         if not activity_type:
             return False
         
-        due_date = fields.Date.today() + fields.timedelta(days=self.followup_days)
+        today = fields.Date.today()
+        due_date = today + timedelta(days=self.followup_days)
+        res_model_id = self.env.ref('contribution_management.model_member_cotisation').id
         
-        activity_values = {
+        self.env['mail.activity'].create([{
             'activity_type_id': activity_type.id,
             'summary': f'Suivi rappel cotisation - {cotisation.member_id.name}',
-            'note': f'Suivi du rappel {self.reminder_type} envoyé le {fields.Date.today()}',
+            'note': f'Suivi du rappel {self.reminder_type} envoyé le {today}',
             'date_deadline': due_date,
             'res_id': cotisation.id,
-            'res_model_id': self.env.ref('contribution_management.model_member_cotisation').id,
+            'res_model_id': res_model_id,
             'user_id': self.env.user.id,
-        }
-        
-        self.env['mail.activity'].create(activity_values)
+        } for cotisation in cotisations])
         return True
     
     @api.model
     def _execute_scheduled_reminders(self, wizard_id, cotisation_ids):
-        """Exécute les rappels programmés (appelé par le cron)"""
+        """Exécute les rappels programmés par les anciennes tâches cron générées.
+        
+        Les nouvelles campagnes passent par cotisation.reminder.schedule.
+        """
         wizard = self.browse(wizard_id)
         cotisations = self.env['member.cotisation'].browse(cotisation_ids)
         
@@ -2,7 +2,9 @@
 
 from odoo import models, fields, api
 from odoo.exceptions import ValidationError, UserError
+from psycopg2 import OperationalError
 import logging
+import uuid
 
 _logger = logging.getLogger(__name__)
 
@@ -13,6 +15,9 @@ class MassPaymentWizard(models.TransientModel):
     _description = "Assistant de paiement en masse"
     _check_company_auto = True
 
+    # États des cotisations éligibles au paiement en masse
+    MASS_PAYMENT_STATES = ('pending', 'partial', 'overdue', 'under_review')
+
     # Membre concerné (optionnel - pour paiement de toutes ses cotisations)
     member_id = fields.Many2one(
         "res.partner",
@@ -77,6 +82,14 @@ class MassPaymentWizard(models.TransientModel):
         help="Référence commune pour tous les paiements"
     )
     notes = fields.Text(string="Notes communes")
+
+    idempotency_key = fields.Char(
+        string="Clé de soumission",
+        default=lambda self: str(uuid.uuid4()),
+        readonly=True,
+        copy=False,
+        help="Empêche un double enregistrement si le paiement est soumis deux fois"
+    )
     
     currency_id = fields.Many2one(
         'res.currency',
@@ -365,38 +378,30 @@ class MassPaymentWizard(models.TransientModel):
         errors = []
         
         try:
-            # Traiter selon le mode
-            if self.payment_mode == 'full':
-                for cotisation in eligible_cotisations:
-                    amount = cotisation.remaining_amount
-                    if self._process_single_payment(cotisation, amount):
-                        processed_count += 1
-                        total_paid += amount
-            
-            elif self.payment_mode == 'partial_equal':
-                amount_per_cotisation = self.payment_amount / len(eligible_cotisations)
-                for cotisation in eligible_cotisations:
-                    amount = min(amount_per_cotisation, cotisation.remaining_amount)
-                    if self._process_single_payment(cotisation, amount):
-                        processed_count += 1
-                        total_paid += amount
-            
-            elif self.payment_mode == 'partial_proportional':
-                total_remaining = sum(eligible_cotisations.mapped('remaining_amount'))
-                for cotisation in eligible_cotisations:
-                    if total_remaining > 0:
-                        proportion = cotisation.remaining_amount / total_remaining
-                        amount = self.payment_amount * proportion
-                        if self._process_single_payment(cotisation, amount):
-                            processed_count += 1
-                            total_paid += amount
-            
-            elif self.payment_mode == 'individual':
-                for line in self.payment_line_ids:
-                    if line.payment_amount > 0:
-                        if self._process_single_payment(line.cotisation_id, line.payment_amount):
-                            processed_count += 1
-                            total_paid += line.payment_amount
+            # Plan de répartition selon le mode
+            if self.payment_mode == 'individual':
+                plan = [
+                    {'cotisation_id': line.cotisation_id.id, 'amount': line.payment_amount}
+                    for line in self.payment_line_ids
+                    if line.payment_amount > 0
+                ]
+            else:
+                engine = self.env['cotisation.allocation.engine']
+                columns = engine.load_columns(
+                    cotisation_ids=eligible_cotisations.ids,
+                    states=self.MASS_PAYMENT_STATES,
+                )
+                if self.payment_mode == 'full':
+                    plan, _leftover = engine.allocate(columns, sum(columns['remaining']), 'manual')
+                elif self.payment_mode == 'partial_equal':
+                    plan, _leftover = engine.allocate(columns, self.payment_amount, 'equal')
+                else:
+                    plan, _leftover = engine.allocate(columns, self.payment_amount, 'proportional')
+
+            # Tous les paiements, soldes et messages en un seul lot
+            payments = self._post_payment_plan(plan)
+            processed_count = len(payments)
+            total_paid = sum(payments.mapped('amount'))
             
             # Envoyer les reçus si demandé
             receipts_sent = 0
@@ -428,50 +433,53 @@ class MassPaymentWizard(models.TransientModel):
                 }
             }
             
+        except OperationalError:
+            # Conflit de concurrence: la transaction est rejouée par le serveur
+            raise
         except Exception as e:
             _logger.error(f"Erreur lors du traitement des paiements en masse: {e}")
             raise UserError(f"Erreur lors du traitement: {str(e)}")
     
+    def _post_payment_plan(self, plan, idempotency_key=None):
+        """Enregistre le plan de paiement en masse en un lot"""
+        method_name = dict(self._fields['payment_method'].selection)[self.payment_method]
+        payment_notes = f"Paiement en masse - Méthode: {method_name}"
+
+        if self.reference:
+            payment_notes += f" - Réf: {self.reference}"
+
+        if self.notes:
+            payment_notes += f"\nNotes: {self.notes}"
+
+        intake = self.env['cotisation.payment.intake'].submit(
+            idempotency_key or self.idempotency_key,
+            plan,
+            {
+                'payment_date': self.payment_date,
+                'payment_method': self.env['cotisation.payment']._map_payment_method(self.payment_method),
+                'reference': self.reference,
+                'notes': self.notes,
+                'currency_id': self.currency_id.id or self.env.company.currency_id.id,
+            },
+            source='mass.payment.wizard',
+            cotisation_note=payment_notes,
+            message_subject="Paiement en masse",
+        )
+        return intake.payment_ids
+
     def _process_single_payment(self, cotisation, amount):
         """Traite un paiement individuel"""
         try:
             if amount <= 0:
                 return False
-            
-            # Calculer le nouveau montant payé
-            new_amount_paid = cotisation.amount_paid + amount
-            mark_as_full = new_amount_paid >= cotisation.amount_due
-            
-            # Construire les notes
-            method_name = dict(self._fields['payment_method'].selection)[self.payment_method]
-            payment_notes = f"Paiement en masse - Méthode: {method_name}"
-            
-            if self.reference:
-                payment_notes += f" - Réf: {self.reference}"
-            
-            if self.notes:
-                payment_notes += f"\nNotes: {self.notes}"
-            
-            if cotisation.payment_notes:
-                payment_notes = f"{cotisation.payment_notes}\n---\n{payment_notes}"
-            
-            # Mettre à jour la cotisation
-            cotisation.write({
-                'amount_paid': new_amount_paid,
-                'payment_date': self.payment_date,
-                'payment_notes': payment_notes
-            })
-            
-            # Message de suivi
-            payment_type = "Paiement complet" if mark_as_full else "Paiement partiel"
-            cotisation.message_post(
-                body=f"{payment_type} de {amount} {cotisation.currency_id.symbol} "
-                     f"via paiement en masse le {self.payment_date}",
-                message_type='comment'
+            self._post_payment_plan(
+                [{'cotisation_id': cotisation.id, 'amount': amount}],
+                idempotency_key=f"{self.idempotency_key}:{cotisation.id}",
             )
-            
             return True
-            
+
+        except OperationalError:
+            raise
         except Exception as e:
             _logger.error(f"Erreur lors du paiement de {cotisation.display_name}: {e}")
             return False
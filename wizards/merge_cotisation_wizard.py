@@ -70,6 +70,12 @@ class MergeCotisationWizard(models.TransientModel):
         help="Si coché, tous les paiements existants seront préservés"
     )
     
+    dry_run = fields.Boolean(
+        string="Simulation",
+        default=False,
+        help="Calcule et affiche le résultat de la fusion sans rien enregistrer"
+    )
+    
     # Informations calculées
     total_cotisations = fields.Integer(
         string="Nombre de cotisations",
@@ -264,6 +270,9 @@ class MergeCotisationWizard(models.TransientModel):
         if len(self.cotisation_ids) < 2:
             raise UserError("Au moins 2 cotisations sont nécessaires pour effectuer une fusion.")
         
+        if self.dry_run:
+            return self.action_preview_merge()
+        
         try:
             if self.merge_strategy == 'create_new':
                 merged_cotisation = self._create_new_merged_cotisation()
@@ -349,69 +358,178 @@ class MergeCotisationWizard(models.TransientModel):
         target.write(values)
         return target
 
+    def _get_member_merge_plan(self, target_cotisation=None):
+        """Plan de fusion des cotisations membres, calculé en une requête groupée.
+
+        Une ligne par membre: la cotisation conservée (celle déjà rattachée
+        à la cible si elle existe, sinon la plus ancienne), les doublons à
+        absorber et les montants cumulés. Aucune écriture: le même plan sert
+        à la simulation et à la fusion.
+        """
+        self.env['member.cotisation'].flush_model(
+            ['member_id', 'monthly_cotisation_id', 'amount_due', 'amount_paid', 'active']
+        )
+        self.env.cr.execute("""
+            SELECT c.member_id,
+                   array_agg(c.id ORDER BY (c.monthly_cotisation_id = %s) DESC, c.id),
+                   SUM(c.amount_due),
+                   SUM(c.amount_paid)
+            FROM member_cotisation c
+            WHERE c.monthly_cotisation_id IN %s AND c.active = TRUE
+            GROUP BY c.member_id
+        """, (target_cotisation.id if target_cotisation else 0, tuple(self.cotisation_ids.ids)))
+
+        plan = [
+            {
+                'member_id': member_id,
+                'survivor_id': cotisation_ids[0],
+                'duplicate_ids': cotisation_ids[1:],
+                'total_due': float(total_due),
+                'total_paid': float(total_paid),
+            }
+            for member_id, cotisation_ids, total_due, total_paid in self.env.cr.fetchall()
+        ]
+
+        duplicate_ids = [cotisation_id for line in plan for cotisation_id in line['duplicate_ids']]
+        payments_moved = 0
+        if duplicate_ids:
+            self.env['cotisation.payment'].flush_model(['cotisation_id'])
+            self.env.cr.execute(
+                "SELECT COUNT(*) FROM cotisation_payment WHERE cotisation_id = ANY(%s)",
+                (duplicate_ids,),
+            )
+            payments_moved = self.env.cr.fetchone()[0]
+
+        return {
+            'lines': plan,
+            'members': len(plan),
+            'duplicates': len(duplicate_ids),
+            'payments_moved': payments_moved,
+            'total_due': sum(line['total_due'] for line in plan),
+            'total_paid': sum(line['total_paid'] for line in plan),
+        }
+
     def _merge_member_cotisations(self, target_cotisation):
-        """Fusionne les cotisations individuelles des membres"""
-        if not self.merge_member_cotisations:
-            return
-        
-        # Collecter toutes les cotisations de membres
-        all_member_cotisations = self.env['member.cotisation']
-        for cotisation in self.cotisation_ids:
-            all_member_cotisations |= cotisation.cotisation_ids
-        
-        # Grouper par membre
-        members_data = {}
-        for member_cotisation in all_member_cotisations:
-            member_id = member_cotisation.member_id.id
-            if member_id not in members_data:
-                members_data[member_id] = {
-                    'member_id': member_id,
-                    'cotisations': self.env['member.cotisation'],
-                    'total_due': 0.0,
-                    'total_paid': 0.0
-                }
-            
-            members_data[member_id]['cotisations'] |= member_cotisation
-            members_data[member_id]['total_due'] += member_cotisation.amount_due
-            members_data[member_id]['total_paid'] += member_cotisation.amount_paid
+        """Fusionne les cotisations individuelles des membres, de façon ensembliste.
+
+        Les cotisations conservées sont rattachées à la cible avec les
+        montants cumulés, les paiements du registre, justificatifs et liens
+        d'échéances des doublons leur sont transférés, puis les doublons sont
+        supprimés en une fois. Les statistiques mensuelles sont recalculées
+        une seule fois à la fin.
+        """
+        if not self.merge_member_cotisations or not self.preserve_payments:
+            return {}
         
-        # Créer les nouvelles cotisations fusionnées
-        new_cotisations_data = []
+        merge_plan = self._get_member_merge_plan(target_cotisation)
+        lines = merge_plan['lines']
+        if not lines:
+            return merge_plan
+
         month_name = dict(target_cotisation._fields['month'].selection)[target_cotisation.month]
         description = f"Cotisation mensuelle fusionnée - {month_name} {target_cotisation.year}"
         if target_cotisation.cotisation_name:
             description += f" ({target_cotisation.cotisation_name})"
-        
-        for member_data in members_data.values():
-            # Déterminer l'état de la nouvelle cotisation
-            state = 'pending'
-            if member_data['total_paid'] >= member_data['total_due']:
-                state = 'paid'
-            elif member_data['total_paid'] > 0:
-                state = 'partial'
-            elif any(c.state == 'overdue' for c in member_data['cotisations']):
-                state = 'overdue'
-            
-            new_cotisations_data.append({
-                'member_id': member_data['member_id'],
-                'monthly_cotisation_id': target_cotisation.id,
-                'cotisation_type': 'monthly',
-                'amount_due': member_data['total_due'],
-                'amount_paid': member_data['total_paid'],
-                'due_date': target_cotisation.due_date,
-                'currency_id': target_cotisation.currency_id.id,
-                'company_id': target_cotisation.company_id.id,
-                'description': description,
-                'state': state
-            })
-        
-        # Supprimer les anciennes cotisations de membres si on préserve les paiements
-        if self.preserve_payments:
-            # Créer les nouvelles cotisations
-            self.env['member.cotisation'].create(new_cotisations_data)
-            
-            # Supprimer les anciennes
-            all_member_cotisations.unlink()
+
+        duplicates = [
+            (duplicate_id, line['survivor_id'])
+            for line in lines for duplicate_id in line['duplicate_ids']
+        ]
+        cr = self.env.cr
+        self.env['cotisation.payment.proof'].flush_model(['cotisation_id'])
+        self.env['member.payment.installment'].flush_model(['cotisation_ids'])
+
+        moved_payments = []
+        if duplicates:
+            duplicate_ids, survivor_ids = (list(column) for column in zip(*duplicates))
+            cotisation_names = {
+                cotisation.id: cotisation.display_name
+                for cotisation in self.env['member.cotisation'].browse(duplicate_ids + survivor_ids)
+            }
+            # Exception assumée au registre en ajout seul (LEDGER_LOCKED_FIELDS):
+            # le doublon disparaît, ses paiements confirmés passent tels quels à
+            # la cotisation conservée. Chaque transfert est consigné ci-dessous.
+            cr.execute("""
+                UPDATE cotisation_payment p
+                SET cotisation_id = m.survivor_id
+                FROM unnest(%s::int[], %s::int[]) AS m(duplicate_id, survivor_id)
+                WHERE p.cotisation_id = m.duplicate_id
+                RETURNING p.id, m.duplicate_id, m.survivor_id
+            """, (duplicate_ids, survivor_ids))
+            moved_payments = cr.fetchall()
+            cr.execute("""
+                UPDATE cotisation_payment_proof p
+                SET cotisation_id = m.survivor_id
+                FROM unnest(%s::int[], %s::int[]) AS m(duplicate_id, survivor_id)
+                WHERE p.cotisation_id = m.duplicate_id
+            """, (duplicate_ids, survivor_ids))
+            cr.execute("""
+                INSERT INTO installment_cotisation_rel (installment_id, cotisation_id)
+                SELECT r.installment_id, m.survivor_id
+                FROM installment_cotisation_rel r
+                JOIN unnest(%s::int[], %s::int[]) AS m(duplicate_id, survivor_id)
+                    ON r.cotisation_id = m.duplicate_id
+                ON CONFLICT DO NOTHING
+            """, (duplicate_ids, survivor_ids))
+
+        cr.execute("""
+            UPDATE member_cotisation c
+            SET monthly_cotisation_id = %s,
+                cotisation_type = 'monthly',
+                amount_due = v.total_due,
+                amount_paid = v.total_paid,
+                due_date = %s,
+                description = %s
+            FROM unnest(%s::int[], %s::numeric[], %s::numeric[]) AS v(id, total_due, total_paid)
+            WHERE c.id = v.id
+        """, (
+            target_cotisation.id,
+            target_cotisation.due_date,
+            description,
+            [line['survivor_id'] for line in lines],
+            [line['total_due'] for line in lines],
+            [line['total_paid'] for line in lines],
+        ))
+
+        self.env['cotisation.payment'].invalidate_model(['cotisation_id'])
+        self.env['cotisation.payment.proof'].invalidate_model(['cotisation_id'])
+        self.env['member.payment.installment'].invalidate_model(['cotisation_ids'])
+        self.env['member.cotisation'].invalidate_model()
+        self.env['monthly.cotisation'].invalidate_model(['cotisation_ids'])
+
+        if moved_payments:
+            self.env['cotisation.payment'].browse([row[0] for row in moved_payments])._message_log_batch(
+                bodies={
+                    payment_id: (
+                        f"Paiement transféré de {cotisation_names[duplicate_id]} vers "
+                        f"{cotisation_names[survivor_id]} par la fusion des cotisations "
+                        f"({target_cotisation.display_name}), par {self.env.user.name}"
+                    )
+                    for payment_id, duplicate_id, survivor_id in moved_payments
+                }
+            )
+            _logger.warning(
+                f"Fusion membres: {len(moved_payments)} paiements confirmés transférés hors registre "
+                f"(paiement, doublon, cotisation conservée): {moved_payments[:50]}"
+            )
+
+        # Doublons vidés de leurs paiements: une seule suppression
+        if duplicates:
+            self.env['member.cotisation'].browse(duplicate_ids).unlink()
+
+        survivors = self.env['member.cotisation'].browse([line['survivor_id'] for line in lines])
+        survivors.modified([
+            'monthly_cotisation_id', 'cotisation_type', 'amount_due', 'amount_paid', 'due_date'
+        ])
+        # Lignes déplacées en SQL: compteurs de collecte repris de l'agrégat
+        (self.cotisation_ids | target_cotisation)._recompute_counters()
+
+        _logger.info(
+            f"Fusion membres: {merge_plan['members']} cotisations conservées, "
+            f"{merge_plan['duplicates']} doublons absorbés, "
+            f"{merge_plan['payments_moved']} paiements transférés"
+        )
+        return merge_plan
 
     def _delete_source_cotisations(self, source_cotisations):
         """Supprime les cotisations sources"""
@@ -420,11 +538,10 @@ class MergeCotisationWizard(models.TransientModel):
         
         # Vérifier qu'il n'y a pas de paiements importants à préserver
         if not self.preserve_payments:
-            for cotisation in source_cotisations:
-                if cotisation.total_collected > 0:
-                    _logger.warning(
-                        f"Suppression de {cotisation.display_name} avec {cotisation.total_collected} collectés"
-                    )
+            for cotisation in source_cotisations.filtered(lambda c: c.total_collected > 0):
+                _logger.warning(
+                    f"Suppression de {cotisation.display_name} avec {cotisation.total_collected} collectés"
+                )
         
         # Archiver plutôt que supprimer pour garder l'historique
         source_cotisations.write({
@@ -433,11 +550,13 @@ class MergeCotisationWizard(models.TransientModel):
             'closure_date': fields.Datetime.now()
         })
         
-        for cotisation in source_cotisations:
-            cotisation.message_post(
-                body=f"Cotisation archivée suite à fusion dans {self.target_cotisation_id.display_name or 'une nouvelle cotisation'}",
-                message_type='comment'
-            )
+        body = (
+            f"Cotisation archivée suite à fusion dans "
+            f"{self.target_cotisation_id.display_name or 'une nouvelle cotisation'}"
+        )
+        source_cotisations._message_log_batch(
+            bodies={cotisation.id: body for cotisation in source_cotisations}
+        )
 
     def action_preview_merge(self):
         """Prévisualise le résultat de la fusion"""
@@ -471,6 +590,19 @@ class MergeCotisationWizard(models.TransientModel):
         preview_info.append(f"- Montant total attendu: {self.total_expected_amount}")
         preview_info.append(f"- Montant total collecté: {self.total_collected_amount}")
         
+        if self.merge_member_cotisations and self.preserve_payments:
+            target = self.target_cotisation_id if self.merge_strategy != 'create_new' else None
+            merge_plan = self._get_member_merge_plan(target)
+            preview_info.append(f"\nCotisations des membres:")
+            preview_info.append(f"- Cotisations conservées: {merge_plan['members']}")
+            preview_info.append(f"- Doublons absorbés: {merge_plan['duplicates']}")
+            preview_info.append(f"- Paiements transférés: {merge_plan['payments_moved']}")
+            preview_info.append(f"- Montant dû cumulé: {merge_plan['total_due']:.2f}")
+            preview_info.append(f"- Montant payé cumulé: {merge_plan['total_paid']:.2f}")
+        
+        if self.dry_run:
+            preview_info.append(f"\nℹ️  Simulation: aucune modification n'a été enregistrée")
+        
         if self.delete_source_cotisations:
             preview_info.append(f"\n⚠️  {len(self.cotisation_ids) - (0 if self.merge_strategy == 'create_new' else 1)} cotisations seront archivées")
         
@@ -510,6 +642,8 @@ class MergePreviewWizard(models.TransientModel):
         if self.merge_wizard_id:
             merge_wizard = self.env['merge.cotisation.wizard'].browse(self.merge_wizard_id)
             if merge_wizard.exists():
+                # Confirmer depuis l'aperçu lance la fusion réelle
+                merge_wizard.dry_run = False
                 return merge_wizard.action_merge()
         
         return {'type': 'ir.actions.act_window_close'}
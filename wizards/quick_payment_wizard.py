@@ -3,7 +3,9 @@
 from odoo import models, fields, api
 from odoo.exceptions import ValidationError, UserError
 from datetime import datetime
+from psycopg2 import OperationalError
 import logging
+import uuid
 
 _logger = logging.getLogger(__name__)
 
@@ -208,19 +210,17 @@ class CotisationImpactPreviewWizard(models.TransientModel):
         for wizard in self:
             lines = []
 
-            # Obtenir toutes les cotisations non payées
-            unpaid_cotisations = self.env["member.cotisation"].search(
-                [
-                    ("member_id", "=", wizard.member_id.id),
-                    ("state", "in", ["pending", "partial", "overdue"]),
-                ]
+            # Cotisations non payées chargées une fois; chaque échéance consomme
+            # les restants comme le ferait l'enregistrement réel
+            columns = self.env["cotisation.allocation.engine"].load_columns(
+                member_ids=wizard.member_id.ids
             )
 
             # Pour chaque échéance, simuler l'impact
             for installment in wizard.installment_ids:
                 payment_amount = installment.remaining_amount or 0
                 impacted_cotisations = self._simulate_detailed_impact(
-                    unpaid_cotisations, payment_amount, wizard.allocation_method
+                    columns, payment_amount, wizard.allocation_method
                 )
 
                 for cotisation_data in impacted_cotisations:
@@ -241,55 +241,27 @@ class CotisationImpactPreviewWizard(models.TransientModel):
 
             wizard.impact_lines = lines
 
-    def _simulate_detailed_impact(self, cotisations, payment_amount, method):
-        """Simule l'impact détaillé sur les cotisations"""
-        # Trier les cotisations selon la méthode
-        if method == "oldest_first":
-            sorted_cotisations = cotisations.sorted(
-                lambda c: c.due_date or fields.Date.today()
-            )
-        elif method == "amount_priority":
-            sorted_cotisations = cotisations.sorted(
-                lambda c: -(c.amount_due - c.amount_paid)
-            )
-        else:  # auto
-            def sort_key(cotisation):
-                priority = 0
-                if cotisation.state == "overdue":
-                    priority += 1000
-                elif cotisation.state == "partial":
-                    priority += 500
-                if cotisation.due_date:
-                    days_overdue = (fields.Date.today() - cotisation.due_date).days
-                    if days_overdue > 0:
-                        priority += days_overdue
-                return -priority
-
-            sorted_cotisations = sorted(cotisations, key=sort_key)
-
-        # Simuler la répartition
-        results = []
-        remaining_payment = payment_amount
-
-        for cotisation in sorted_cotisations:
-            if remaining_payment <= 0:
-                break
-
-            cotisation_remaining = cotisation.amount_due - cotisation.amount_paid
-            if cotisation_remaining > 0:
-                impact = min(remaining_payment, cotisation_remaining)
-                results.append(
-                    {
-                        "cotisation_id": cotisation.id,
-                        "cotisation_name": cotisation.name,
-                        "cotisation_due": cotisation_remaining,
-                        "impact_amount": impact,
-                        "remaining_after": cotisation_remaining - impact,
-                    }
-                )
-                remaining_payment -= impact
-
-        return results
+    def _simulate_detailed_impact(self, columns, payment_amount, method):
+        """Simule l'impact détaillé sur les cotisations chargées par le moteur"""
+        plan, _leftover = self.env["cotisation.allocation.engine"].allocate(
+            columns, payment_amount, method or "auto", consume=True
+        )
+        names = {
+            cotisation["id"]: cotisation["name"]
+            for cotisation in self.env["member.cotisation"]
+            .browse([line["cotisation_id"] for line in plan])
+            .read(["name"])
+        }
+        return [
+            {
+                "cotisation_id": line["cotisation_id"],
+                "cotisation_name": names.get(line["cotisation_id"]),
+                "cotisation_due": line["remaining_before"],
+                "impact_amount": line["amount"],
+                "remaining_after": line["remaining_after"],
+            }
+            for line in plan
+        ]
 
     @api.depends("impact_lines")
     def _compute_total_impact(self):
@@ -393,6 +365,14 @@ class QuickPaymentWizard(models.TransientModel):
 
     notes = fields.Text(string="Notes")
 
+    idempotency_key = fields.Char(
+        string="Clé de soumission",
+        default=lambda self: str(uuid.uuid4()),
+        readonly=True,
+        copy=False,
+        help="Empêche un double enregistrement si le paiement est soumis deux fois",
+    )
+
     # Champs calculés pour l'affichage
     total_amount_due = fields.Monetary(
         string="Montant total dû",
@@ -458,149 +438,103 @@ class QuickPaymentWizard(models.TransientModel):
     )
 
     # Aperçu de l'impact sur les cotisations
-    cotisation_impact_preview = fields.Html(
-        string="Impact sur cotisations", compute="_compute_cotisation_impact_preview"
+    impact_snapshot = fields.Text(
+        string="Instantané des cotisations ouvertes",
+        compute="_compute_impact_snapshot",
+        store=True,
+        help="Cotisations ouvertes du membre et ordres de répartition, chargés une fois par session",
+    )
+
+    impact_line_ids = fields.One2many(
+        "quick.payment.impact.line",
+        "wizard_id",
+        string="Impact sur cotisations",
+        compute="_compute_impact_lines",
+    )
+
+    impact_total_amount = fields.Monetary(
+        string="Total réparti",
+        compute="_compute_impact_lines",
+        currency_field="currency_id",
     )
 
+    impact_cotisation_count = fields.Integer(
+        string="Cotisations distinctes", compute="_compute_impact_lines"
+    )
+
+    @api.depends("member_id")
+    def _compute_impact_snapshot(self):
+        """Charge les cotisations ouvertes du membre une seule fois par session"""
+        engine = self.env["cotisation.allocation.engine"]
+        for wizard in self:
+            if not wizard.member_id:
+                wizard.impact_snapshot = False
+                continue
+            wizard.impact_snapshot = engine.snapshot(
+                engine.load_columns(member_ids=wizard.member_id.ids)
+            )
+
     @api.depends(
         "context_type",
         "installment_ids",
+        "pay_all",
+        "custom_amount",
         "impact_cotisations",
         "cotisation_allocation_method",
+        "impact_snapshot",
     )
-    def _compute_cotisation_impact_preview(self):
-        """Calcule l'aperçu de l'impact sur les cotisations"""
-        for wizard in self:
-            if not wizard.impact_cotisations or wizard.context_type not in [
-                "installment",
-                "mixed",
-            ]:
-                wizard.cotisation_impact_preview = ""
-                continue
+    def _compute_impact_lines(self):
+        """Lignes d'aperçu calculées depuis l'instantané.
 
-            if not wizard.installment_ids:
-                wizard.cotisation_impact_preview = ""
+        Un changement de montant ou de méthode ne relit pas la base: seules
+        les sommes cumulées sont refaites sur les colonnes en mémoire.
+        """
+        engine = self.env["cotisation.allocation.engine"]
+        for wizard in self:
+            wizard.impact_line_ids = [(5, 0, 0)]
+            wizard.impact_total_amount = 0.0
+            wizard.impact_cotisation_count = 0
+
+            if (
+                not wizard.impact_cotisations
+                or wizard.context_type not in ["installment", "mixed"]
+                or not wizard.installment_ids
+                or not wizard.impact_snapshot
+            ):
                 continue
 
-            preview_html = "<div class='o_cotisation_impact_preview'>"
-            preview_html += "<h5>🔄 Impact sur les cotisations</h5>"
+            columns, orders = engine.from_snapshot(wizard.impact_snapshot)
+            method = wizard.cotisation_allocation_method or "auto"
+            share = wizard.custom_amount / len(wizard.installment_ids)
 
-            # Simuler l'impact pour chaque échéance
-            total_impact = 0
+            lines = []
             cotisations_impacted = set()
-
-            preview_html += "<table class='table table-sm'>"
-            preview_html += "<thead><tr><th>Échéance</th><th>Montant</th><th>Cotisations impactées</th></tr></thead>"
-            preview_html += "<tbody>"
-
-            for installment in wizard.installment_ids[:3]:  # Limiter l'aperçu
-                payment_amount = (
-                    installment.remaining_amount or 0
-                    if wizard.pay_all
-                    else min(
-                        installment.remaining_amount or 0,
-                        wizard.custom_amount / len(wizard.installment_ids) if wizard.installment_ids else 0,
-                    )
-                )
-
-                # Simuler quelles cotisations seraient impactées
-                impacted_cotisations = wizard._simulate_cotisation_impact(
-                    installment, payment_amount
-                )
-
-                cotisations_impacted.update([c["id"] for c in impacted_cotisations])
-                total_impact += payment_amount
-
-                preview_html += f"<tr>"
-                preview_html += f"<td>Échéance {installment.sequence or 'N/A'}</td>"
-                preview_html += f"<td>{payment_amount:.2f}</td>"
-                preview_html += f"<td>{len(impacted_cotisations)} cotisation(s)</td>"
-                preview_html += f"</tr>"
-
-            if len(wizard.installment_ids) > 3:
-                preview_html += f"<tr><td colspan='3'><em>... et {len(wizard.installment_ids) - 3} autres échéances</em></td></tr>"
-
-            preview_html += "</tbody></table>"
-
-            preview_html += f"<div class='alert alert-info'>"
-            preview_html += f"<strong>Total:</strong> {total_impact:.2f} {wizard.currency_id.symbol} sur {len(cotisations_impacted)} cotisations distinctes"
-            preview_html += f"</div>"
-
-            preview_html += "</div>"
-            wizard.cotisation_impact_preview = preview_html
-
-    def _simulate_cotisation_impact(self, installment, payment_amount):
-        """Simule quelles cotisations seraient impactées par un paiement d'échéance"""
-        if not self.member_id or payment_amount <= 0:
-            return []
-
-        # Simuler la logique de sélection automatique des cotisations
-        unpaid_cotisations = self.env["member.cotisation"].search(
-            [
-                ("member_id", "=", self.member_id.id),
-                ("state", "in", ["pending", "partial", "overdue"]),
-            ]
-        )
-
-        # Appliquer la méthode de tri
-        if self.cotisation_allocation_method == "oldest_first":
-            sorted_cotisations = unpaid_cotisations.sorted(
-                lambda c: c.due_date or fields.Date.today()
-            )
-        elif self.cotisation_allocation_method == "amount_priority":
-            sorted_cotisations = unpaid_cotisations.sorted(
-                lambda c: -(c.amount_due - c.amount_paid)
-            )
-        else:  # auto
-            def sort_key(cotisation):
-                priority = 0
-                if cotisation.state == "overdue":
-                    priority += 1000
-                elif cotisation.state == "partial":
-                    priority += 500
-                if cotisation.due_date:
-                    days_overdue = (fields.Date.today() - cotisation.due_date).days
-                    if days_overdue > 0:
-                        priority += days_overdue
-                return -priority
-
-            sorted_cotisations = sorted(unpaid_cotisations, key=sort_key)
-
-        # Simuler la répartition
-        impacted = []
-        remaining = payment_amount
-
-        for cotisation in sorted_cotisations:
-            if remaining <= 0:
-                break
-
-            cotisation_remaining = cotisation.amount_due - cotisation.amount_paid
-            if cotisation_remaining > 0:
-                impact_amount = min(remaining, cotisation_remaining)
-                impacted.append(
-                    {
-                        "id": cotisation.id,
-                        "name": cotisation.name,
-                        "amount": impact_amount,
-                    }
+            for installment in wizard.installment_ids:
+                remaining = installment.remaining_amount or 0
+                payment_amount = remaining if wizard.pay_all else min(remaining, share)
+                plan, _leftover = engine.allocate(
+                    columns, payment_amount, method, consume=True, order=orders.get(method)
                 )
-                remaining -= impact_amount
-
-        return impacted
+                cotisations_impacted.update(line["cotisation_id"] for line in plan)
+                lines.append((0, 0, {
+                    "installment_id": installment.id,
+                    "payment_amount": payment_amount,
+                    "allocated_amount": sum(line["amount"] for line in plan),
+                    "cotisation_count": len(plan),
+                }))
+
+            wizard.impact_line_ids = lines
+            wizard.impact_total_amount = sum(line[2]["payment_amount"] for line in lines)
+            wizard.impact_cotisation_count = len(cotisations_impacted)
 
     def _process_installment_payment(self, installment, amount):
-        """Traite le paiement d'une échéance"""
-        # Cette méthode doit être implémentée selon votre logique métier
-        # Exemple de base :
-        installment.write({
-            'amount_paid': (installment.amount_paid or 0) + amount,
-        })
-        if hasattr(installment, '_update_state'):
-            installment._update_state()
+        """Traite le paiement d'une échéance via le service d'encaissement.
 
+        La clé de l'assistant, déclinée par échéance, rend l'encaissement
+        idempotent; le montant payé de l'échéance est incrémenté en base.
+        """
         # Si impact sur cotisations activé, configurer l'échéance
         if self.impact_cotisations:
-            # Configurer la méthode d'allocation
             installment.write(
                 {
                     "allocation_method": self.cotisation_allocation_method,
@@ -608,9 +542,11 @@ class QuickPaymentWizard(models.TransientModel):
                 }
             )
 
-            # Déclencher la répartition sur les cotisations
-            if hasattr(installment, '_allocate_payment_to_cotisations'):
-                installment._allocate_payment_to_cotisations(amount)
+        return installment._register_payment(
+            amount,
+            f"{self.idempotency_key}:installment:{installment.id}",
+            allocate=self.impact_cotisations,
+        )
 
     def action_configure_cotisation_links(self):
         """Action pour configurer les liens avec les cotisations"""
@@ -747,28 +683,28 @@ class QuickPaymentWizard(models.TransientModel):
                 },
             }
 
+        except OperationalError:
+            # Conflit de concurrence: la transaction est rejouée par le serveur
+            raise
         except Exception as e:
             _logger.error(f"Erreur lors du traitement du paiement: {e}")
             raise UserError(f"Erreur lors du traitement du paiement: {e}")
 
     def _process_cotisation_payments(self):
         """Traite les paiements de cotisations"""
-        payments_created = []
-
         if self.pay_all:
             # Paiement intégral de toutes les cotisations
-            for cotisation in self.cotisation_ids:
-                remaining = cotisation.amount_due - cotisation.amount_paid
-                if remaining > 0:
-                    payment = self._create_payment_record(cotisation, remaining)
-                    payments_created.append(payment)
-                    if hasattr(cotisation, '_update_payment_status'):
-                        cotisation._update_payment_status()
+            plan = [
+                {"cotisation_id": cotisation.id, "amount": cotisation.amount_due - cotisation.amount_paid}
+                for cotisation in self.cotisation_ids
+            ]
         elif self.partial_payment:
             # Répartition du montant personnalisé
-            payments_created.extend(self._process_partial_cotisation_payment())
+            return self._process_partial_cotisation_payment()
+        else:
+            return []
 
-        return payments_created
+        return list(self._post_payment_plan(plan))
 
     def _process_installment_payments(self):
         """Traite les paiements d'échéances"""
@@ -797,64 +733,44 @@ class QuickPaymentWizard(models.TransientModel):
 
     def _process_partial_cotisation_payment(self):
         """Traite un paiement partiel en répartissant le montant"""
-        payments_created = []
-        remaining_amount = self.custom_amount
-
-        # Trier les cotisations par priorité (retard d'abord)
-        cotisations_sorted = self.cotisation_ids.sorted(
-            key=lambda c: (
-                c.state == "overdue" and -getattr(c, 'days_overdue', 0) or 0,
-                c.state == "partial" and -(c.amount_due - c.amount_paid) or 0,
-                c.due_date or fields.Date.today(),
-            )
+        # Répartition prioritaire (retard d'abord) calculée par le moteur commun
+        plan, _leftover = self.env["cotisation.allocation.engine"].plan(
+            self.custom_amount, "auto", cotisation_ids=self.cotisation_ids.ids
         )
+        return list(self._post_payment_plan(plan))
 
-        for cotisation in cotisations_sorted:
-            if remaining_amount <= 0:
-                break
-
-            remaining = cotisation.amount_due - cotisation.amount_paid
-            if remaining > 0:
-                payment_amount = min(remaining, remaining_amount)
-                payment = self._create_payment_record(cotisation, payment_amount)
-                payments_created.append(payment)
-                remaining_amount -= payment_amount
-                if hasattr(cotisation, '_update_payment_status'):
-                    cotisation._update_payment_status()
-
-        return payments_created
+    def _post_payment_plan(self, plan, idempotency_key=None):
+        """Enregistre le plan en un lot; le récapitulatif est publié par l'assistant"""
+        if not self.payment_reference:
+            cotisations = self.env["member.cotisation"].browse(
+                [line["cotisation_id"] for line in plan]
+            )
+            plan = [
+                dict(line, values={"reference": f"PAY-{cotisation.display_name}"})
+                for cotisation, line in zip(cotisations, plan)
+            ]
+        intake = self.env["cotisation.payment.intake"].submit(
+            idempotency_key or self.idempotency_key,
+            plan,
+            {
+                "payment_date": self.payment_date,
+                "payment_method": self.payment_method,
+                "reference": self.payment_reference,
+                "notes": self.notes,
+                "currency_id": self.currency_id.id,
+            },
+            source="quick.payment.wizard",
+            post_summary=False,
+        )
+        return intake.payment_ids
 
     def _create_payment_record(self, cotisation, amount):
         """Crée un enregistrement de paiement"""
-        payment_vals = {
-            "cotisation_id": cotisation.id,
-            "member_id": self.member_id.id,
-            "amount": amount,
-            "payment_date": self.payment_date,
-            "payment_method": self.payment_method,
-            "reference": self.payment_reference or f"PAY-{cotisation.display_name}",
-            "notes": self.notes,
-            "currency_id": self.currency_id.id,
-        }
-
-        # Créer l'enregistrement de paiement
-        payment = self.env["cotisation.payment"].create(payment_vals)
-
-        # Mettre à jour la cotisation
-        new_paid_amount = cotisation.amount_paid + amount
-        cotisation.write(
-            {
-                "amount_paid": new_paid_amount,
-                "payment_date": (
-                    self.payment_date
-                    if new_paid_amount >= cotisation.amount_due
-                    else cotisation.payment_date
-                ),
-            }
+        return self._post_payment_plan(
+            [{"cotisation_id": cotisation.id, "amount": amount}],
+            idempotency_key=f"{self.idempotency_key}:{cotisation.id}",
         )
 
-        return payment
-
     def _create_payment_message(self, payments):
         """Crée un message de suivi pour le paiement"""
         if not payments:
@@ -907,6 +823,35 @@ class QuickPaymentWizard(models.TransientModel):
         }
 
 
+class QuickPaymentImpactLine(models.TransientModel):
+    """Ligne d'aperçu de l'impact d'une échéance sur les cotisations"""
+
+    _name = "quick.payment.impact.line"
+    _description = "Ligne aperçu impact paiement rapide"
+
+    wizard_id = fields.Many2one(
+        "quick.payment.wizard", required=True, ondelete="cascade"
+    )
+
+    installment_id = fields.Many2one(
+        "member.payment.installment", string="Échéance", readonly=True
+    )
+
+    payment_amount = fields.Monetary(
+        string="Montant", currency_field="currency_id", readonly=True
+    )
+
+    allocated_amount = fields.Monetary(
+        string="Réparti sur cotisations", currency_field="currency_id", readonly=True
+    )
+
+    cotisation_count = fields.Integer(string="Cotisations impactées", readonly=True)
+
+    currency_id = fields.Many2one(
+        "res.currency", related="wizard_id.currency_id", readonly=True
+    )
+
+
 class InstallmentAllocationWizard(models.TransientModel):
     """Assistant pour configurer la répartition des échéances sur cotisations"""
 
@@ -1093,12 +1038,16 @@ class ManualAllocationWizard(models.TransientModel):
         if self.total_allocated > self.available_amount:
             raise UserError("Le montant total réparti dépasse le montant disponible.")
 
-        # Créer les paiements selon la répartition manuelle
-        for line in self.allocation_line_ids.filtered(lambda l: l.amount > 0):
-            if hasattr(self.installment_id, '_create_cotisation_payment'):
-                self.installment_id._create_cotisation_payment(
-                    line.cotisation_id, line.amount
-                )
+        # Créer les paiements selon la répartition manuelle, en un seul lot
+        self.env["cotisation.payment.posting"].post_plan(
+            [
+                {"cotisation_id": line.cotisation_id.id, "amount": line.amount}
+                for line in self.allocation_line_ids
+                if line.amount > 0
+            ],
+            self.installment_id._get_payment_values(),
+            post_summary=False,
+        )
 
         # Mettre à jour les détails de répartition
         details = [
@@ -1165,13 +1114,28 @@ class ManualAllocationLine(models.TransientModel):
 
 
 class CotisationPayment(models.Model):
-    """Modèle pour enregistrer les paiements de cotisations"""
+    """Registre des paiements de cotisations.
+
+    Le registre est la source de vérité des montants payés: les paiements
+    confirmés ne sont jamais modifiés ni supprimés, ils sont annulés. Le
+    solde amount_paid des cotisations est maintenu par incréments
+    atomiques et vérifié par la tâche de réconciliation.
+    """
 
     _name = "cotisation.payment"
     _inherit = ["mail.thread", "mail.activity.mixin"]
     _description = "Paiement de cotisation"
     _order = "payment_date desc, id desc"
 
+    # Champs figés une fois le paiement confirmé
+    LEDGER_LOCKED_FIELDS = frozenset(["cotisation_id", "member_id", "amount"])
+
+    # Méthodes des assistants sans équivalent direct dans le registre
+    WIZARD_METHOD_MAPPING = {
+        "mobile_money": "mobile",
+        "online": "other",
+    }
+
     name = fields.Char(
         string="Référence",
         required=True,
@@ -1314,53 +1278,128 @@ class CotisationPayment(models.Model):
             "context": self.env.context,
         }
 
+    @api.model_create_multi
+    def create(self, vals_list):
+        """Override create pour générer les références par bloc"""
+        missing = [
+            vals for vals in vals_list
+            if not vals.get("name") or vals["name"] == "PAY-NEW"
+        ]
+        if missing:
+            for vals, name in zip(missing, self._reserve_sequence_names(len(missing))):
+                vals["name"] = name
+        payments = super().create(vals_list)
+
+        # Le registre fait foi: les paiements confirmés alimentent les soldes
+        if not self.env.context.get("ledger_skip_balance"):
+            payments.filtered(lambda p: p.state == "confirmed")._apply_to_balances()
+        return payments
+
+    def write(self, vals):
+        """Registre en ajout seul: un paiement confirmé n'est plus modifiable.
+
+        Seul le changement d'état est permis; il ajoute ou retire le
+        montant du solde de la cotisation par incrément atomique. Seule
+        exception: la fusion des doublons de cotisations transfère leurs
+        paiements à la cotisation conservée et le consigne sur chacun.
+        """
+        locked_fields = self.LEDGER_LOCKED_FIELDS.intersection(vals)
+        if locked_fields and self.filtered(lambda p: p.state == "confirmed"):
+            raise UserError(
+                "Un paiement confirmé ne peut pas être modifié. "
+                "Annulez-le et enregistrez un nouveau paiement."
+            )
+
+        if "state" not in vals:
+            return super().write(vals)
+
+        was_confirmed = self.filtered(lambda p: p.state == "confirmed")
+        result = super().write(vals)
+        now_confirmed = self.filtered(lambda p: p.state == "confirmed")
+
+        (now_confirmed - was_confirmed)._apply_to_balances()
+        (was_confirmed - now_confirmed)._apply_to_balances(sign=-1)
+        return result
+
+    def _apply_to_balances(self, sign=1):
+        """Répercute les paiements sur les soldes des cotisations, en une requête"""
+        if not self:
+            return
+        deltas = {}
+        payment_dates = {}
+        for payment in self:
+            cotisation_id = payment.cotisation_id.id
+            deltas[cotisation_id] = deltas.get(cotisation_id, 0.0) + sign * payment.amount
+            payment_dates[cotisation_id] = max(
+                payment_dates.get(cotisation_id, payment.payment_date), payment.payment_date
+            )
+        self.env["member.cotisation"]._increment_amount_paid(deltas, payment_dates)
+
+    @api.model
+    def _map_payment_method(self, method):
+        """Méthode de paiement d'un assistant traduite pour le registre"""
+        return self.WIZARD_METHOD_MAPPING.get(method, method)
+
     @api.model
-    def create(self, vals):
-        """Override create pour générer la référence automatiquement"""
-        if not vals.get("name") or vals["name"] == "PAY-NEW":
-            vals["name"] = (
-                self.env["ir.sequence"].next_by_code("cotisation.payment") or "PAY-NEW"
+    def _reserve_sequence_names(self, count):
+        """Réserve un bloc de références en un seul appel à la séquence.
+
+        Séquence standard: un nextval par numéro dans une seule requête.
+        Séquence sans trou: la ligne ir_sequence est incrémentée une fois
+        du bloc entier.
+        """
+        sequence = self.env["ir.sequence"].sudo().search(
+            [
+                ("code", "=", "cotisation.payment"),
+                ("company_id", "in", [self.env.company.id, False]),
+            ],
+            order="company_id",
+            limit=1,
+        )
+        if not sequence:
+            return ["PAY-NEW"] * count
+        if sequence.use_date_range or count == 1:
+            return [sequence._next() for _i in range(count)]
+
+        if sequence.implementation == "standard":
+            self.env.cr.execute(
+                "SELECT nextval(%s) FROM generate_series(1, %s)",
+                (f"ir_sequence_{sequence.id:03d}", count),
             )
-        return super().create(vals)
+            numbers = [row[0] for row in self.env.cr.fetchall()]
+        else:
+            self.env.cr.execute(
+                """
+                UPDATE ir_sequence
+                SET number_next = number_next + number_increment * %s
+                WHERE id = %s
+                RETURNING number_next - number_increment * %s, number_increment
+                """,
+                (count, sequence.id, count),
+            )
+            first, increment = self.env.cr.fetchone()
+            sequence.invalidate_recordset(["number_next"])
+            numbers = [first + increment * i for i in range(count)]
+
+        return [sequence.get_next_char(number) for number in numbers]
 
     def action_confirm(self):
         """Confirme le paiement"""
         self.ensure_one()
         self.state = "confirmed"
 
-        # Mettre à jour la cotisation
-        if self.cotisation_id and hasattr(self.cotisation_id, '_update_payment_status'):
-            self.cotisation_id._update_payment_status()
-
     def action_cancel(self):
-        """Annule le paiement"""
+        """Annule le paiement (le solde de la cotisation est diminué d'autant)"""
         self.ensure_one()
-        if self.state == "confirmed":
-            # Reverser le paiement sur la cotisation
-            new_amount_paid = max(0, self.cotisation_id.amount_paid - self.amount)
-            self.cotisation_id.write({"amount_paid": new_amount_paid})
-            if hasattr(self.cotisation_id, '_update_payment_status'):
-                self.cotisation_id._update_payment_status()
-
         self.state = "cancelled"
 
     def unlink(self):
-        """Override unlink pour mettre à jour les cotisations"""
-        cotisations_to_update = self.mapped("cotisation_id")
-
-        # Reverser les montants avant suppression
-        for payment in self.filtered(lambda p: p.state == "confirmed"):
-            cotisation = payment.cotisation_id
-            new_amount_paid = max(0, cotisation.amount_paid - payment.amount)
-            cotisation.write({"amount_paid": new_amount_paid})
-
-        result = super().unlink()
-
-        # Mettre à jour les statuts des cotisations
-        if hasattr(cotisations_to_update, '_update_payment_status'):
-            cotisations_to_update._update_payment_status()
-
-        return result
+        """Les paiements confirmés font partie du registre et ne se suppriment pas"""
+        if self.filtered(lambda p: p.state == "confirmed"):
+            raise UserError(
+                "Un paiement confirmé ne peut pas être supprimé. Annulez-le à la place."
+            )
+        return super().unlink()
 
 
 class MemberCotisationPaymentUpdate(models.Model):
@@ -1384,31 +1423,157 @@ class MemberCotisationPaymentUpdate(models.Model):
                 cotisation.payment_ids.filtered(lambda p: p.state == "confirmed")
             )
 
+    def _increment_amount_paid(self, deltas, payment_dates=None):
+        """Applique des variations de montant payé par incrément atomique.
+
+        deltas: {cotisation_id: variation}. L'UPDATE relit la valeur
+        courante de chaque ligne: deux caisses qui postent en même temps ne
+        s'écrasent pas. Les champs calculés dépendants sont ensuite
+        recalculés par l'ORM, et le total collecté des compteurs de collecte
+        ajusté de la même variation.
+        """
+        if not deltas:
+            return
+        payment_dates = payment_dates or {}
+        today = fields.Date.today()
+        cotisation_ids = list(deltas)
+
+        self.flush_model(["amount_paid", "amount_due", "payment_date"])
+        self.env.cr.execute(
+            """
+            UPDATE member_cotisation c
+            SET amount_paid = c.amount_paid + v.delta,
+                payment_date = CASE
+                    WHEN v.delta > 0 AND c.amount_paid + v.delta >= c.amount_due
+                        THEN COALESCE(v.payment_date, c.payment_date)
+                    ELSE c.payment_date
+                END,
+                write_uid = %s,
+                write_date = (now() at time zone 'UTC')
+            FROM unnest(%s::int[], %s::numeric[], %s::date[]) AS v(id, delta, payment_date)
+            WHERE c.id = v.id
+            RETURNING c.monthly_cotisation_id, c.activity_id, c.active, v.delta
+            """,
+            (
+                self.env.uid,
+                cotisation_ids,
+                [deltas[cotisation_id] for cotisation_id in cotisation_ids],
+                [payment_dates.get(cotisation_id, today) for cotisation_id in cotisation_ids],
+            ),
+        )
+
+        # Total collecté des compteurs: même variation, sans relire les cotisations.
+        # Les changements d'état suivent au recalcul de state (voir _write).
+        counter_deltas = {}
+        for monthly_id, activity_id, active, delta in self.env.cr.fetchall():
+            if not active:
+                continue
+            for model_name, parent_id in (("monthly.cotisation", monthly_id), ("group.activity", activity_id)):
+                if parent_id:
+                    bucket = counter_deltas.setdefault(model_name, {}).setdefault(parent_id, [0, 0, 0, 0, 0.0])
+                    bucket[4] += float(delta)
+        self._dispatch_counter_deltas(counter_deltas)
+
+        cotisations = self.browse(cotisation_ids)
+        fnames = ["amount_paid", "payment_date", "write_uid", "write_date"]
+        cotisations.invalidate_recordset(fnames)
+        cotisations.modified(fnames)
+
+    def _ledger_balances(self):
+        """Somme des paiements confirmés par cotisation, calculée en base"""
+        self.env["cotisation.payment"].flush_model(["cotisation_id", "amount", "state"])
+        self.env.cr.execute(
+            """
+            SELECT cotisation_id, SUM(amount)
+            FROM cotisation_payment
+            WHERE state = 'confirmed' AND cotisation_id IN %s
+            GROUP BY cotisation_id
+            """,
+            (tuple(self.ids) or (0,),),
+        )
+        return {cotisation_id: float(total) for cotisation_id, total in self.env.cr.fetchall()}
+
     def _update_payment_status(self):
-        """Met à jour le statut de paiement de la cotisation"""
-        for cotisation in self:
-            confirmed_payments = cotisation.payment_ids.filtered(
-                lambda p: p.state == "confirmed"
-            )
-            total_paid = sum(confirmed_payments.mapped("amount"))
+        """Réaligne le montant payé sur le registre, en une requête.
 
-            cotisation.amount_paid = total_paid
+        L'état est un champ calculé stocké: il suit le montant payé.
+        """
+        if not self:
+            return
+        balances = self._ledger_balances()
+        self.flush_recordset(["amount_paid"])
+        deltas = {
+            cotisation.id: balances.get(cotisation.id, 0.0) - cotisation.amount_paid
+            for cotisation in self
+            if cotisation.currency_id.compare_amounts(
+                balances.get(cotisation.id, 0.0), cotisation.amount_paid
+            ) != 0
+        }
+        self._increment_amount_paid(deltas)
 
-            # Déterminer le nouvel état
-            if total_paid <= 0:
-                new_state = (
-                    "overdue"
-                    if cotisation.due_date and cotisation.due_date < fields.Date.today()
-                    else "pending"
-                )
-            elif total_paid >= cotisation.amount_due:
-                new_state = "paid"
-                if not cotisation.payment_date:
-                    cotisation.payment_date = fields.Date.today()
-            else:
-                new_state = "partial"
+    @api.model
+    def _cron_reconcile_payment_ledger(self, batch_size=5000):
+        """Vérifie les soldes des cotisations contre le registre des paiements.
 
-            cotisation.state = new_state
+        Un solde supérieur au registre provient d'un paiement enregistré hors
+        registre: une écriture de régularisation est ajoutée au registre. Un
+        solde inférieur est réaligné sur le registre.
+        """
+        self.env["cotisation.payment"].flush_model(["cotisation_id", "amount", "state"])
+        self.flush_model(["amount_paid"])
+        # Les écarts d'arrondi sont filtrés en base: ils ne consomment pas la limite
+        currency = self.env.company.currency_id
+        self.env.cr.execute(
+            """
+            SELECT c.id, c.member_id, c.amount_paid - COALESCE(l.total, 0)
+            FROM member_cotisation c
+            LEFT JOIN (
+                SELECT cotisation_id, SUM(amount) AS total
+                FROM cotisation_payment
+                WHERE state = 'confirmed'
+                GROUP BY cotisation_id
+            ) l ON l.cotisation_id = c.id
+            WHERE ABS(c.amount_paid - COALESCE(l.total, 0)) >= %s
+            ORDER BY c.id
+            LIMIT %s
+            """,
+            (currency.rounding, batch_size),
+        )
+        rows = self.env.cr.fetchall()
+        if not rows:
+            _logger.info("Réconciliation du registre: aucun écart")
+            return True
+
+        adjustments = []
+        corrections = {}
+        for cotisation_id, member_id, difference in rows:
+            difference = float(difference)
+            if difference > 0:
+                adjustments.append({
+                    "cotisation_id": cotisation_id,
+                    "member_id": member_id,
+                    "amount": difference,
+                    "payment_method": "other",
+                    "reference": "Régularisation",
+                    "notes": "Écriture de régularisation créée par la réconciliation du registre",
+                    "state": "confirmed",
+                })
+            else:
+                corrections[cotisation_id] = difference
+
+        if adjustments:
+            # Le solde est déjà juste: l'écriture ne fait que compléter le registre
+            self.env["cotisation.payment"].with_context(
+                tracking_disable=True, mail_create_nolog=True, ledger_skip_balance=True
+            ).create(adjustments)
+        if corrections:
+            self._increment_amount_paid(corrections)
+
+        _logger.warning(
+            f"Réconciliation du registre: {len(adjustments)} régularisations ajoutées, "
+            f"{len(corrections)} soldes réalignés"
+        )
+        return True
 
     def action_view_payments(self):
         """Action pour voir les paiements de la cotisation"""